@@ -0,0 +1,98 @@
+"""Adaptive retrieval depth: retrieve and rerank only as much as a query needs.
+
+A fixed top-k reranks the same number of candidates for every question, even
+when the best dense hit is far ahead of the rest. `AdaptiveDepth` looks at
+the dense scores of a small first retrieval and decides per query:
+
+- ``skip_rerank``: the top hit leads the runner-up by a wide margin, so the
+  dense order is trusted and the reranker is not called
+- ``expand``: the scores are flat (no hit stands out), so more candidates are
+  retrieved before reranking
+- ``initial``: otherwise the small first retrieval is kept
+
+Before reranking, candidates far below the best one of their list are
+trimmed. All thresholds are relative to the best score, so they apply to
+dense similarities and BM25 scores alike (for Chroma's cosine scores,
+``exp(cos - 1)``, they are close to differences in cosine similarity).
+"""
+
+from typing import Callable, List, Sequence, TypeVar
+
+from llama_index.core.schema import NodeWithScore
+
+SKIP_RERANK = "skip_rerank"
+EXPAND = "expand"
+INITIAL = "initial"
+
+T = TypeVar("T")
+
+
+class AdaptiveDepth:
+    """Per-query retrieval depth and rerank payload from the score distribution.
+
+    Args:
+        initial_top_k: Dense candidates of the first retrieval
+        max_top_k: Dense candidates after expanding
+        confident_margin: Relative lead of the top hit over the runner-up at
+            which the reranker is skipped
+        flat_spread: Relative spread of the first retrieval's scores below
+            which they count as flat and the retrieval expands
+        trim_gap: Candidates scoring more than this fraction below the best
+            one of their list are not reranked
+        min_candidates: Candidates kept per list regardless of `trim_gap`
+            (at least the reranker's top_n)
+    """
+
+    def __init__(
+        self,
+        initial_top_k: int = 3,
+        max_top_k: int = 10,
+        confident_margin: float = 0.15,
+        flat_spread: float = 0.05,
+        trim_gap: float = 0.3,
+        min_candidates: int = 3,
+    ):
+        if not 0 < initial_top_k <= max_top_k:
+            raise ValueError(
+                f"❌ 需要 0 < initial_top_k <= max_top_k: {initial_top_k}, {max_top_k}"
+            )
+        self.initial_top_k = initial_top_k
+        self.max_top_k = max_top_k
+        self.confident_margin = confident_margin
+        self.flat_spread = flat_spread
+        self.trim_gap = trim_gap
+        self.min_candidates = min_candidates
+
+    @staticmethod
+    def _below_best(best: float, score: float) -> float:
+        """How far `score` is below `best`, as a fraction of `best`."""
+        return (best - score) / best if best > 0 else 0.0
+
+    def decide(self, dense: Sequence[NodeWithScore]) -> str:
+        """Decision for a first retrieval of `initial_top_k` dense hits."""
+        scores = sorted((n.score or 0.0 for n in dense), reverse=True)
+        if len(scores) >= 2 and (
+            self._below_best(scores[0], scores[1]) >= self.confident_margin
+        ):
+            return SKIP_RERANK
+        if (
+            len(scores) >= self.initial_top_k
+            and self.initial_top_k < self.max_top_k
+            and self._below_best(scores[0], scores[-1]) < self.flat_spread
+        ):
+            return EXPAND
+        return INITIAL
+
+    def trim(
+        self, ranked: Sequence[T], score: Callable[[T], float] = lambda n: n.score
+    ) -> List[T]:
+        """Drop the tail of a best-first list that scores far below its head."""
+        if not ranked:
+            return []
+        best = score(ranked[0]) or 0.0
+        kept = list(ranked[: self.min_candidates])
+        for item in ranked[self.min_candidates :]:
+            if self._below_best(best, score(item) or 0.0) > self.trim_gap:
+                break
+            kept.append(item)
+        return kept
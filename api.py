@@ -1,13 +1,24 @@
-"""REST API for RAG service using FastAPI."""
+"""REST API for RAG service using FastAPI.
 
-from typing import Dict, List, Optional
+The port opens right away; `QueryService` (llama_index, chromadb and the
+Chroma indexes) is imported and warmed up in the background. `/livez` answers
+as soon as the process serves requests, `/readyz` once queries can run.
+"""
 
-import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 import config
-from query_service import QueryService
+from collection_pool import CollectionNotFoundError, InvalidCollectionNameError
+from metadata_filters import InvalidFilterError
+from query_options import InvalidQueryOptionError, QueryOptions
+from metrics import HTTP_SECONDS, REGISTRY, start_snapshot_writer
 
 app = FastAPI(
     title="RAG Query API",
@@ -15,8 +26,11 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# 全局查询服务实例
+# 全局查询服务实例（后台预热完成前为 None）
 query_service = None
+# 启动状态：starting → ready / failed
+startup_state = {"status": "starting", "error": None, "ready_after_s": None}
+_warm_up_task: Optional[asyncio.Task] = None
 
 
 class QueryRequest(BaseModel):
@@ -24,7 +38,26 @@ class QueryRequest(BaseModel):
 
     question: str
     return_sources: bool = True
-    top_k: Optional[int] = None
+    # 检索的候选数量，默认使用配置的检索深度
+    top_k: Optional[int] = Field(default=None, ge=1, le=config.MAX_QUERY_TOP_K)
+    # 元数据过滤，在向量检索内部生效，例如 {"doc_type": "pdf", "mtime": {"$gte": 1700000000}}
+    filters: Optional[Dict[str, Any]] = None
+    rerank: bool = True  # 是否 rerank（rerank 已配置时）
+    top_n: Optional[int] = Field(default=None, ge=1, le=config.MAX_QUERY_TOP_K)
+    response_mode: Optional[str] = None  # 默认 compact，可用值见 query_options.RESPONSE_MODES
+    token_budget: Optional[int] = Field(default=None, ge=1)  # 上下文压缩的 token 预算
+    collection: Optional[str] = None  # 集合（租户）ID，默认 config.COLLECTION_NAME
+    debug: bool = False  # 在响应中返回各阶段耗时、token 数和缓存命中
+
+
+class BatchQueryRequest(BaseModel):
+    """Batch query request model."""
+
+    questions: List[str]
+    return_sources: bool = True
+    concurrency: Optional[int] = None  # LLM 并发数，默认 config.QUERY_BATCH_CONCURRENCY
+    collection: Optional[str] = None
+    debug: bool = False
 
 
 class Source(BaseModel):
@@ -42,36 +75,261 @@ class QueryResponse(BaseModel):
     question: str
     answer: str
     sources: List[Source]
+    debug: Optional[Dict] = None  # 仅在请求 debug=true 时返回
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize query service on startup."""
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    """Observe request handling time, labelled by route template."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        # 用路由模板而不是原始路径，避免标签数量无限增长
+        path=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    return response
+
+
+def _build_service() -> tuple:
+    """Import and warm up the query service (runs in a worker thread)."""
+    # llama_index / chromadb 导入需要数秒，放到后台，端口可以先开始服务
+    from query_service import QueryService
+
+    service = QueryService(warm_up=False)
+    return service, service.warm_up()
+
+
+async def _warm_up(started: float) -> None:
     global query_service
     try:
-        query_service = QueryService()
-        print("✅ API 服务启动成功")
+        service, timings = await asyncio.to_thread(_build_service)
     except Exception as e:
+        startup_state.update(status="failed", error=str(e))
         print(f"❌ 服务启动失败: {e}")
-        raise
+        return
+    query_service = service
+    startup_state.update(
+        status="ready",
+        ready_after_s=round(time.monotonic() - started, 3),
+        warm_up=timings,
+    )
+    print(f"✅ API 服务就绪 (启动耗时 {startup_state['ready_after_s']}s)")
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the query service: in the background, or blocking if configured."""
+    global _warm_up_task
+    started = time.monotonic()
+    if config.METRICS_DIR:
+        # 多 worker 时 /metrics 汇总各 worker 写入的快照
+        start_snapshot_writer(config.METRICS_DIR, config.METRICS_SNAPSHOT_INTERVAL)
+    _warm_up_task = asyncio.create_task(_warm_up(started))
+    if not config.BACKGROUND_STARTUP:
+        await wait_until_ready()
+
 
+async def wait_until_ready() -> None:
+    """Wait for the background start-up to finish.
 
-@app.post("/query", response_model=QueryResponse)
+    Raises:
+        RuntimeError: If the query service failed to start.
+    """
+    if _warm_up_task is not None:
+        await asyncio.shield(_warm_up_task)
+    if query_service is None:
+        raise RuntimeError(f"❌ 服务启动失败: {startup_state['error']}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled HTTP clients on shutdown."""
+    if query_service is not None:
+        await query_service.aclose()
+
+
+def _options(request: QueryRequest) -> dict:
+    """The request's pipeline options, validated (400 if invalid)."""
+    options = {
+        "top_k": request.top_k,
+        "filters": request.filters,
+        "rerank": request.rerank,
+        "top_n": request.top_n,
+        "response_mode": request.response_mode,
+        "token_budget": request.token_budget,
+    }
+    try:
+        QueryOptions(**options)
+    except (InvalidQueryOptionError, InvalidFilterError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return options
+
+
+def _service():
+    """The query service, or 503 while it is starting (or failed to start)."""
+    if query_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"⏳ 服务未就绪: {startup_state['status']}",
+            headers={"Retry-After": "1"},
+        )
+    return query_service
+
+
+@app.post(
+    "/query", response_model=QueryResponse, response_model_exclude_none=True
+)
 async def query(request: QueryRequest):
     """Query endpoint."""
+    service = _service()
+    options = _options(request)
     try:
-        result = query_service.query(
-            question=request.question, return_sources=request.return_sources
+        result = await service.aquery(
+            question=request.question,
+            return_sources=request.return_sources,
+            collection=request.collection,
+            debug=request.debug,
+            **options,
         )
         return result
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (InvalidCollectionNameError, InvalidFilterError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """Streaming query endpoint (Server-Sent Events).
+
+    Sends a `sources` event first, then one `token` event per answer token
+    and a final `done` event; failures are reported as an `error` event.
+    """
+    service = _service()
+    # 在开始流式响应前检查选项，错误仍以状态码返回
+    options = _options(request)
+
+    async def events():
+        try:
+            async for event in service.astream_query(
+                question=request.question,
+                return_sources=request.return_sources,
+                collection=request.collection,
+                debug=request.debug,
+                **options,
+            ):
+                name = event.pop("event")
+                yield _sse(name, event)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，保证 token 立即到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """Batch query endpoint (NDJSON).
+
+    Streams one JSON line per question in completion order; each line has
+    the question's `index` plus `answer`/`sources`, or `error` if it failed.
+    """
+    service = _service()
+    if len(request.questions) > config.QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"❌ 单次最多 {config.QUERY_BATCH_MAX_QUESTIONS} 个问题",
+        )
+    concurrency = request.concurrency
+    if concurrency is not None:
+        concurrency = max(1, min(concurrency, config.QUERY_BATCH_MAX_CONCURRENCY))
+
+    # 在开始流式响应前检查集合，错误仍以状态码返回
+    try:
+        await service.aengine(request.collection)
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except InvalidCollectionNameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        try:
+            async for result in service.query_many(
+                request.questions,
+                concurrency=concurrency,
+                return_sources=request.return_sources,
+                collection=request.collection,
+                debug=request.debug,
+            ):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/collections/stats")
+async def collection_stats():
+    """Hit/miss/eviction counters of the per-collection engine pool."""
+    return _service().pool_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, tokens, cache hits."""
+    return PlainTextResponse(
+        REGISTRY.render(config.METRICS_DIR),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/livez")
+async def livez():
+    """Liveness: the process is up and its event loop answers."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once queries can be served, 503 before or on failure.
+
+    Reports the component state; an unreachable reranker leaves the service
+    ready (queries fall back to retrieval order).
+    """
+    body = {key: value for key, value in startup_state.items() if value is not None}
+    if query_service is None:
+        return JSONResponse(body, status_code=503)
+    body["components"] = await asyncio.to_thread(query_service.readiness)
+    return body
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy", "service": "rag-query-api"}
+    """Health check endpoint (200 only when ready)."""
+    body = {"status": "healthy", "service": "rag-query-api"}
+    if query_service is None:
+        body["status"] = startup_state["status"]
+        return JSONResponse(body, status_code=503)
+    return body
 
 
 @app.get("/")
@@ -82,16 +340,114 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "query": "/query (POST)",
+            "query_stream": "/query/stream (POST, SSE)",
+            "query_batch": "/query/batch (POST, NDJSON)",
+            "collection_stats": "/collections/stats (GET)",
+            "metrics": "/metrics (GET, Prometheus)",
+            "livez": "/livez (GET)",
+            "readyz": "/readyz (GET)",
             "health": "/health (GET)",
             "docs": "/docs (GET)",
         },
     }
 
 
-if __name__ == "__main__":
-    uvicorn.run(
-        "api:app",
-        host=config.API_HOST,
-        port=config.API_PORT,
-        reload=True,
+def serve(
+    app_path: str = "api:app",
+    workers: int = config.API_WORKERS,
+    reload: bool = config.API_RELOAD,
+    host: str = config.API_HOST,
+    port: int = config.API_PORT,
+    **uvicorn_options,
+) -> None:
+    """Run the API with uvicorn, in several worker processes if asked.
+
+    Worker processes import `app_path` themselves. With the Chroma backend,
+    unless CHROMA_SERVER_URL already names one, a local Chroma server is
+    started over CHROMA_PERSIST_DIR for the duration, so the workers share one
+    copy of the vector index instead of each opening the database (the mmap
+    backend needs no server), and a directory created for this run (under
+    METRICS_DIR if set) collects the workers' metrics, so snapshots left by
+    earlier runs are not counted.
+
+    Args:
+        app_path: "module:attribute" of the ASGI app (or factory)
+        workers: Number of worker processes
+        reload: Restart on code changes (development, single worker only)
+        host: Interface to listen on
+        port: Port to listen on
+        **uvicorn_options: Passed on to `uvicorn.run`
+    """
+    import os
+    import shutil
+    import tempfile
+
+    import uvicorn
+
+    from chroma_backend import ChromaServer
+
+    if reload and workers > 1:
+        raise ValueError("❌ reload 只支持单个 worker")
+    metrics_dir = None
+    if workers > 1 or config.METRICS_DIR:
+        # 每次运行用自己的快照子目录，以前运行留下的快照不会计入 /metrics
+        if config.METRICS_DIR:
+            os.makedirs(config.METRICS_DIR, exist_ok=True)
+        metrics_dir = tempfile.mkdtemp(prefix="rag-metrics-", dir=config.METRICS_DIR)
+        os.environ["METRICS_DIR"] = config.METRICS_DIR = metrics_dir
+    server = None
+    try:
+        if workers == 1:
+            uvicorn.run(
+                app_path, host=host, port=port, reload=reload, **uvicorn_options
+            )
+            return
+
+        # mmap 后端由各 worker 直接映射导出文件，不需要 Chroma 服务器
+        if config.VECTOR_DB_TYPE == "chroma" and not config.CHROMA_SERVER_URL:
+            server = ChromaServer(config.CHROMA_PERSIST_DIR)
+            server.start()
+            # worker 进程重新导入 config，通过环境变量拿到服务器地址
+            os.environ["CHROMA_SERVER_URL"] = config.CHROMA_SERVER_URL = server.url
+        if config.VECTOR_DB_TYPE == "chroma":
+            print(
+                f"🚀 启动 {workers} 个 worker，共享 Chroma: {config.CHROMA_SERVER_URL}"
+            )
+        else:
+            print(f"🚀 启动 {workers} 个 worker，向量库: {config.VECTOR_DB_TYPE}")
+        uvicorn.run(
+            app_path, host=host, port=port, workers=workers, **uvicorn_options
+        )
+    finally:
+        if server is not None:
+            server.stop()
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def main():
+    """Parse the command line and serve the API."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RAG Query API")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.API_WORKERS,
+        help="Worker processes sharing one Chroma server",
     )
+    parser.add_argument(
+        "--reload",
+        action="store_true",
+        default=config.API_RELOAD,
+        help="Restart on code changes (development, single worker)",
+    )
+    args = parser.parse_args()
+    if args.reload and args.workers > 1:
+        parser.error("--reload 只支持单个 worker")
+    serve(workers=args.workers, reload=args.reload, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
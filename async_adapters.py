@@ -0,0 +1,330 @@
+"""Async adapters for the ZhipuAI LLM and embeddings and the Chroma vector store.
+
+Upstream ``ZhipuAI.achat`` polls an async-completion task with the blocking
+SDK client, ``ZhipuAI.astream_chat`` opens its stream with it, and
+``ChromaVectorStore.aquery`` simply calls ``query``; all of them stall the
+event loop. ``ZhipuAIEmbedding`` sends one request per text even for batches.
+These subclasses only replace the affected entry points.
+"""
+
+import asyncio
+import json
+import math
+from typing import Any, List, Optional, Sequence
+
+import httpx
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores.types import (
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from llama_index.embeddings.zhipuai import ZhipuAIEmbedding
+from llama_index.llms.zhipuai import ZhipuAI
+from llama_index.vector_stores.chroma import ChromaVectorStore
+
+from micro_batcher import MicroBatcher
+
+
+class AsyncZhipuAI(ZhipuAI):
+    """ZhipuAI LLM whose async chat and streaming use a pooled ``httpx.AsyncClient``.
+
+    Args:
+        base_url: ZhipuAI API base URL (e.g. "https://open.bigmodel.cn/api/paas/v4")
+        max_connections: Maximum number of pooled connections
+    """
+
+    base_url: str = Field(description="The ZhipuAI API base URL.")
+    max_connections: int = Field(
+        default=100, description="Maximum number of pooled async connections."
+    )
+
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 100,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            model=model,
+            api_key=api_key,
+            base_url=base_url.rstrip("/"),
+            max_connections=max_connections,
+            **kwargs,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AsyncZhipuAI"
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Lazily create the pooled client on the running event loop."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
+
+    def _build_payload(
+        self, messages: Sequence[ChatMessage], stream: bool, **kwargs: Any
+    ) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": self._convert_to_llm_messages(messages),
+            "stream": stream,
+            **self.model_kwargs,
+        }
+        for key in ("tools", "tool_choice", "stop"):
+            if kwargs.get(key) is not None:
+                payload[key] = kwargs[key]
+        return payload
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        payload = self._build_payload(messages, stream=False, **kwargs)
+
+        response = await self._get_async_client().post(
+            "/chat/completions",
+            json=payload,
+            headers=self._client.auth_headers,
+        )
+        response.raise_for_status()
+        raw_response = response.json()
+
+        message = raw_response["choices"][0]["message"]
+        return ChatResponse(
+            message=ChatMessage(
+                content=message.get("content"),
+                role=message.get("role", "assistant"),
+                additional_kwargs={"tool_calls": message.get("tool_calls") or []},
+            ),
+            raw=raw_response,
+        )
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        payload = self._build_payload(messages, stream=True, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            response_txt = ""
+            async with self._get_async_client().stream(
+                "POST",
+                "/chat/completions",
+                json=payload,
+                headers=self._client.auth_headers,
+            ) as response:
+                response.raise_for_status()
+                # SSE：每个 "data: {...}" 行是一个增量，"data: [DONE]" 表示结束
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:") :].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    delta = chunk["choices"][0].get("delta") or {}
+                    if delta.get("content") is None:
+                        continue
+                    response_txt += delta["content"]
+                    yield ChatResponse(
+                        message=ChatMessage(
+                            content=response_txt,
+                            role=delta.get("role") or "assistant",
+                            additional_kwargs={
+                                "tool_calls": delta.get("tool_calls") or []
+                            },
+                        ),
+                        delta=delta["content"],
+                        raw=chunk,
+                    )
+
+        return gen()
+
+    async def aclose(self) -> None:
+        """Close the pooled async client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class AsyncZhipuAIEmbedding(ZhipuAIEmbedding):
+    """ZhipuAI embedding that sends a whole batch in one request.
+
+    The async path uses a pooled ``httpx.AsyncClient``; the sync path passes
+    the list of texts to the SDK in one call. After `enable_micro_batching`,
+    async query embeddings from concurrent requests are coalesced into
+    batched calls.
+
+    Args:
+        base_url: ZhipuAI API base URL (e.g. "https://open.bigmodel.cn/api/paas/v4")
+        max_connections: Maximum number of pooled connections
+    """
+
+    base_url: str = Field(description="The ZhipuAI API base URL.")
+    max_connections: int = Field(
+        default=100, description="Maximum number of pooled async connections."
+    )
+
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+    _batcher: Optional[MicroBatcher] = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 100,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            model=model,
+            api_key=api_key,
+            base_url=base_url.rstrip("/"),
+            max_connections=max_connections,
+            **kwargs,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AsyncZhipuAIEmbedding"
+
+    @property
+    def batcher(self) -> Optional[MicroBatcher]:
+        return self._batcher
+
+    def enable_micro_batching(self, max_batch_size: int, max_wait: float) -> None:
+        """Coalesce concurrent async query embeddings into batched calls.
+
+        Args:
+            max_batch_size: Maximum texts per embedding request
+            max_wait: Seconds a query waits for others to join its batch
+        """
+        self._batcher = MicroBatcher(
+            self._aget_text_embeddings,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            name="Embedding micro-batch",
+        )
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Lazily create the pooled client on the running event loop."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = self._client.embeddings.create(
+            model=self.model,
+            input=texts,
+            dimensions=self.dimensions,
+            timeout=self.timeout,
+        )
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        if self._batcher is not None:
+            return await self._batcher.submit(query)
+        return (await self._aget_text_embeddings([query]))[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = await self._get_async_client().post(
+            "/embeddings",
+            json={"model": self.model, "input": texts, "dimensions": self.dimensions},
+            headers=self._client.auth_headers,
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    async def aclose(self) -> None:
+        """Close the pooled async client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class AsyncChromaVectorStore(ChromaVectorStore):
+    """Chroma vector store that runs async queries in a worker thread.
+
+    `query_batch` answers many query embeddings with one Chroma call.
+    """
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def warm_up(self) -> None:
+        """Load the HNSW index (Chroma loads it on a collection's first query)."""
+        sample = self._collection.peek(limit=1)
+        if len(sample["ids"]):
+            self._collection.query(
+                query_embeddings=[sample["embeddings"][0]], n_results=1
+            )
+
+    def query_batch(
+        self, query_embeddings: List[List[float]], top_k: int
+    ) -> List[List[NodeWithScore]]:
+        """Top-k nodes for each query embedding, from a single Chroma query."""
+        if not query_embeddings:
+            return []
+        results = self._collection.query(
+            query_embeddings=query_embeddings, n_results=top_k
+        )
+        batch = []
+        for ids, texts, metadatas, distances in zip(
+            results["ids"],
+            results["documents"],
+            results["metadatas"],
+            results["distances"],
+        ):
+            batch.append(
+                [
+                    # 与 ChromaVectorStore.query 相同的相似度换算
+                    NodeWithScore(
+                        node=metadata_dict_to_node(metadata, text=text),
+                        score=math.exp(-distance),
+                    )
+                    for text, metadata, distance in zip(texts, metadatas, distances)
+                ]
+            )
+        return batch
+
+    async def aquery_batch(
+        self, query_embeddings: List[List[float]], top_k: int
+    ) -> List[List[NodeWithScore]]:
+        return await asyncio.to_thread(self.query_batch, query_embeddings, top_k)
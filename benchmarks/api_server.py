@@ -0,0 +1,234 @@
+"""Run `api.py` with uvicorn in a subprocess, configured against the stubs.
+
+Load generated by a benchmark then goes over real HTTP to a separate process,
+whose memory can be measured on its own.
+
+Run standalone:
+    python -m benchmarks.api_server --port 18000 --workdir /tmp/bench \\
+        --zhipu-url http://127.0.0.1:18001 --tei-url http://127.0.0.1:18002 \\
+        --workers 4
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks.stub_servers import _free_port, configure_for_stubs
+
+
+def apply_overrides(overrides: Dict[str, object]) -> None:
+    """Set `config` attributes, e.g. {"USE_HYBRID_SEARCH": False}."""
+    import config
+
+    for key, value in overrides.items():
+        if not hasattr(config, key):
+            raise ValueError(f"❌ 未知的配置项: {key}")
+        setattr(config, key, value)
+
+
+def parse_overrides(items: List[str]) -> Dict[str, object]:
+    """Parse KEY=VALUE strings; values are Python literals (or plain strings)."""
+    overrides = {}
+    for item in items:
+        key, _, raw = item.partition("=")
+        try:
+            overrides[key] = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            overrides[key] = raw
+    return overrides
+
+
+def _descendants(pid: int) -> List[int]:
+    """Child processes of `pid`, recursively (Linux only)."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+    return children + [grandchild for c in children for grandchild in _descendants(c)]
+
+
+def _read_kib(path: str, fields: List[str]) -> Dict[str, int]:
+    with open(path) as f:
+        values = dict(line.split(":", 1) for line in f if ":" in line)
+    return {field: int(values[field].split()[0]) for field in fields}
+
+
+def read_memory(pid: int) -> Optional[dict]:
+    """Memory of a process and its children in MiB (Linux only, else None).
+
+    RSS counts pages shared between the processes (the page cache of the
+    index files, copy-on-write pages) once per process; PSS splits them
+    among the sharers, so `pss_mib` is the real total.
+    """
+    totals = {"VmRSS": 0, "VmHWM": 0, "Pss": 0}
+    processes = 0
+    for process in [pid] + _descendants(pid):
+        try:
+            status = _read_kib(f"/proc/{process}/status", ["VmRSS", "VmHWM"])
+            rollup = _read_kib(f"/proc/{process}/smaps_rollup", ["Pss"])
+        except (OSError, KeyError):
+            continue
+        for field, kib in {**status, **rollup}.items():
+            totals[field] += kib
+        processes += 1
+    if not processes:
+        return None
+    return {
+        "rss_mib": round(totals["VmRSS"] / 1024, 1),
+        "pss_mib": round(totals["Pss"] / 1024, 1),
+        "peak_rss_mib": round(totals["VmHWM"] / 1024, 1),
+        "processes": processes,
+    }
+
+
+class ApiServer:
+    """Serve `api:app` in a subprocess for the duration of a benchmark.
+
+    Args:
+        workdir: Scratch directory holding the index built for the stubs
+        zhipu_url: Stub ZhipuAI base URL
+        tei_url: Stub TEI base URL
+        overrides: `config` attributes to set in the server process
+        workers: Worker processes (more than one shares a Chroma server)
+    """
+
+    def __init__(
+        self,
+        workdir: str,
+        zhipu_url: str,
+        tei_url: str,
+        overrides: Optional[Dict[str, object]] = None,
+        workers: int = 1,
+    ):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.args = [
+            "--port", str(self.port),
+            "--workdir", workdir,
+            "--zhipu-url", zhipu_url,
+            "--tei-url", tei_url,
+            "--workers", str(workers),
+        ]  # fmt: skip
+        for key, value in (overrides or {}).items():
+            self.args += ["--set", f"{key}={value!r}"]
+        self._process: Optional[subprocess.Popen] = None
+        self.startup: Optional[dict] = None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    def memory(self) -> Optional[dict]:
+        """Memory of the server process and its workers."""
+        return read_memory(self.pid)
+
+    def _wait_for(self, path: str, start: float, deadline: float) -> float:
+        """Poll `path` until it answers 200; returns seconds since `start`."""
+        while True:
+            try:
+                if requests.get(f"{self.url}{path}", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except requests.exceptions.RequestException:
+                pass
+            if time.monotonic() > deadline or self._process.poll() is not None:
+                self.__exit__(None, None, None)
+                raise RuntimeError(f"❌ API 服务启动失败: {self.url}{path}")
+            time.sleep(0.1)
+
+    def __enter__(self) -> "ApiServer":
+        start = time.perf_counter()
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.api_server", *self.args],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        deadline = time.monotonic() + 120
+        # 冷启动：进程启动到端口可用（/livez），再到可以处理查询（/readyz）
+        live_s = self._wait_for("/livez", start, deadline)
+        ready_s = self._wait_for("/readyz", start, deadline)
+        self.startup = {
+            "live_s": round(live_s, 3),
+            "ready_s": round(ready_s, 3),
+            "warm_up": requests.get(f"{self.url}/readyz", timeout=5)
+            .json()
+            .get("warm_up"),
+        }
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=30)
+            self._process = None
+
+
+# worker 进程（spawn 启动）从环境变量读取桩服务配置
+_OPTIONS_ENV = "RAG_BENCH_API_SERVER"
+
+
+def create_app():
+    """App factory run in each worker: configure for the stubs, import `api`."""
+    options = json.loads(os.environ[_OPTIONS_ENV])
+    configure_for_stubs(options["workdir"], options["zhipu_url"], options["tei_url"])
+    apply_overrides(parse_overrides(options["set"]))
+
+    import api
+
+    return api.app
+
+
+def main():
+    """Serve the API against the stub servers until interrupted."""
+    parser = argparse.ArgumentParser(description="Run api.py against stub servers")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--zhipu-url", required=True)
+    parser.add_argument("--tei-url", required=True)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override a config value (repeatable)",
+    )
+    args = parser.parse_args()
+
+    os.environ[_OPTIONS_ENV] = json.dumps(
+        {
+            "workdir": args.workdir,
+            "zhipu_url": args.zhipu_url,
+            "tei_url": args.tei_url,
+            "set": args.set,
+        }
+    )
+    # 主进程同样需要配置：多 worker 时由它在 CHROMA_PERSIST_DIR 上启动 Chroma 服务器
+    configure_for_stubs(args.workdir, args.zhipu_url, args.tei_url)
+    apply_overrides(parse_overrides(args.set))
+
+    import api
+    import config
+
+    config.CHROMA_SERVER_PORT = _free_port()
+    api.serve(
+        "benchmarks.api_server:create_app",
+        workers=args.workers,
+        reload=False,
+        host="127.0.0.1",
+        port=args.port,
+        factory=True,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
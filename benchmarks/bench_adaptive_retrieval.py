@@ -0,0 +1,100 @@
+"""Adaptive retrieval depth benchmark: rerank payload, latency and recall.
+
+Runs the evaluation set of `bench_compression` against the essay in `data/`
+with a fixed retrieval depth and with `USE_ADAPTIVE_RETRIEVAL`, and reports
+per mode the candidates sent to the reranker, the retrieve and rerank stage
+times, the adaptive decisions and the evidence recall (share of questions
+whose answer phrase is in the context handed to the LLM).
+
+Usage:
+    python -m benchmarks.bench_adaptive_retrieval --rerank-latency 0.03
+    python -m benchmarks.bench_adaptive_retrieval --live
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+
+from benchmarks.bench_compression import EVAL_SET, _contains
+from benchmarks.stub_servers import StubServers
+
+
+def _evaluate(service) -> dict:
+    """Run the evaluation set once through `service`."""
+    candidates, retrieve_ms, rerank_ms = [], [], []
+    decisions: dict = {}
+    found = 0
+    for question, phrase in EVAL_SET:
+        result = service.query(question, debug=True)
+        debug = result["debug"]
+        candidates.append(debug["retrieval"]["rerank_candidates"])
+        for decision, count in debug["retrieval"].get("decisions", {}).items():
+            decisions[decision] = decisions.get(decision, 0) + count
+        retrieve_ms.append(debug["timings_ms"]["retrieve"])
+        rerank_ms.append(debug["timings_ms"].get("rerank", 0.0))
+
+        context = " ".join(n.node.get_content() for n in service.retrieve(question))
+        found += _contains(context, phrase)
+
+    return {
+        "questions": len(EVAL_SET),
+        "rerank_candidates_mean": round(statistics.mean(candidates), 2),
+        "retrieve_ms_p50": round(statistics.median(retrieve_ms), 1),
+        "rerank_ms_mean": round(statistics.mean(rerank_ms), 1),
+        "decisions": decisions,
+        "evidence_recall": round(found / len(EVAL_SET), 3),
+    }
+
+
+def _compare() -> dict:
+    import config
+    from query_service import QueryService
+
+    results = {}
+    for mode, enabled in (("fixed", False), ("adaptive", True)):
+        config.USE_ADAPTIVE_RETRIEVAL = enabled
+        results[mode] = _evaluate(QueryService())
+    results["payload_reduction"] = round(
+        1
+        - results["adaptive"]["rerank_candidates_mean"]
+        / results["fixed"]["rerank_candidates_mean"],
+        3,
+    )
+    return results
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Adaptive retrieval benchmark")
+    parser.add_argument("--rerank-latency", type=float, default=0.03)
+    parser.add_argument(
+        "--live", action="store_true", help="Use the configured API and index"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.live:
+        results = _compare()
+    else:
+        with StubServers(rerank_latency=args.rerank_latency) as stubs:
+            with tempfile.TemporaryDirectory() as workdir:
+                stubs.configure(workdir)
+
+                from indexer import DocumentIndexer
+
+                DocumentIndexer().build_index()
+                results = _compare()
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
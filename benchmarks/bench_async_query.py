@@ -0,0 +1,120 @@
+"""Load benchmark: blocking `QueryService.query` vs the async `/query` endpoint.
+
+Builds a scratch index over `data/` against the stub servers, then fires the
+same set of questions at a fixed concurrency two ways:
+
+- blocking: `service.query(...)` called from a coroutine (the old endpoint)
+- async:    `POST /query` on `api.app`, which awaits `service.aquery(...)`
+
+Usage:
+    python -m benchmarks.bench_async_query --requests 32 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.stub_servers import StubServers
+
+QUESTIONS = [
+    "What did the author do before college?",
+    "What did the author work on at Viaweb?",
+    "Why did the author start Y Combinator?",
+    "What did the author think about painting?",
+    "What programming language did the author write?",
+    "How did the author feel about Lisp?",
+]
+
+
+async def _run(call, total: int, concurrency: int) -> dict:
+    """Issue `total` calls with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await call(QUESTIONS[i % len(QUESTIONS)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def _benchmark(service, total: int, concurrency: int) -> dict:
+    import api
+
+    api.query_service = service
+
+    async def blocking(question: str) -> None:
+        service.query(question)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+
+        async def non_blocking(question: str) -> None:
+            response = await client.post("/query", json={"question": question})
+            response.raise_for_status()
+
+        results = {
+            "blocking": await _run(blocking, total, concurrency),
+            "async": await _run(non_blocking, total, concurrency),
+        }
+
+    await service.aclose()
+    return results
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Async /query load benchmark")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with StubServers(llm_latency=args.llm_latency) as stubs:
+        with tempfile.TemporaryDirectory() as workdir:
+            stubs.configure(workdir)
+
+            from indexer import DocumentIndexer
+            from query_service import QueryService
+
+            DocumentIndexer().build_index()
+            service = QueryService()
+            results = asyncio.run(_benchmark(service, args.requests, args.concurrency))
+
+    results["speedup"] = round(
+        results["async"]["throughput_rps"] / results["blocking"]["throughput_rps"], 2
+    )
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
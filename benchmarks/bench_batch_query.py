@@ -0,0 +1,113 @@
+"""Batch query benchmark: serial `/query` calls vs one `/query/batch` request.
+
+Builds a scratch index over `data/` against the stub servers, then answers the
+same distinct questions (so no cache is hit) two ways:
+
+- serial: one `POST /query` after another, as evaluation jobs used to do
+- batch:  a single `POST /query/batch`, reading NDJSON lines as they arrive
+
+Usage:
+    python -m benchmarks.bench_batch_query --questions 64 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_async_query import QUESTIONS
+from benchmarks.stub_servers import StubServers
+
+
+def _questions(total: int, tag: str) -> list:
+    return [f"{QUESTIONS[i % len(QUESTIONS)]} ({tag} #{i})" for i in range(total)]
+
+
+async def _measure(stubs: StubServers, total: int, concurrency: int) -> dict:
+    import api
+
+    await api.startup_event()
+    await api.wait_until_ready()
+    transport = httpx.ASGITransport(app=api.app)
+    results = {}
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            before = stubs.upstream_stats()
+            start = time.perf_counter()
+            for question in _questions(total, "serial"):
+                response = await client.post("/query", json={"question": question})
+                response.raise_for_status()
+            results["serial"] = _report(total, start, before, stubs.upstream_stats())
+
+            before = stubs.upstream_stats()
+            start = time.perf_counter()
+            payload = {
+                "questions": _questions(total, "batch"),
+                "concurrency": concurrency,
+            }
+            answered = 0
+            async with client.stream("POST", "/query/batch", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        if "error" in json.loads(line):
+                            raise RuntimeError(f"❌ 批量查询出错: {line}")
+                        answered += 1
+            assert answered == total
+            results["batch"] = _report(total, start, before, stubs.upstream_stats())
+            results["batch"]["concurrency"] = concurrency
+    finally:
+        await api.shutdown_event()
+    return results
+
+
+def _report(total: int, start: float, before: dict, after: dict) -> dict:
+    elapsed = time.perf_counter() - start
+    return {
+        "questions": total,
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(total / elapsed, 2),
+        "embedding_calls": after["zhipu"]["embeddings"] - before["zhipu"]["embeddings"],
+        "rerank_calls": after["tei"]["requests"] - before["tei"]["requests"],
+        "llm_calls": after["zhipu"]["chat"] - before["zhipu"]["chat"],
+    }
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Batch query benchmark")
+    parser.add_argument("--questions", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with StubServers(llm_latency=args.llm_latency) as stubs:
+        with tempfile.TemporaryDirectory() as workdir:
+            stubs.configure(workdir)
+
+            from indexer import DocumentIndexer
+
+            DocumentIndexer().build_index()
+            results = asyncio.run(_measure(stubs, args.questions, args.concurrency))
+
+    results["speedup"] = round(
+        results["serial"]["elapsed_s"] / results["batch"]["elapsed_s"], 2
+    )
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Context compression benchmark: prompt size, synthesis time and evidence.
+
+Runs a fixed evaluation set (question + the phrase an answer has to contain)
+against the essay in `data/` with context compression off and on, and
+reports per mode:
+
+- prompt tokens per question (as reported by the LLM API)
+- time spent compressing and synthesizing
+- evidence recall: share of questions whose answer phrase is still in the
+  context handed to the LLM (with the stubs, whose answers only echo the
+  prompt, this is the answer-quality check)
+
+The stub LLM charges `--prompt-token-latency` seconds per prompt token before
+the first token, like the prefill of a real model. With `--live` the
+configured ZhipuAI API and the existing index are used instead, and the
+answers themselves are checked for the phrase.
+
+Usage:
+    python -m benchmarks.bench_compression --prompt-token-latency 0.0002
+    python -m benchmarks.bench_compression --live
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+from typing import Optional
+
+from benchmarks.stub_servers import StubServers
+
+# (问题, 正确答案必须包含的短语)
+EVAL_SET = [
+    ("What computer did the author's father buy?", "TRS-80"),
+    ("What was the IBM 1401 used for in the author's school?", "data processing"),
+    ("Which language was used for AI when the author was in college?", "Lisp"),
+    ("Which grad schools did the author apply to?", "MIT and Yale"),
+    ("Where did the author work after coming back from Florence?", "Interleaf"),
+    ("How much did the author live on per day in Florence?", "$7 a day"),
+    ("How much seed funding did Viaweb get?", "$10,000"),
+    ("How many stores did Viaweb have at the end of 1997?", "500"),
+    ("Who bought Viaweb?", "Yahoo"),
+    ("What did the author learn from Interleaf?", "low end eats the high end"),
+    ("Which art school in Florence did the author apply to?", "Accademia"),
+    ("Who showed the author the World Wide Web?", "Robert Morris"),
+    ("In which year did the author drop out of RISD?", "1993"),
+    ("What replaced the name application service provider?", "software as a service"),
+]  # fmt: skip
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return phrase.lower() in " ".join(text.split()).lower()
+
+
+def _evaluate(service, check_answers: bool) -> dict:
+    """Run the evaluation set once through `service`."""
+    prompt_tokens, compress_ms, synthesize_ms = [], [], []
+    in_context = in_answer = 0
+    for question, phrase in EVAL_SET:
+        context = " ".join(n.node.get_content() for n in service.retrieve(question))
+        in_context += _contains(context, phrase)
+
+        result = service.query(question, debug=True)
+        in_answer += _contains(result["answer"], phrase)
+        debug = result["debug"]
+        prompt_tokens.append(debug["tokens"]["prompt"])
+        compress_ms.append(debug["timings_ms"].get("compress", 0.0))
+        synthesize_ms.append(debug["timings_ms"]["synthesize"])
+
+    report = {
+        "questions": len(EVAL_SET),
+        "prompt_tokens_mean": round(statistics.mean(prompt_tokens), 1),
+        "compress_ms_p50": round(statistics.median(compress_ms), 1),
+        "synthesize_ms_p50": round(statistics.median(synthesize_ms), 1),
+        "evidence_recall": round(in_context / len(EVAL_SET), 3),
+    }
+    if check_answers:
+        report["answer_accuracy"] = round(in_answer / len(EVAL_SET), 3)
+    return report
+
+
+def _compare(token_budget: Optional[int], check_answers: bool) -> dict:
+    import config
+    from query_service import QueryService
+
+    if token_budget is not None:
+        config.CONTEXT_TOKEN_BUDGET = token_budget
+    results = {}
+    for mode, enabled in (("off", False), ("on", True)):
+        config.USE_CONTEXT_COMPRESSION = enabled
+        results[mode] = _evaluate(QueryService(), check_answers)
+    results["token_budget"] = config.CONTEXT_TOKEN_BUDGET
+    results["prompt_token_reduction"] = round(
+        1 - results["on"]["prompt_tokens_mean"] / results["off"]["prompt_tokens_mean"],
+        3,
+    )
+    results["synthesize_speedup"] = round(
+        results["off"]["synthesize_ms_p50"] / results["on"]["synthesize_ms_p50"], 2
+    )
+    return results
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Context compression benchmark")
+    parser.add_argument("--token-budget", type=int, help="CONTEXT_TOKEN_BUDGET")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0002)
+    parser.add_argument(
+        "--live", action="store_true", help="Use the configured API and index"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.live:
+        results = _compare(args.token_budget, check_answers=True)
+    else:
+        with StubServers(
+            llm_latency=args.llm_latency,
+            prompt_token_latency=args.prompt_token_latency,
+        ) as stubs:
+            with tempfile.TemporaryDirectory() as workdir:
+                stubs.configure(workdir)
+
+                from indexer import DocumentIndexer
+
+                DocumentIndexer().build_index()
+                results = _compare(args.token_budget, check_answers=False)
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
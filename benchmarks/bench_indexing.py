@@ -0,0 +1,101 @@
+"""Indexing throughput benchmark against the stub embedding server.
+
+Generates a synthetic corpus, then builds a fresh index once per concurrency
+level and reports docs/s and chunks/s.
+
+Usage:
+    python -m benchmarks.bench_indexing --docs 40 --concurrency 1 4 16 --workers 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.stub_servers import StubServers
+
+_ESSAY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "paul_graham_essay.txt",
+)
+
+
+def write_corpus(directory: str, docs: int, paragraphs: int = 20) -> None:
+    """Write `docs` deterministic pseudo-documents built from the sample essay."""
+    with open(_ESSAY) as f:
+        source = [p for p in f.read().split("\n\n") if p.strip()]
+    os.makedirs(directory, exist_ok=True)
+    for i in range(docs):
+        rng = random.Random(i)
+        body = "\n\n".join(rng.choice(source) for _ in range(paragraphs))
+        with open(os.path.join(directory, f"doc_{i:05d}.txt"), "w") as f:
+            f.write(f"Document {i}\n\n{body}")
+
+
+def run_once(
+    stubs: StubServers, corpus_dir: str, docs: int, concurrency: int, workers: int = 1
+) -> dict:
+    """Build a fresh index over the corpus with the given concurrency."""
+    import config
+    from indexer import DocumentIndexer
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stubs.configure(workdir)
+        config.DATA_DIR = corpus_dir
+        config.EMBED_MAX_IN_FLIGHT = concurrency
+
+        indexer = DocumentIndexer()
+        start = time.perf_counter()
+        indexer.build_index(workers=workers)
+        elapsed = time.perf_counter() - start
+        chunks = indexer.chroma_collection.count()
+
+    return {
+        "concurrency": concurrency,
+        "workers": workers,
+        "docs": docs,
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_s": round(docs / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+    }
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Indexing throughput benchmark")
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Parsing/chunking processes"
+    )
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    with StubServers(embed_latency=args.embed_latency) as stubs:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            write_corpus(corpus_dir, args.docs)
+            for concurrency in args.concurrency:
+                results.append(
+                    run_once(
+                        stubs, corpus_dir, args.docs, concurrency, args.workers
+                    )
+                )
+
+    report = json.dumps({"indexing": results}, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
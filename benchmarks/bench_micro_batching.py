@@ -0,0 +1,96 @@
+"""Micro-batching benchmark: upstream calls and latency at peak concurrency.
+
+Builds a scratch index over `data/` against the stub servers, then fires a
+burst of distinct questions at `QueryService.aquery` with micro-batching off
+and on, and reports how many embedding / rerank requests reached the stubs.
+The embedding and rerank caches are disabled so every question goes upstream.
+
+Usage:
+    python -m benchmarks.bench_micro_batching --requests 64 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+
+from benchmarks.bench_async_query import _run
+from benchmarks.stub_servers import StubServers
+
+
+def _delta(before: dict, after: dict) -> dict:
+    return {
+        "embedding_calls": after["zhipu"]["embeddings"] - before["zhipu"]["embeddings"],
+        "rerank_calls": after["tei"]["requests"] - before["tei"]["requests"],
+        "rerank_pairs": after["tei"]["pairs"] - before["tei"]["pairs"],
+    }
+
+
+async def _measure(stubs: StubServers, total: int, concurrency: int) -> dict:
+    from query_service import QueryService
+
+    service = QueryService()
+    counter = iter(range(total))
+
+    async def call(question: str) -> None:
+        # 问题互不相同，避免命中任何缓存
+        await service.aquery(f"{question} #{next(counter)}")
+
+    try:
+        before = stubs.upstream_stats()
+        result = await _run(call, total, concurrency)
+        result["upstream"] = _delta(before, stubs.upstream_stats())
+        result["batching"] = service.batching_stats()
+        return result
+    finally:
+        await service.aclose()
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Micro-batching benchmark")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with StubServers(llm_latency=args.llm_latency) as stubs:
+        with tempfile.TemporaryDirectory() as workdir:
+            stubs.configure(workdir)
+
+            import config
+            from indexer import DocumentIndexer
+
+            DocumentIndexer().build_index()
+            config.USE_EMBEDDING_CACHE = False
+            config.USE_RERANK_CACHE = False
+            config.MICRO_BATCH_MAX_WAIT_MS = args.max_wait_ms
+
+            results = {}
+            for name, enabled in (("unbatched", False), ("batched", True)):
+                config.USE_MICRO_BATCHING = enabled
+                results[name] = asyncio.run(
+                    _measure(stubs, args.requests, args.concurrency)
+                )
+
+    off, on = results["unbatched"]["upstream"], results["batched"]["upstream"]
+    results["embedding_call_reduction"] = round(
+        off["embedding_calls"] / max(on["embedding_calls"], 1), 2
+    )
+    results["rerank_call_reduction"] = round(
+        off["rerank_calls"] / max(on["rerank_calls"], 1), 2
+    )
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Per-request pipeline benchmark: cost of varying the query parameters.
+
+Times what it takes to get a pipeline for one request's parameters (top_k,
+rerank on/off, top_n, response mode, token budget, filters) with
+`QueryService.pipeline`, against building a llama_index query engine for
+the same parameters with `index.as_query_engine`. Only construction is
+timed; no retrieval or LLM call is made.
+
+Usage:
+    python -m benchmarks.bench_query_pipeline
+    python -m benchmarks.bench_query_pipeline --live
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+from benchmarks.stub_servers import StubServers
+
+# 名称 -> 请求参数
+VARIANTS = {
+    "default": {},
+    "rerank_off": {"rerank": False},
+    "top_n_and_budget": {"top_n": 5, "token_budget": 1024},
+    "response_mode": {"response_mode": "tree_summarize"},
+    "top_k": {"top_k": 20},
+    "filters": {"top_k": 8, "filters": {"doc_type": "txt"}},
+}
+
+
+def _time_us(build, repeat: int) -> dict:
+    """Per-call microseconds of `build()`, after one warm-up call."""
+    build()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return {
+        "p50_us": round(statistics.median(samples), 1),
+        "mean_us": round(statistics.mean(samples), 1),
+    }
+
+
+def _compare(repeat: int) -> dict:
+    import config
+    from query_options import DEFAULT_RESPONSE_MODE, QueryOptions
+    from query_service import QueryService
+
+    service = QueryService()
+    engine = service.engine()
+    results = {}
+    for name, params in VARIANTS.items():
+
+        def pipeline():
+            return service.pipeline(engine, QueryOptions(**params))
+
+        def query_engine():
+            # 与旧实现相同：每组参数构建一个新的查询引擎
+            options = QueryOptions(**params)
+            return engine.index.as_query_engine(
+                llm=service.llm,
+                similarity_top_k=options.top_k or config.SIMILARITY_TOP_K,
+                filters=options.metadata_filters,
+                response_mode=options.response_mode or DEFAULT_RESPONSE_MODE,
+                node_postprocessors=service.node_postprocessors
+                if options.rerank
+                else [],
+            )
+
+        pipeline_cost = _time_us(pipeline, repeat)
+        engine_cost = _time_us(query_engine, max(repeat // 10, 10))
+        results[name] = {
+            "pipeline": pipeline_cost,
+            "as_query_engine": engine_cost,
+            "speedup": round(engine_cost["p50_us"] / pipeline_cost["p50_us"], 1),
+        }
+    return results
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Per-request pipeline benchmark")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument(
+        "--live", action="store_true", help="Use the configured API and index"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.live:
+        results = _compare(args.repeat)
+    else:
+        with StubServers() as stubs:
+            with tempfile.TemporaryDirectory() as workdir:
+                stubs.configure(workdir)
+
+                from indexer import DocumentIndexer
+
+                DocumentIndexer().build_index()
+                results = _compare(args.repeat)
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
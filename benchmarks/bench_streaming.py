@@ -0,0 +1,125 @@
+"""Time-to-first-token benchmark: `/query` vs the SSE `/query/stream` endpoint.
+
+Builds a scratch index over `data/` against the stub servers, serves `api.app`
+with uvicorn on a free port and measures, per request, when the first answer
+token arrives and when the answer is complete.
+
+Usage:
+    python -m benchmarks.bench_streaming --requests 8 --token-latency 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.bench_async_query import QUESTIONS
+from benchmarks.stub_servers import StubServers, _free_port
+
+
+def _summary(samples: list) -> dict:
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+async def _measure(base_url: str, total: int) -> dict:
+    ttft = {"query": [], "stream": []}
+    full = {"query": [], "stream": []}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for i in range(total):
+            payload = {"question": QUESTIONS[i % len(QUESTIONS)]}
+
+            start = time.perf_counter()
+            response = await client.post("/query", json=payload)
+            response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            # 非流式接口要等完整答案生成后才有第一个 token
+            ttft["query"].append(elapsed)
+            full["query"].append(elapsed)
+
+            start = time.perf_counter()
+            first = None
+            async with client.stream("POST", "/query/stream", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line == "event: token" and first is None:
+                        first = time.perf_counter() - start
+                    elif line == "event: error":
+                        raise RuntimeError("❌ /query/stream 返回错误事件")
+            ttft["stream"].append(first)
+            full["stream"].append(time.perf_counter() - start)
+
+    return {
+        name: {
+            "requests": total,
+            "ttft": _summary(ttft[name]),
+            "total": _summary(full[name]),
+        }
+        for name in ("query", "stream")
+    }
+
+
+async def _benchmark(total: int) -> dict:
+    import api
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    await api.wait_until_ready()
+
+    try:
+        return await _measure(f"http://127.0.0.1:{port}", total)
+    finally:
+        server.should_exit = True
+        await task
+
+
+def main():
+    """Run the benchmark and print a JSON report."""
+    parser = argparse.ArgumentParser(description="Streaming TTFT benchmark")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with StubServers(
+        llm_latency=args.llm_latency, token_latency=args.token_latency
+    ) as stubs:
+        with tempfile.TemporaryDirectory() as workdir:
+            stubs.configure(workdir)
+
+            from indexer import DocumentIndexer
+
+            DocumentIndexer().build_index()
+            results = asyncio.run(_benchmark(args.requests))
+
+    results["ttft_speedup"] = round(
+        results["query"]["ttft"]["p50_ms"] / results["stream"]["ttft"]["p50_ms"], 2
+    )
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
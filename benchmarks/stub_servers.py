@@ -0,0 +1,374 @@
+"""Local stand-ins for the ZhipuAI (LLM + embedding) and TEI rerank APIs.
+
+The stubs answer with deterministic output after a fixed, configurable delay so
+benchmarks measure this service rather than the network or the remote models.
+
+Run standalone:
+    python -m benchmarks.stub_servers --zhipu-port 18001 --tei-port 18002
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used by the fake embedding and rerank models."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic bag-of-words embedding: similar texts get similar vectors."""
+    vector = [0.0] * dim
+    for token in tokenize(text):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_rerank_score(query: str, text: str) -> float:
+    """Token-overlap relevance score in [0, 1]."""
+    query_tokens = set(tokenize(query))
+    if not query_tokens:
+        return 0.0
+    return len(query_tokens & set(tokenize(text))) / len(query_tokens)
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: str | List[str]
+
+
+class ChatRequest(BaseModel):
+    model: str
+    messages: List[dict]
+    stream: bool = False
+
+
+class RerankRequest(BaseModel):
+    query: str
+    texts: List[str]
+    truncate: bool = True
+
+
+class PredictRequest(BaseModel):
+    inputs: List[List[str]]
+    truncate: bool = True
+
+
+def create_zhipu_app(
+    llm_latency: float = 0.2,
+    embed_latency: float = 0.02,
+    dim: int = 256,
+    answer_words: int = 64,
+    token_latency: float = 0.0,
+    prompt_token_latency: float = 0.0,
+) -> FastAPI:
+    """Build a stub of the ZhipuAI `/chat/completions` and `/embeddings` API.
+
+    `llm_latency` is the time to the first token and `token_latency` the delay
+    between tokens; a non-streaming completion waits for all of them.
+    `prompt_token_latency` adds prefill time per prompt token, so longer
+    prompts answer later.
+    """
+    app = FastAPI(title="ZhipuAI stub")
+    calls = {"embeddings": 0, "embedding_texts": 0, "chat": 0}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return calls
+
+    @app.post("/embeddings")
+    async def embeddings(request: EmbeddingRequest):
+        await asyncio.sleep(embed_latency)
+        inputs = [request.input] if isinstance(request.input, str) else request.input
+        calls["embeddings"] += 1
+        calls["embedding_texts"] += len(inputs)
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(t, dim)}
+            for i, t in enumerate(inputs)
+        ]
+        tokens = sum(len(tokenize(t)) for t in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.model,
+            "usage": {
+                "prompt_tokens": tokens,
+                "completion_tokens": 0,
+                "total_tokens": tokens,
+            },
+        }
+
+    def first_token_delay(prompt_tokens: int) -> float:
+        return llm_latency + prompt_token_latency * prompt_tokens
+
+    async def stream_chunks(model: str, words: List[str], prompt_tokens: int):
+        await asyncio.sleep(first_token_delay(prompt_tokens))
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(token_latency)
+            chunk = {
+                "id": "stub-stream",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {
+                            "role": "assistant",
+                            "content": word if i == 0 else f" {word}",
+                        },
+                    }
+                ],
+            }
+            if i == len(words) - 1:
+                # 与智谱一样，最后一个增量附带 token 用量
+                chunk["usage"] = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: ChatRequest):
+        calls["chat"] += 1
+        prompt = " ".join(str(m.get("content", "")) for m in request.messages)
+        words = (tokenize(prompt) or ["stub"]) * answer_words
+        if request.stream:
+            return StreamingResponse(
+                stream_chunks(
+                    request.model, words[:answer_words], len(tokenize(prompt))
+                ),
+                media_type="text/event-stream",
+            )
+
+        prompt_tokens = len(tokenize(prompt))
+        await asyncio.sleep(
+            first_token_delay(prompt_tokens) + token_latency * (answer_words - 1)
+        )
+        return {
+            "id": f"stub-{time.time_ns()}",
+            "created": int(time.time()),
+            "model": request.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": " ".join(words[:answer_words]),
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": answer_words,
+                "total_tokens": prompt_tokens + answer_words,
+            },
+        }
+
+    return app
+
+
+def create_tei_app(rerank_latency: float = 0.03) -> FastAPI:
+    """Build a stub of the TEI `/rerank` and `/predict` (pair scoring) API."""
+    app = FastAPI(title="TEI stub")
+    calls = {"requests": 0, "pairs": 0}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return calls
+
+    @app.post("/rerank")
+    async def rerank(request: RerankRequest):
+        await asyncio.sleep(rerank_latency)
+        calls["requests"] += 1
+        calls["pairs"] += len(request.texts)
+        scores = [fake_rerank_score(request.query, t) for t in request.texts]
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [{"index": i, "score": scores[i]} for i in ranked]
+
+    @app.post("/predict")
+    async def predict(request: PredictRequest):
+        await asyncio.sleep(rerank_latency)
+        calls["requests"] += 1
+        calls["pairs"] += len(request.inputs)
+        return [
+            [{"score": fake_rerank_score(query, text), "label": "LABEL_0"}]
+            for query, text in request.inputs
+        ]
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_for_stubs(workdir: str, zhipu_url: str, tei_url: str) -> None:
+    """Point `config` (and the ZhipuAI SDK) at stub servers and a scratch DB."""
+    import config
+
+    os.environ["ZHIPUAI_BASE_URL"] = zhipu_url
+    config.ZHIPUAI_API_KEY = "stub-api-key"
+    config.ZHIPUAI_BASE_URL = zhipu_url
+    config.USE_RERANK = True
+    config.RERANK_API_URL = tei_url
+    config.CHROMA_PERSIST_DIR = os.path.join(workdir, "chroma_db")
+    config.EMBEDDING_CACHE_PATH = os.path.join(workdir, "embedding_cache.db")
+    # 重复问题会命中语义缓存而跳过整条链路，需要时由各基准单独开启
+    config.USE_SEMANTIC_CACHE = False
+
+
+class StubServers:
+    """Run both stub servers in a subprocess for the duration of a benchmark.
+
+    Example:
+        with StubServers(llm_latency=0.2) as stubs:
+            stubs.configure(workdir)
+            service = QueryService()
+    """
+
+    def __init__(
+        self,
+        llm_latency: float = 0.2,
+        embed_latency: float = 0.02,
+        rerank_latency: float = 0.03,
+        embed_dim: int = 256,
+        token_latency: float = 0.0,
+        prompt_token_latency: float = 0.0,
+    ):
+        self.args = [
+            "--llm-latency", str(llm_latency),
+            "--token-latency", str(token_latency),
+            "--prompt-token-latency", str(prompt_token_latency),
+            "--embed-latency", str(embed_latency),
+            "--rerank-latency", str(rerank_latency),
+            "--embed-dim", str(embed_dim),
+        ]  # fmt: skip
+        self.zhipu_port = _free_port()
+        self.tei_port = _free_port()
+        self.zhipu_url = f"http://127.0.0.1:{self.zhipu_port}"
+        self.tei_url = f"http://127.0.0.1:{self.tei_port}"
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "StubServers":
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "benchmarks.stub_servers",
+                "--zhipu-port", str(self.zhipu_port),
+                "--tei-port", str(self.tei_port),
+                *self.args,
+            ],  # fmt: skip
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        deadline = time.monotonic() + 30
+        for url in (self.zhipu_url, self.tei_url):
+            while True:
+                try:
+                    if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                        break
+                except requests.exceptions.RequestException:
+                    pass
+                if time.monotonic() > deadline or self._process.poll() is not None:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError(f"❌ stub 服务启动失败: {url}")
+                time.sleep(0.1)
+        return self
+
+    def upstream_stats(self) -> dict:
+        """Upstream call counters of both stubs since they started."""
+        return {
+            "zhipu": requests.get(f"{self.zhipu_url}/stats", timeout=5).json(),
+            "tei": requests.get(f"{self.tei_url}/stats", timeout=5).json(),
+        }
+
+    def configure(self, workdir: str) -> None:
+        """Point `config` (and the ZhipuAI SDK) at the stubs and a scratch DB."""
+        configure_for_stubs(workdir, self.zhipu_url, self.tei_url)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+            self._process = None
+
+
+async def _serve(args) -> None:
+    servers = [
+        uvicorn.Server(
+            uvicorn.Config(
+                create_zhipu_app(
+                    args.llm_latency,
+                    args.embed_latency,
+                    args.embed_dim,
+                    token_latency=args.token_latency,
+                    prompt_token_latency=args.prompt_token_latency,
+                ),
+                host="127.0.0.1",
+                port=args.zhipu_port,
+                log_level="warning",
+            )
+        ),
+        uvicorn.Server(
+            uvicorn.Config(
+                create_tei_app(args.rerank_latency),
+                host="127.0.0.1",
+                port=args.tei_port,
+                log_level="warning",
+            )
+        ),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    """Run the stub servers until interrupted."""
+    parser = argparse.ArgumentParser(description="Run stub model servers")
+    parser.add_argument("--zhipu-port", type=int, default=18001)
+    parser.add_argument("--tei-port", type=int, default=18002)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--rerank-latency", type=float, default=0.03)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    args = parser.parse_args()
+
+    asyncio.run(_serve(args))
+
+
+if __name__ == "__main__":
+    main()
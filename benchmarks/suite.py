@@ -0,0 +1,395 @@
+"""Baseline benchmark suite: indexing, query latency, max QPS and memory.
+
+Everything runs offline against the stub servers (fixed latencies,
+deterministic embeddings, rerank scores and answers), so two runs on the same
+machine are comparable:
+
+1. index:   build a fresh index over a synthetic corpus (docs/s, chunks/s,
+            peak RSS of the indexing process)
+2. latency: closed-loop load on `POST /query` of `api.py` served by uvicorn in
+            a subprocess (p50/p95/p99, throughput)
+3. qps:     open-loop load at increasing request rates; the highest rate whose
+            p95 stays within `--slo-ms` without errors is the max sustainable QPS
+4. startup: cold start of the API process: seconds until `/livez` (port
+            serving) and `/readyz` (queries can run) answer
+5. memory:  RSS, PSS and peak RSS of the API processes after the load
+            (supervisor, workers and shared Chroma server with `--workers`)
+
+The questions differ only by a tag, so the semantic answer cache would answer
+most of them without retrieval or generation; it is off unless
+`--set USE_SEMANTIC_CACHE=True`, and the setting is recorded in the report.
+Every question is still distinct, so the exact-match caches miss. The JSON
+report can be compared with an earlier one via `--baseline`.
+
+Usage:
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --output after.json
+    python -m benchmarks.suite --set USE_HYBRID_SEARCH=False
+    python -m benchmarks.suite --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.api_server import ApiServer, apply_overrides, parse_overrides
+from benchmarks.bench_async_query import QUESTIONS
+from benchmarks.bench_indexing import write_corpus
+from benchmarks.stub_servers import StubServers
+
+# 对比基准时检查的指标：(路径, 越大越好)
+_COMPARED = [
+    (("index", "chunks_per_s"), True),
+    (("latency", "p50_ms"), False),
+    (("latency", "p95_ms"), False),
+    (("latency", "p99_ms"), False),
+    (("latency", "throughput_rps"), True),
+    (("qps", "max_sustainable_qps"), True),
+    (("startup", "live_s"), False),
+    (("startup", "ready_s"), False),
+    (("memory", "api_peak_rss_mib"), False),
+    (("memory", "index_peak_rss_mib"), False),
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(q / 100 * len(sorted_values) + 0.5 - 1e-9))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float]) -> dict:
+    """Latency percentiles in milliseconds."""
+    values = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+    }
+
+
+def _question(tag: str, i: int) -> str:
+    return f"{QUESTIONS[i % len(QUESTIONS)]} ({tag} #{i})"
+
+
+async def _post_query(client: httpx.AsyncClient, question: str) -> float:
+    start = time.perf_counter()
+    response = await client.post("/query", json={"question": question})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def _client(base_url: str, connections: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=connections, max_keepalive_connections=connections
+    )
+    return httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits)
+
+
+async def measure_latency(base_url: str, total: int, concurrency: int) -> dict:
+    """Closed loop: `concurrency` clients each send the next question in turn."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async with _client(base_url, concurrency) as client:
+        # 预热：建立连接，加载查询引擎
+        await _post_query(client, _question("warmup", 0))
+
+        async def worker() -> None:
+            nonlocal errors
+            for i in counter:
+                try:
+                    question = _question("latency", i)
+                    latencies.append(await _post_query(client, question))
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **summarize(latencies),
+    }
+
+
+async def _open_loop_step(
+    client: httpx.AsyncClient, rate: float, duration: float
+) -> dict:
+    """Send requests at a fixed rate (regardless of responses) for `duration`."""
+    total = max(1, int(rate * duration))
+    latencies, errors = [], 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        try:
+            question = _question(f"qps {rate:g}", i)
+            latencies.append(await _post_query(client, question))
+        except httpx.HTTPError:
+            errors += 1
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(total):
+        # 按固定间隔发送，服务变慢时请求在服务端堆积，延迟随之上升
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "offered_qps": rate,
+        "requests": total,
+        "errors": errors,
+        "achieved_qps": round(len(latencies) / elapsed, 2),
+        **summarize(latencies),
+    }
+
+
+async def measure_max_qps(
+    base_url: str,
+    start_qps: float,
+    factor: float,
+    max_qps: float,
+    step_seconds: float,
+    slo_ms: float,
+) -> dict:
+    """Raise the request rate until p95 exceeds the SLO or requests fail."""
+    steps = []
+    sustainable = 0.0
+    rate = start_qps
+    async with _client(base_url, 1000) as client:
+        while rate <= max_qps:
+            step = await _open_loop_step(client, rate, step_seconds)
+            step["sustained"] = step["errors"] == 0 and step["p95_ms"] <= slo_ms
+            steps.append(step)
+            print(f"   {rate:g} QPS: p95={step['p95_ms']}ms, 错误 {step['errors']}")
+            if not step["sustained"]:
+                break
+            sustainable = rate
+            rate = round(rate * factor, 2)
+
+    return {
+        "slo_p95_ms": slo_ms,
+        "step_seconds": step_seconds,
+        "max_sustainable_qps": sustainable,
+        "steps": steps,
+    }
+
+
+def measure_index(workdir: str, docs: int) -> dict:
+    """Build the index used by the query stages, in this process."""
+    import config
+    from indexer import DocumentIndexer
+
+    corpus_dir = os.path.join(workdir, "corpus")
+    write_corpus(corpus_dir, docs)
+    config.DATA_DIR = corpus_dir
+
+    indexer = DocumentIndexer()
+    start = time.perf_counter()
+    indexer.build_index()
+    elapsed = time.perf_counter() - start
+    chunks = indexer.chroma_collection.count()
+    return {
+        "docs": docs,
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_s": round(docs / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[dict]:
+    """Relative change of the key metrics; beyond `tolerance` is a regression."""
+    rows = []
+    for path, higher_is_better in _COMPARED:
+        old, new = baseline, report
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        rows.append(
+            {
+                "metric": ".".join(path),
+                "baseline": old,
+                "current": new,
+                "change_pct": round(change * 100, 1),
+                "regression": worse > tolerance,
+            }
+        )
+    return rows
+
+
+def run(args) -> dict:
+    overrides = parse_overrides(args.set)
+    # 默认关闭语义缓存，测量完整的检索 + 生成链路
+    overrides.setdefault("USE_SEMANTIC_CACHE", False)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": args.workers,
+            "overrides": overrides,
+            "semantic_cache": overrides["USE_SEMANTIC_CACHE"],
+            "stubs": {
+                "llm_latency": args.llm_latency,
+                "embed_latency": args.embed_latency,
+                "rerank_latency": args.rerank_latency,
+            },
+        }
+    }
+
+    with StubServers(
+        llm_latency=args.llm_latency,
+        embed_latency=args.embed_latency,
+        rerank_latency=args.rerank_latency,
+    ) as stubs:
+        with tempfile.TemporaryDirectory() as workdir:
+            stubs.configure(workdir)
+            apply_overrides(overrides)
+
+            print(f"🔨 索引构建: {args.docs} 个文档")
+            report["index"] = measure_index(workdir, args.docs)
+            # ru_maxrss 在 Linux 上以 KiB 为单位
+            index_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+            with ApiServer(
+                workdir, stubs.zhipu_url, stubs.tei_url, overrides, args.workers
+            ) as api:
+                report["startup"] = api.startup
+                print(
+                    f"🚀 冷启动: 端口可用 {api.startup['live_s']}s, "
+                    f"就绪 {api.startup['ready_s']}s"
+                )
+                print(f"⏱️  延迟: {args.requests} 个请求, 并发 {args.concurrency}")
+                report["latency"] = asyncio.run(
+                    measure_latency(api.url, args.requests, args.concurrency)
+                )
+                if not args.skip_qps:
+                    print(f"📈 最大 QPS: 从 {args.start_qps:g} QPS 开始")
+                    report["qps"] = asyncio.run(
+                        measure_max_qps(
+                            api.url,
+                            args.start_qps,
+                            args.qps_factor,
+                            args.max_qps,
+                            args.step_seconds,
+                            args.slo_ms,
+                        )
+                    )
+                memory = api.memory() or {}
+
+    report["memory"] = {
+        "index_peak_rss_mib": round(index_peak, 1),
+        "api_rss_mib": memory.get("rss_mib"),
+        "api_pss_mib": memory.get("pss_mib"),
+        "api_peak_rss_mib": memory.get("peak_rss_mib"),
+    }
+    return report
+
+
+def main():
+    """Run the suite, print and optionally save the JSON report."""
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--docs", type=int, default=40, help="Synthetic documents")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="API processes")
+    parser.add_argument("--skip-qps", action="store_true")
+    parser.add_argument("--start-qps", type=float, default=5)
+    parser.add_argument("--qps-factor", type=float, default=1.5)
+    parser.add_argument("--max-qps", type=float, default=500)
+    parser.add_argument("--step-seconds", type=float, default=5)
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p95 target")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--rerank-latency", type=float, default=0.03)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override a config value for indexing and serving (repeatable)",
+    )
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative change counted as a regression (default 0.1 = 10%%)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    report = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("semantic_cache") != report["meta"]["semantic_cache"]:
+            print("⚠️  基准报告的语义缓存设置不同（或未记录），延迟和 QPS 不可直接比较")
+        report["comparison"] = compare(report, baseline, args.tolerance)
+        regressions = [row for row in report["comparison"] if row["regression"]]
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+    if regressions:
+        for row in regressions:
+            print(
+                f"❌ 回退: {row['metric']} {row['baseline']} → {row['current']} "
+                f"({row['change_pct']:+}%)"
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Persistent BM25 inverted index over the indexed chunks.
+
+Complements dense retrieval for exact-term queries (error codes, product
+names). The index lives in a SQLite file next to the Chroma DB and is kept in
+sync by `DocumentIndexer`.
+"""
+
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+
+# 英文 / 数字按词切分（保留 ERR_CONN-42 这类编码）；中文按字的二元组切分
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[._\-][0-9a-z]+)*|[\u3400-\u9fff]+")
+_PART_RE = re.compile(r"[0-9a-z]+")
+
+
+def lexical_index_path(persist_dir: str, collection_name: str) -> str:
+    """Location of the BM25 index for a collection."""
+    return os.path.join(persist_dir, f"{collection_name}.bm25.sqlite")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into BM25 terms.
+
+    Latin words and codes are lowercased and kept whole (plus their parts,
+    so "ERR_CONN-42" also matches "conn"); CJK runs become character bigrams.
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower()):
+        if match[0] >= "\u3400":
+            if len(match) == 1:
+                tokens.append(match)
+            tokens.extend(match[i : i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+            parts = _PART_RE.findall(match)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """SQLite-backed inverted index with Okapi BM25 scoring.
+
+    Args:
+        path: SQLite file holding the index
+        k1: Term-frequency saturation
+        b: Document-length normalization
+        max_df_ratio: Query terms found in more than this fraction of the
+            documents ("the", "的") are skipped, so they do not pull their
+            full postings lists; 1 keeps every term
+    """
+
+    _MIN_DOCS_FOR_DF_CAP = 100  # 文档太少时文档频率说明不了词是否常见，不跳过
+
+    def __init__(
+        self, path: str, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5
+    ):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "node_id TEXT PRIMARY KEY, length INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, node_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, node_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_node_id ON postings (node_id);"
+            # 文档数和总长度单独维护，查询时不必扫描 docs 表
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "doc_count INTEGER NOT NULL, total_length INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO stats VALUES (0, 0, 0);"
+            # 每个词的文档频率，查询时据此跳过高频词
+            "CREATE TABLE IF NOT EXISTS terms ("
+            "term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+        )
+        # 旧版本建立的索引没有 terms 表，从 postings 补建一次
+        (has_terms,) = self._db.execute(
+            "SELECT EXISTS (SELECT 1 FROM terms)"
+        ).fetchone()
+        if not has_terms:
+            self._db.execute(
+                "INSERT INTO terms (term, df) "
+                "SELECT term, COUNT(*) FROM postings GROUP BY term"
+            )
+        self._db.commit()
+
+    def _delete(self, node_ids: List[str]) -> None:
+        """Remove documents (inside the caller's transaction)."""
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            count, length = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs "
+                f"WHERE node_id IN ({placeholders})",
+                batch,
+            ).fetchone()
+            if not count:
+                continue
+            self._db.executemany(
+                "UPDATE terms SET df = df - ? WHERE term = ?",
+                self._db.execute(
+                    "SELECT COUNT(*), term FROM postings "
+                    f"WHERE node_id IN ({placeholders}) GROUP BY term",
+                    batch,
+                ).fetchall(),
+            )
+            self._db.execute(
+                f"DELETE FROM postings WHERE node_id IN ({placeholders})", batch
+            )
+            self._db.execute(
+                f"DELETE FROM docs WHERE node_id IN ({placeholders})", batch
+            )
+            self._db.execute(
+                "UPDATE stats SET doc_count = doc_count - ?, "
+                "total_length = total_length - ? WHERE id = 0",
+                (count, length),
+            )
+        self._db.execute("DELETE FROM terms WHERE df <= 0")
+
+    def add(self, documents: Iterable[Tuple[str, str]]) -> None:
+        """Index (node_id, text) pairs, replacing documents with the same ID."""
+        documents = list(documents)
+        if not documents:
+            return
+        with self._lock:
+            self._delete([node_id for node_id, _ in documents])
+            total_length = 0
+            postings = []
+            term_df = Counter()
+            for node_id, text in documents:
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                total_length += length
+                self._db.execute(
+                    "INSERT INTO docs (node_id, length) VALUES (?, ?)",
+                    (node_id, length),
+                )
+                postings.extend((term, node_id, tf) for term, tf in counts.items())
+                term_df.update(counts.keys())
+            self._db.executemany(
+                "INSERT INTO postings (term, node_id, tf) VALUES (?, ?, ?)", postings
+            )
+            self._db.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) "
+                "ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                term_df.items(),
+            )
+            self._db.execute(
+                "UPDATE stats SET doc_count = doc_count + ?, "
+                "total_length = total_length + ? WHERE id = 0",
+                (len(documents), total_length),
+            )
+            self._db.commit()
+
+    def delete(self, node_ids: List[str]) -> None:
+        """Remove documents by node ID (unknown IDs are ignored)."""
+        if not node_ids:
+            return
+        with self._lock:
+            self._delete(list(node_ids))
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Remove every document."""
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM terms")
+            self._db.execute("UPDATE stats SET doc_count = 0, total_length = 0")
+            self._db.commit()
+
+    def count(self) -> int:
+        """Number of indexed documents."""
+        with self._lock:
+            (doc_count,) = self._db.execute(
+                "SELECT doc_count FROM stats WHERE id = 0"
+            ).fetchone()
+            return doc_count
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Return up to `top_k` (node_id, score) pairs, best first."""
+        terms = sorted(set(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+
+        with self._lock:
+            doc_count, total_length = self._db.execute(
+                "SELECT doc_count, total_length FROM stats WHERE id = 0"
+            ).fetchone()
+            if not doc_count:
+                return []
+            if self.max_df_ratio < 1 and doc_count >= self._MIN_DOCS_FOR_DF_CAP:
+                # 高频词几乎不区分文档，跳过它们以免读取整条倒排链
+                placeholders = ",".join("?" * len(terms))
+                terms = [
+                    term
+                    for (term,) in self._db.execute(
+                        f"SELECT term FROM terms WHERE term IN ({placeholders}) "
+                        "AND df <= ?",
+                        [*terms, self.max_df_ratio * doc_count],
+                    )
+                ]
+                if not terms:
+                    return []
+            placeholders = ",".join("?" * len(terms))
+            rows = self._db.execute(
+                "SELECT p.term, p.node_id, p.tf, d.length FROM postings p "
+                "JOIN docs d ON d.node_id = p.node_id "
+                f"WHERE p.term IN ({placeholders})",
+                terms,
+            ).fetchall()
+
+        postings = defaultdict(list)
+        for term, node_id, tf, length in rows:
+            postings[term].append((node_id, tf, length))
+
+        avg_length = total_length / doc_count
+        scores = defaultdict(float)
+        for term, docs in postings.items():
+            df = len(docs)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for node_id, tf, length in docs:
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[node_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
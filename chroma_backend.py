@@ -0,0 +1,115 @@
+"""Chroma client selection and a local Chroma server for multi-worker serving.
+
+A single API process opens the persist directory directly (`PersistentClient`).
+Several worker processes doing the same would each load the HNSW index into
+their own memory and write the same SQLite file, so instead they connect over
+HTTP to one Chroma server that holds the only copy. `ChromaServer` runs
+`chroma run` over the persist directory as a local stand-in for a dedicated
+Chroma deployment.
+"""
+
+import logging
+import socket
+import subprocess
+import sys
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def connect_chroma(persist_dir: Optional[str] = None):
+    """Chroma client for the configured backend.
+
+    Args:
+        persist_dir: Local database directory (defaults to CHROMA_PERSIST_DIR);
+            ignored when CHROMA_SERVER_URL points at a Chroma server
+    """
+    # chromadb 导入较慢，用到时才导入（多 worker 的主进程只负责启动服务）
+    import chromadb
+
+    if config.CHROMA_SERVER_URL:
+        url = urlparse(config.CHROMA_SERVER_URL)
+        return chromadb.HttpClient(
+            host=url.hostname,
+            port=url.port or (443 if url.scheme == "https" else 80),
+            ssl=url.scheme == "https",
+        )
+    return chromadb.PersistentClient(path=persist_dir or config.CHROMA_PERSIST_DIR)
+
+
+class ChromaServer:
+    """Serve a Chroma persist directory over HTTP from a subprocess.
+
+    Example:
+        with ChromaServer(config.CHROMA_PERSIST_DIR) as server:
+            os.environ["CHROMA_SERVER_URL"] = server.url
+
+    Args:
+        path: Persist directory to serve
+        host: Interface to listen on
+        port: Port to listen on (defaults to CHROMA_SERVER_PORT)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        host: str = "127.0.0.1",
+        port: Optional[int] = None,
+    ):
+        self.path = path
+        self.host = host
+        self.port = port or config.CHROMA_SERVER_PORT
+        self.url = f"http://{host}:{self.port}"
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    def start(self, timeout: float = 60) -> None:
+        """Start the server and wait until it answers its heartbeat."""
+        # 与当前解释器同一个 chromadb 版本（`chroma` 命令不一定在 PATH 上）
+        command = [
+            sys.executable, "-c", "from chromadb.cli.cli import app; app()",
+            "run", "--path", self.path, "--host", self.host, "--port", str(self.port),
+        ]  # fmt: skip
+        # 端口上已有服务（例如上次没退出的 Chroma）时，心跳会由它应答
+        with socket.socket() as sock:
+            if sock.connect_ex((self.host, self.port)) == 0:
+                raise RuntimeError(f"❌ 端口已被占用，无法启动 Chroma 服务器: {self.url}")
+        self._process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                httpx.get(f"{self.url}/api/v2/heartbeat", timeout=1).raise_for_status()
+                if self._process.poll() is None:
+                    break
+            except httpx.HTTPError:
+                pass
+            if self._process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"❌ Chroma 服务器启动失败: {self.url}")
+            time.sleep(0.1)
+        logger.info(f"✅ Chroma 服务器已启动: {self.url} ({self.path})")
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+
+    def __enter__(self) -> "ChromaServer":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
@@ -0,0 +1,108 @@
+"""File parsing and chunking stage of the indexer.
+
+Each file is read and split independently, so the work can run serially or
+on a process pool; both paths produce identical nodes, IDs and metadata.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Iterator, List, Tuple
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.schema import BaseNode, MetadataMode, NodeRelationship
+
+from index_manifest import chunk_ids, hash_text
+
+# 导入时额外写入、供检索过滤的元数据（不参与 embedding 和 LLM 文本）
+FILTER_METADATA_KEYS = ("doc_type", "mtime")
+
+
+def filter_metadata(path: str) -> dict:
+    """Metadata stored with every chunk of a file for filtered retrieval.
+
+    Returns:
+        {"doc_type": extension without the dot, "mtime": modification time
+        in epoch seconds}
+    """
+    extension = os.path.splitext(path)[1]
+    return {
+        "doc_type": extension[1:].lower() or "unknown",
+        "mtime": os.path.getmtime(path),
+    }
+
+
+def assign_node_ids(nodes: List[BaseNode], ids: List[str]) -> None:
+    """Replace random node IDs with content-derived ones, fixing links."""
+    id_map = {node.node_id: new_id for node, new_id in zip(nodes, ids)}
+    for node in nodes:
+        node.id_ = id_map[node.node_id]
+        for relation in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+            related = node.relationships.get(relation)
+            if related is not None and related.node_id in id_map:
+                related.node_id = id_map[related.node_id]
+
+
+def split_file(
+    path: str, chunk_size: int, chunk_overlap: int
+) -> Tuple[str, List[BaseNode], List[str]]:
+    """Read one file and split it into nodes with deterministic IDs.
+
+    Args:
+        path: File to read
+        chunk_size: Chunk size for `SentenceSplitter`
+        chunk_overlap: Chunk overlap for `SentenceSplitter`
+
+    Returns:
+        (path, nodes, chunk_hashes); files without content give no nodes.
+    """
+    documents = SimpleDirectoryReader(
+        input_files=[path], filename_as_id=True
+    ).load_data()
+    extra = filter_metadata(path)
+    for document in documents:
+        document.metadata.update(extra)
+        # 不进入 embedding 文本，块哈希和 ID 与之前一致
+        document.excluded_embed_metadata_keys.extend(FILTER_METADATA_KEYS)
+        document.excluded_llm_metadata_keys.extend(FILTER_METADATA_KEYS)
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = splitter.get_nodes_from_documents(documents)
+    hashes = [hash_text(n.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes]
+    assign_node_ids(nodes, chunk_ids(path, hashes))
+    return path, nodes, hashes
+
+
+def iter_split_files(
+    paths: List[str], chunk_size: int, chunk_overlap: int, workers: int = 1
+) -> Iterator[Tuple[str, List[BaseNode], List[str]]]:
+    """Split files lazily, in input order.
+
+    With `workers > 1` files are parsed on a process pool. At most
+    `workers * 2` files are in flight, so memory stays bounded and results
+    are yielded in the same order as the serial path.
+
+    Args:
+        paths: Files to read
+        chunk_size: Chunk size for `SentenceSplitter`
+        chunk_overlap: Chunk overlap for `SentenceSplitter`
+        workers: Number of worker processes (1 runs in-process)
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield split_file(path, chunk_size, chunk_overlap)
+        return
+
+    pending: Deque = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for path in paths:
+                pending.append(pool.submit(split_file, path, chunk_size, chunk_overlap))
+                # 有序有界队列：按提交顺序交给 embedding 阶段
+                while len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
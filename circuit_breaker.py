@@ -0,0 +1,113 @@
+"""Circuit breaker for remote dependencies (e.g. the TEI rerank service)."""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a background health probe.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    callers skip the dependency immediately. While open, a daemon thread
+    calls `probe` every `probe_interval` seconds and closes the circuit as
+    soon as it returns True.
+
+    Args:
+        probe: Callable returning True when the dependency is healthy
+        failure_threshold: Consecutive failures that open the circuit
+        probe_interval: Seconds between health probes while open
+        name: Dependency name used in log messages
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], bool],
+        failure_threshold: int = 5,
+        probe_interval: float = 10.0,
+        name: str = "service",
+    ):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+        self._failures = 0
+        self._open = False
+        self._opened_at = 0.0
+
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted (False while the circuit is open)."""
+        with self._lock:
+            if self._open:
+                self.rejected += 1
+                return False
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            should_open = self._failures >= self.failure_threshold
+        if should_open:
+            self.trip()
+
+    def trip(self) -> None:
+        """Open the circuit and start probing for recovery."""
+        with self._lock:
+            if self._open:
+                return
+            self._open = True
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name=f"{self.name}-probe", daemon=True
+            )
+            self._probe_thread.start()
+        logger.warning(
+            f"🔌 {self.name} 熔断开启：连续失败 {self._failures} 次，"
+            f"每 {self.probe_interval:.0f} 秒探测一次"
+        )
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.probe_interval):
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    self._open = False
+                    self._failures = 0
+                    downtime = time.monotonic() - self._opened_at
+                logger.info(f"✅ {self.name} 已恢复，熔断关闭 (中断 {downtime:.1f} 秒)")
+                return
+
+    def stop(self) -> None:
+        """Stop the background probe (on shutdown)."""
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": "open" if self._open else "closed",
+                "consecutive_failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,146 @@
+"""Pool of per-collection query engines for multi-tenant serving."""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chroma 的集合命名规则：3-63 个字符，字母数字开头结尾，中间允许 . _ -
+_COLLECTION_NAME_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]$")
+
+
+class CollectionNotFoundError(RuntimeError):
+    """The requested collection has not been indexed."""
+
+
+class InvalidCollectionNameError(ValueError):
+    """The collection name is not a valid Chroma collection name."""
+
+
+def validate_collection_name(name: str) -> str:
+    """Return `name` if it is a valid collection name.
+
+    Raises:
+        InvalidCollectionNameError: If the name is not valid.
+    """
+    if not _COLLECTION_NAME_RE.match(name) or ".." in name:
+        raise InvalidCollectionNameError(f"❌ 非法的集合名: {name!r}")
+    return name
+
+
+class EnginePool:
+    """LRU pool of objects built lazily per collection name.
+
+    The first request for a collection builds its engine with `factory`;
+    later requests reuse it. Beyond `max_size` engines the least recently
+    used one is dropped, as is any engine unused for `idle_ttl` seconds.
+    Concurrent first requests for the same collection build it only once.
+
+    Args:
+        factory: Callable building the engine for a collection name
+        max_size: Maximum number of pooled engines
+        idle_ttl: Seconds after which an unused engine is dropped, or None
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        max_size: int = 16,
+        idle_ttl: Optional[float] = None,
+    ):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+
+        # 集合名 -> [引擎, 最近使用时间]，按最近使用排序
+        self._engines: "OrderedDict[str, List]" = OrderedDict()
+        self._building: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self, now: float) -> None:
+        """Drop idle engines and the least recently used ones over capacity."""
+        while self._engines:
+            name, (_, last_used) = next(iter(self._engines.items()))
+            idle = self.idle_ttl is not None and now - last_used > self.idle_ttl
+            if not idle and len(self._engines) <= self.max_size:
+                break
+            self._engines.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"♻️  释放集合 '{name}' 的查询引擎" + (" (空闲)" if idle else ""))
+
+    def _lookup(self, name: str) -> Optional[Any]:
+        """Return a pooled engine and mark it as used (caller holds the lock)."""
+        now = time.monotonic()
+        self._evict(now)
+        entry = self._engines.get(name)
+        if entry is None:
+            return None
+        entry[1] = now
+        self._engines.move_to_end(name)
+        self.hits += 1
+        return entry[0]
+
+    def get(self, name: str) -> Any:
+        """Return the engine for `name`, building it on first use."""
+        with self._lock:
+            engine = self._lookup(name)
+            if engine is not None:
+                return engine
+            build_lock = self._building.setdefault(name, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                engine = self._lookup(name)
+                if engine is not None:
+                    return engine
+
+            try:
+                engine = self.factory(name)
+            except Exception:
+                with self._lock:
+                    self._building.pop(name, None)
+                raise
+
+            with self._lock:
+                self.misses += 1
+                self._engines[name] = [engine, time.monotonic()]
+                self._building.pop(name, None)
+                self._evict(time.monotonic())
+            logger.info(f"✅ 已加载集合 '{name}' 的查询引擎")
+            return engine
+
+    async def aget(self, name: str) -> Any:
+        """Async `get`; building a new engine runs in a worker thread."""
+        with self._lock:
+            engine = self._lookup(name)
+        if engine is not None:
+            return engine
+        return await asyncio.to_thread(self.get, name)
+
+    def values(self) -> List[Any]:
+        """Currently pooled engines, least recently used first."""
+        with self._lock:
+            return [engine for engine, _ in self._engines.values()]
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and the pooled collection names."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._engines),
+                "max_size": self.max_size,
+                "collections": list(self._engines),
+            }
@@ -8,30 +8,119 @@ load_dotenv()
 
 # API Keys
 ZHIPUAI_API_KEY = os.getenv("ZHIPUAI_API_KEY")
+ZHIPUAI_BASE_URL = os.getenv(
+    "ZHIPUAI_BASE_URL", "https://open.bigmodel.cn/api/paas/v4"
+)  # 可指向本地 stub 服务做压测
 
 # Model Configuration
 LLM_MODEL = "glm-4-plus"
 EMBEDDING_MODEL = "embedding-2"
 
+# Embedding Cache Configuration
+USE_EMBEDDING_CACHE = True  # 是否缓存 embedding（查询与文档块）
+EMBEDDING_CACHE_PATH = "./embedding_cache.db"  # 磁盘缓存文件（与 chroma_db 同级）
+EMBEDDING_CACHE_MEMORY_SIZE = 10_000  # 内存 LRU 条目数
+EMBEDDING_CACHE_DISK_SIZE = 1_000_000  # 磁盘缓存条目数上限
+EMBEDDING_CACHE_TTL = 30 * 24 * 3600  # 过期时间（秒），None 表示永不过期
+
 # Rerank Configuration
 USE_RERANK = False  # 是否启用 rerank
+RERANK_BACKEND = "tei"  # "tei": 调用 TEI 服务；"local": 进程内 cross-encoder（需要 sentence-transformers）
 RERANK_API_URL = "http://localhost:9999"  # TEI rerank API 地址
 RERANK_TOP_N = 3  # rerank 后返回的文档数量
-RERANK_TIMEOUT = 30  # API 请求超时时间（秒）
+RERANK_TIMEOUT = 5  # 单次 rerank 的截止时间（秒，包含重试）
+RERANK_MAX_RETRIES = 2  # 连接错误 / 超时 / 429 / 5xx 的重试次数（带随机抖动）
+RERANK_CIRCUIT_FAILURES = 5  # 连续失败多少次后熔断，直接跳过 rerank
+RERANK_PROBE_INTERVAL = 10  # 熔断期间探测 /health 的间隔（秒）
+USE_RERANK_CACHE = True  # 缓存 (问题, 文档块) 的 rerank 分数，只把未缓存的文本发给 TEI
+RERANK_CACHE_SIZE = 100_000  # 最大缓存条目数（LRU 淘汰）
+RERANK_CACHE_TTL = 24 * 3600  # 过期时间（秒），None 表示永不过期
+LOCAL_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # 本地 cross-encoder 模型
+LOCAL_RERANK_DEVICE = "cpu"  # 本地模型运行设备
+LOCAL_RERANK_BATCH_SIZE = 16  # 每次前向计算的 (问题, 文档块) 对数（按长度分桶）
+LOCAL_RERANK_MAX_LENGTH = 512  # 每对文本的最大 token 数
+LOCAL_RERANK_WORKERS = 2  # 推理线程池大小（限制并发推理占用的 CPU）
+RERANK_LOCAL_FALLBACK = False  # TEI 不可用时改用本地 cross-encoder
+
+# Context Compression Configuration（rerank 之后、生成答案之前）
+USE_CONTEXT_COMPRESSION = False  # 只保留与问题最相似的句子，缩短 LLM prompt（开启前先用真实模型评测）
+CONTEXT_TOKEN_BUDGET = 512  # 传给 LLM 的文档块文本 token 上限
+CONTEXT_DEDUP_THRESHOLD = 0.95  # 句子余弦相似度达到该值视为重复，只保留一句
+CONTEXT_NEIGHBOR_WEIGHT = 0.9  # 相邻句子分数的权重（答案常在最相似句子的前后句）
+
+# Async HTTP Configuration
+HTTP_MAX_CONNECTIONS = 100  # 异步 HTTP 连接池大小（LLM / rerank 共用上限）
+EMBEDDING_TIMEOUT = 30  # 单次 embedding 请求的超时（秒）；微批中一个请求卡住会拖住整批查询
+
+# Micro-batching Configuration（并发查询合并上游调用）
+USE_MICRO_BATCHING = True  # 合并并发请求的查询 embedding 和 rerank 调用
+MICRO_BATCH_MAX_SIZE = 16  # 每次 embedding 调用最多合并的问题数
+RERANK_MICRO_BATCH_MAX_SIZE = 32  # 每次 rerank 调用最多的 (问题, 文档块) 对数（TEI 默认上限 32）
+MICRO_BATCH_MAX_WAIT_MS = 5  # 等待凑批的最长时间（毫秒），即额外延迟上限
+
+# Indexing Pipeline Configuration
+EMBED_BATCH_SIZE = 10  # 每个 embedding 批次的文本数（批次是并发调度单位）
+EMBED_MAX_IN_FLIGHT = 8  # 同时进行的 embedding 批次上限
+EMBED_MAX_RETRIES = 6  # 限流 / 临时错误的最大重试次数（指数退避）
+CHROMA_WRITE_BATCH_SIZE = 1000  # 每次批量写入 Chroma 的节点数
+INDEX_WORKERS = 1  # 解析和切分文档的进程数（CPU 密集，可设为 CPU 核数）
+STREAM_WINDOW_SIZE = 2000  # 流式索引每个窗口的块数（决定峰值内存和检查点粒度）
+
+# Batch Query Configuration（/query/batch 与 QueryService.query_many）
+QUERY_BATCH_CONCURRENCY = 8  # 同时进行的 LLM 合成调用数
+QUERY_BATCH_MAX_CONCURRENCY = 64  # 请求可指定的最大并发
+QUERY_BATCH_WAVE_SIZE = 64  # 每波一起 embedding、检索、rerank 的问题数
+QUERY_BATCH_MAX_QUESTIONS = 10_000  # 单个批量请求的最大问题数
+
+# Semantic Cache Configuration
+USE_SEMANTIC_CACHE = True  # 相似问题直接返回缓存答案
+SEMANTIC_CACHE_THRESHOLD = 0.95  # 余弦相似度阈值（越高越严格）
+SEMANTIC_CACHE_MAX_SIZE = 10_000  # 最大缓存条目数
+SEMANTIC_CACHE_TTL = 3600  # 过期时间（秒），None 表示永不过期
 
 # Vector Database Configuration
-VECTOR_DB_TYPE = "chroma"  # 可选: chroma, qdrant, milvus
+VECTOR_DB_TYPE = "chroma"  # 可选: chroma，或 mmap（indexer 从 Chroma 导出的只读量化索引）
+MMAP_QUANTIZATION = "int8"  # mmap 索引粗排向量的精度: int8（float32 的 1/4）或 float16（1/2）
+MMAP_RESCORE_FACTOR = 4  # 粗排保留 top_k × 该倍数个候选，再用 float32 向量精确重排
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR")  # 副本从该目录导入 indexer 导出的快照
 CHROMA_PERSIST_DIR = "./chroma_db"
-COLLECTION_NAME = "documents"
+CHROMA_SERVER_URL = os.getenv("CHROMA_SERVER_URL")  # 设置后经 HTTP 连接 Chroma 服务器，不直接打开本地库
+CHROMA_SERVER_PORT = 8001  # 多 worker 且未设置 CHROMA_SERVER_URL 时，自动启动的本地 Chroma 服务器端口
+COLLECTION_NAME = "documents"  # 默认集合；多租户请求可通过 collection 参数指定其他集合
+COLLECTION_POOL_SIZE = 16  # 同时保留查询引擎的集合数（LRU 淘汰最久未用的集合）
+COLLECTION_IDLE_TTL = 1800  # 集合空闲多少秒后释放其查询引擎和语义缓存，None 表示不释放
 
 # Data Configuration
 DATA_DIR = "./data"
 
 # Retrieval Configuration
-SIMILARITY_TOP_K = 10  # 初始检索数量（rerank 前，建议增大到 10-20）
+SIMILARITY_TOP_K = 5  # 向量检索数量（混合检索时 BM25 候选补充召回，可以较小）
+USE_HYBRID_SEARCH = True  # 向量检索 + BM25 关键词检索，倒数排名融合（RRF）
+LEXICAL_TOP_K = 20  # BM25 候选数量（本地 SQLite 倒排索引，开销很小）
+HYBRID_TOP_K = 10  # 融合后交给 rerank 的候选数量
+RRF_K = 60  # RRF 排名常数：score = Σ 1 / (RRF_K + 排名)
+BM25_K1 = 1.2  # BM25 词频饱和参数
+BM25_B = 0.75  # BM25 文档长度归一化参数
+BM25_MAX_DF_RATIO = 0.5  # 出现在超过该比例文档中的查询词（the、的）不参与检索，1 表示不跳过
+USE_ADAPTIVE_RETRIEVAL = False  # 按分数分布逐个问题决定检索深度和 rerank 候选数
+ADAPTIVE_INITIAL_TOP_K = 3  # 首次向量检索数量；分数分布平坦时扩展到 SIMILARITY_TOP_K
+ADAPTIVE_CONFIDENT_MARGIN = 0.15  # 第一名比第二名高出的相对幅度达到该值时跳过 rerank
+ADAPTIVE_FLAT_SPREAD = 0.05  # 首次检索的分数相对差距低于该值视为平坦，扩展检索
+ADAPTIVE_TRIM_GAP = 0.3  # 比同一列表最高分低超过该比例的候选不送 rerank
+MAX_QUERY_TOP_K = 50  # 请求可指定的最大 top_k（/query 的 top_k 参数）
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
+# Metrics Configuration（/metrics 端点，Prometheus 文本格式）
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)  # 耗时直方图的桶上界（秒）
+METRICS_DIR = os.getenv("METRICS_DIR")  # 多 worker 共享的指标快照目录（api.serve 自动创建）
+METRICS_SNAPSHOT_INTERVAL = 5  # worker 写入指标快照的间隔（秒），/metrics 最多滞后这么久
+
 # Service Configuration
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+BACKGROUND_STARTUP = True  # 端口先开始服务，查询服务在后台加载和预热（/readyz 就绪后再接流量）
+API_WORKERS = 1  # worker 进程数；大于 1 时各 worker 共享一个 Chroma 服务器（建议不超过 CPU 核数）
+API_RELOAD = False  # 代码变更时自动重启（仅开发时使用，只支持单 worker）
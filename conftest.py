@@ -0,0 +1,109 @@
+"""Shared test fixtures: fake models and helpers used by several test modules."""
+
+import socket
+from typing import List
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+
+from benchmarks.stub_servers import fake_embedding
+
+
+class BagOfWordsEmbedding(MockEmbedding):
+    """Mock embedding model under which texts sharing words are similar."""
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return fake_embedding(query, self.embed_dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return fake_embedding(text, self.embed_dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return fake_embedding(query, self.embed_dim)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return fake_embedding(text, self.embed_dim)
+
+
+@pytest.fixture
+def bag_of_words_embedding() -> BagOfWordsEmbedding:
+    """Deterministic 256-dimensional embedding model (no API calls)."""
+    return BagOfWordsEmbedding(embed_dim=256)
+
+
+@pytest.fixture
+def free_port() -> int:
+    """A local TCP port that is free right now."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def make_indexer(tmp_path, monkeypatch, bag_of_words_embedding):
+    """Build `DocumentIndexer`s over a scratch Chroma DB with a fake embedding.
+
+    Returns a function taking the data directory.
+    """
+    import config
+    from indexer import DocumentIndexer
+
+    monkeypatch.setattr(config, "ZHIPUAI_API_KEY", "test-api-key")
+    monkeypatch.setattr(config, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(config, "CHROMA_SERVER_URL", None)
+    monkeypatch.setattr(config, "USE_EMBEDDING_CACHE", False)
+    monkeypatch.setattr(config, "USE_HYBRID_SEARCH", True)
+    monkeypatch.setattr(config, "VECTOR_DB_TYPE", "chroma")
+
+    def make(data_dir) -> DocumentIndexer:
+        indexer = DocumentIndexer(data_dir=str(data_dir))
+        indexer.embed_model = bag_of_words_embedding
+        return indexer
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def stub_servers():
+    """ZhipuAI and TEI stand-ins (see `benchmarks.stub_servers`), one per run."""
+    from benchmarks.stub_servers import StubServers
+
+    with StubServers(llm_latency=0.0, embed_latency=0.0, rerank_latency=0.0) as stubs:
+        yield stubs
+
+
+@pytest.fixture
+def make_stub_service(stub_servers, tmp_path, monkeypatch):
+    """Index a directory and start a `QueryService` against the stub servers.
+
+    Returns a function taking the data directory and config overrides; the
+    configuration is restored after the test.
+    """
+    import config
+
+    # 记录原值，测试结束后由 monkeypatch 还原
+    for name in (
+        "ZHIPUAI_API_KEY",
+        "ZHIPUAI_BASE_URL",
+        "USE_RERANK",
+        "RERANK_API_URL",
+        "CHROMA_PERSIST_DIR",
+        "EMBEDDING_CACHE_PATH",
+        "USE_SEMANTIC_CACHE",
+    ):
+        monkeypatch.setattr(config, name, getattr(config, name))
+    monkeypatch.setenv("ZHIPUAI_BASE_URL", stub_servers.zhipu_url)
+    stub_servers.configure(str(tmp_path))
+    monkeypatch.setattr(config, "CHROMA_SERVER_URL", None)
+    monkeypatch.setattr(config, "INDEX_SNAPSHOT_DIR", None)
+
+    def make(data_dir, **overrides):
+        from indexer import DocumentIndexer
+        from query_service import QueryService
+
+        for name, value in overrides.items():
+            monkeypatch.setattr(config, name, value)
+        DocumentIndexer(data_dir=str(data_dir)).build_index()
+        return QueryService()
+
+    return make
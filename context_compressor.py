@@ -0,0 +1,235 @@
+"""Extractive context compression between rerank and synthesis.
+
+With ``response_mode="compact"`` every reranked chunk goes into the LLM
+prompt in full. `ContextCompressor` keeps only the sentences closest to the
+question, drops near-duplicate sentences (chunk overlap, repeated
+boilerplate) and stops at a token budget, so the prompt shrinks while the
+answer-bearing sentences stay.
+"""
+
+import logging
+import re
+from typing import Callable, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+
+from metrics import CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# 中文句末标点之后、英文句末标点后的空白处、以及空行处切分
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？；!?;])|(?<=[.!?])\s+|\n\s*\n")
+_CJK_END = "。！？；"
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences (Chinese and English punctuation)."""
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+
+
+def _join(sentences: List[str]) -> str:
+    text = ""
+    for sentence in sentences:
+        if text and not text.endswith(tuple(_CJK_END)):
+            text += " "
+        text += sentence
+    return text
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class ContextCompressor(BaseNodePostprocessor):
+    """Keep the sentences most similar to the query, within a token budget.
+
+    Sentences are embedded with the document embedding model (wrap it in
+    `CachedEmbedding` so popular chunks are embedded once); the query
+    embedding already on the `QueryBundle` is reused. Kept sentences stay in
+    their chunk and original order; chunks left without sentences are dropped.
+
+    Args:
+        embed_model: Embedding model for the sentences (and the query if the
+            bundle has no embedding)
+        token_budget: Maximum tokens of chunk text passed on to synthesis
+            (`compress` takes a per-call budget)
+        dedup_threshold: Cosine similarity at which a sentence counts as a
+            duplicate of one already kept
+        neighbor_weight: A sentence scores at least this fraction of its
+            neighbours' scores in the same chunk (0 scores sentences alone)
+        tokenizer: Counts tokens; defaults to the tokenizer llama_index uses
+            to pack prompts
+    """
+
+    token_budget: int = 512
+    dedup_threshold: float = 0.95
+    neighbor_weight: float = 0.9
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _tokenizer: Callable[[str], list] = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        token_budget: int = 512,
+        dedup_threshold: float = 0.95,
+        neighbor_weight: float = 0.9,
+        tokenizer: Optional[Callable[[str], list]] = None,
+        **kwargs,
+    ):
+        super().__init__(
+            token_budget=token_budget,
+            dedup_threshold=dedup_threshold,
+            neighbor_weight=neighbor_weight,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._tokenizer = tokenizer or get_tokenizer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextCompressor"
+
+    def _split(self, nodes: List[NodeWithScore]):
+        """(node index, sentence) pairs of all nodes."""
+        return [
+            (i, sentence)
+            for i, node in enumerate(nodes)
+            for sentence in split_sentences(node.node.get_content())
+        ]
+
+    def _with_neighbors(self, scores: np.ndarray, owners: List[int]) -> np.ndarray:
+        """Raise each score to `neighbor_weight` x its best neighbour's score."""
+        # 答案常在最相似句子的前一句或后一句（"...World Wide Web. Robert Morris
+        # showed it to me..."），相邻句子跨块时不算
+        owners = np.asarray(owners)
+        boundary = owners[1:] != owners[:-1]
+        prev = np.r_[-np.inf, scores[:-1]]
+        prev[np.r_[True, boundary]] = -np.inf
+        following = np.r_[scores[1:], -np.inf]
+        following[np.r_[boundary, True]] = -np.inf
+        return np.maximum(scores, self.neighbor_weight * np.maximum(prev, following))
+
+    def _select(
+        self,
+        nodes: List[NodeWithScore],
+        pieces: list,
+        query_embedding: List[float],
+        embeddings: List[List[float]],
+        token_budget: int,
+    ) -> List[NodeWithScore]:
+        """Greedy selection by similarity, skipping duplicates and overruns."""
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        scores = vectors @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+        if self.neighbor_weight:
+            scores = self._with_neighbors(scores, [i for i, _ in pieces])
+        tokens = [len(self._tokenizer(sentence)) for _, sentence in pieces]
+
+        kept: List[int] = []
+        used = 0
+        for j in np.argsort(-scores, kind="stable").tolist():
+            if used + tokens[j] > token_budget:
+                # 放不下的长句跳过，继续尝试更短的句子
+                continue
+            if kept and (vectors[kept] @ vectors[j]).max() >= self.dedup_threshold:
+                # 与已保留的句子几乎相同（块重叠、重复段落）
+                continue
+            kept.append(j)
+            used += tokens[j]
+        CONTEXT_TOKENS.inc(sum(tokens), stage="retrieved")
+        CONTEXT_TOKENS.inc(used, stage="compressed")
+
+        by_node: dict = {}
+        for j in sorted(kept):
+            by_node.setdefault(pieces[j][0], []).append(j)
+        compressed = []
+        for i, node in enumerate(nodes):
+            if i not in by_node:
+                continue
+            sentences = [pieces[j][1] for j in by_node[i]]
+            if len(sentences) < sum(1 for owner, _ in pieces if owner == i):
+                copy = node.node.model_copy()
+                copy.set_content(_join(sentences))
+                node = NodeWithScore(node=copy, score=node.score)
+            compressed.append(node)
+        logger.debug(
+            f"🗜️  上下文压缩: {sum(tokens)} → {used} tokens, "
+            f"{len(nodes)} → {len(compressed)} 个块"
+        )
+        return compressed
+
+    def compress(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: QueryBundle,
+        token_budget: Optional[int] = None,
+    ) -> List[NodeWithScore]:
+        """Compress nodes for one query.
+
+        Args:
+            nodes: Reranked nodes
+            query_bundle: The query (its embedding is reused if set)
+            token_budget: Budget of this call (defaults to `token_budget`)
+        """
+        if not nodes:
+            return nodes
+        pieces = self._split(nodes)
+        if not pieces:
+            return nodes
+        query_embedding = query_bundle.embedding
+        if query_embedding is None:
+            query_embedding = self._embed_model.get_query_embedding(
+                query_bundle.query_str
+            )
+        embeddings = self._embed_model.get_text_embedding_batch(
+            [sentence for _, sentence in pieces]
+        )
+        budget = token_budget or self.token_budget
+        return self._select(nodes, pieces, query_embedding, embeddings, budget)
+
+    async def acompress(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: QueryBundle,
+        token_budget: Optional[int] = None,
+    ) -> List[NodeWithScore]:
+        """Async `compress`."""
+        if not nodes:
+            return nodes
+        pieces = self._split(nodes)
+        if not pieces:
+            return nodes
+        query_embedding = query_bundle.embedding
+        if query_embedding is None:
+            query_embedding = await self._embed_model.aget_query_embedding(
+                query_bundle.query_str
+            )
+        embeddings = await self._embed_model.aget_text_embedding_batch(
+            [sentence for _, sentence in pieces]
+        )
+        budget = token_budget or self.token_budget
+        return self._select(nodes, pieces, query_embedding, embeddings, budget)
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            return nodes
+        return self.compress(nodes, query_bundle)
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            return nodes
+        return await self.acompress(nodes, query_bundle)
@@ -0,0 +1,354 @@
+"""Persistent two-tier cache for embedding vectors."""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from metrics import record_cache
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys (NFKC, trimmed, collapsed whitespace).
+
+    Case is preserved: embedding models are case sensitive.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """In-memory LRU tier in front of an on-disk SQLite tier.
+
+    Keys are derived from the model name, the embedding kind (query / text) and
+    the normalized text. Vectors are stored on disk as float32 blobs. The async
+    methods check the memory tier inline and run SQLite in a worker thread, so
+    disk reads, commits and pruning never block the event loop.
+
+    Args:
+        path: SQLite file for the disk tier, or None for memory only
+        max_memory_entries: Capacity of the in-memory LRU tier
+        max_disk_entries: Capacity of the disk tier (oldest entries pruned first)
+        ttl: Entry lifetime in seconds, or None to never expire
+    """
+
+    _PRUNE_EVERY = 256  # 每写入多少条检查一次磁盘容量
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_memory_entries: int = 10_000,
+        max_disk_entries: int = 1_000_000,
+        ttl: Optional[float] = None,
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+
+        self._memory: "OrderedDict[str, Tuple[float, Embedding]]" = OrderedDict()
+        # 内存层与 SQLite 分开加锁：慢的磁盘操作不会挡住事件循环上的内存查找
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_created_at "
+                "ON embeddings (created_at)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        """Build the cache key for a piece of text."""
+        payload = f"{model_name}\x00{kind}\x00{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, vector: Embedding) -> None:
+        """Insert into the memory tier, evicting least recently used entries."""
+        self._memory[key] = (created_at, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(
+        self, keys: List[str], now: float
+    ) -> Tuple[Dict[str, Embedding], List[str]]:
+        """Vectors found in the memory tier, and the keys to look up on disk."""
+        found: Dict[str, Embedding] = {}
+        disk_keys = []
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry[1]
+                    self.memory_hits += 1
+                else:
+                    self._memory.pop(key, None)
+                    disk_keys.append(key)
+        return found, disk_keys
+
+    def _get_disk(self, keys: List[str], now: float) -> Dict[str, Embedding]:
+        """Vectors found in the disk tier (copied into the memory tier)."""
+        if self._db is None or not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT key, created_at, vector FROM embeddings "
+                f"WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+        found: Dict[str, Embedding] = {}
+        with self._lock:
+            for key, created_at, blob in rows:
+                if self._expired(created_at, now):
+                    continue
+                vector = array("f", blob).tolist()
+                self._remember(key, created_at, vector)
+                found[key] = vector
+                self.disk_hits += 1
+        return found
+
+    def _count_misses(self, misses: int) -> None:
+        with self._lock:
+            self.misses += misses
+
+    def get_many(self, keys: List[str]) -> Dict[str, Embedding]:
+        """Look up keys; returns only the ones found and not expired."""
+        now = time.time()
+        found, disk_keys = self._get_memory(keys, now)
+        found.update(self._get_disk(disk_keys, now))
+        self._count_misses(len(keys) - len(found))
+        return found
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Embedding]:
+        """Async `get_many`; the disk tier is read in a worker thread."""
+        now = time.time()
+        found, disk_keys = self._get_memory(keys, now)
+        if disk_keys and self._db is not None:
+            found.update(await asyncio.to_thread(self._get_disk, disk_keys, now))
+        self._count_misses(len(keys) - len(found))
+        return found
+
+    def _put_memory(self, items: Dict[str, Embedding], now: float) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, now, vector)
+
+    def _put_disk(self, items: Dict[str, Embedding], now: float) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, created_at, vector) "
+                "VALUES (?, ?, ?)",
+                [(k, now, array("f", v).tobytes()) for k, v in items.items()],
+            )
+            self._db.commit()
+            self._writes_since_prune += len(items)
+            if self._writes_since_prune >= self._PRUNE_EVERY:
+                self._prune()
+
+    def put_many(self, items: Dict[str, Embedding]) -> None:
+        """Store vectors in both tiers."""
+        if not items:
+            return
+        now = time.time()
+        self._put_memory(items, now)
+        self._put_disk(items, now)
+
+    async def aput_many(self, items: Dict[str, Embedding]) -> None:
+        """Async `put_many`; the disk tier is written in a worker thread."""
+        if not items:
+            return
+        now = time.time()
+        self._put_memory(items, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, items, now)
+
+    def _prune(self) -> None:
+        """Drop expired rows and the oldest rows beyond the disk capacity.
+
+        Called with `_db_lock` held.
+        """
+        self._writes_since_prune = 0
+        if self.ttl is not None:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_disk_entries:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+        self._db.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and tier sizes."""
+        disk_entries = None
+        with self._db_lock:
+            if self._db is not None:
+                (disk_entries,) = self._db.execute(
+                    "SELECT COUNT(*) FROM embeddings"
+                ).fetchone()
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+                if lookups
+                else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self) -> None:
+        """Close the disk tier."""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves repeated texts from an EmbeddingCache.
+
+    Only cache misses reach the wrapped model; batch calls send the missing
+    texts in a single batch.
+
+    Args:
+        embed_model: The embedding model to wrap (e.g. ZhipuAIEmbedding)
+        cache: Cache shared by queries and document chunks
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache):
+        """Initialize the cached embedding wrapper."""
+        super().__init__(
+            model_name=getattr(embed_model, "model", None) or embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """The underlying embedding cache."""
+        return self._cache
+
+    def _split(
+        self, kind: str, texts: List[str]
+    ) -> Tuple[List[str], Dict[str, Embedding], List[int]]:
+        """Return keys, cached vectors and the indexes of uncached texts."""
+        keys = [self._cache.make_key(self.model_name, kind, t) for t in texts]
+        return self._missing(keys, self._cache.get_many(keys))
+
+    async def _asplit(
+        self, kind: str, texts: List[str]
+    ) -> Tuple[List[str], Dict[str, Embedding], List[int]]:
+        """Async `_split` (the disk tier is read off the event loop)."""
+        keys = [self._cache.make_key(self.model_name, kind, t) for t in texts]
+        return self._missing(keys, await self._cache.aget_many(keys))
+
+    @staticmethod
+    def _missing(
+        keys: List[str], found: Dict[str, Embedding]
+    ) -> Tuple[List[str], Dict[str, Embedding], List[int]]:
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        record_cache("embedding", hits=len(found), misses=len(missing))
+        return keys, found, missing
+
+    def _merge(
+        self,
+        keys: List[str],
+        found: Dict[str, Embedding],
+        missing: List[int],
+        fresh: List[Embedding],
+    ) -> List[Embedding]:
+        new_items = {keys[i]: vector for i, vector in zip(missing, fresh)}
+        self._cache.put_many(new_items)
+        found.update(new_items)
+        return [found[key] for key in keys]
+
+    async def _amerge(
+        self,
+        keys: List[str],
+        found: Dict[str, Embedding],
+        missing: List[int],
+        fresh: List[Embedding],
+    ) -> List[Embedding]:
+        """Async `_merge` (the disk tier is written off the event loop)."""
+        new_items = {keys[i]: vector for i, vector in zip(missing, fresh)}
+        await self._cache.aput_many(new_items)
+        found.update(new_items)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = self._split("query", [query])
+        if not missing:
+            return found[keys[0]]
+        fresh = [self._embed_model._get_query_embedding(query)]
+        return self._merge(keys, found, missing, fresh)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, found, missing = await self._asplit("query", [query])
+        if not missing:
+            return found[keys[0]]
+        fresh = [await self._embed_model._aget_query_embedding(query)]
+        return (await self._amerge(keys, found, missing, fresh))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = self._split("text", texts)
+        fresh = []
+        if missing:
+            fresh = self._embed_model._get_text_embeddings([texts[i] for i in missing])
+        return self._merge(keys, found, missing, fresh)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found, missing = await self._asplit("text", texts)
+        fresh = []
+        if missing:
+            fresh = await self._embed_model._aget_text_embeddings(
+                [texts[i] for i in missing]
+            )
+        return await self._amerge(keys, found, missing, fresh)
@@ -0,0 +1,207 @@
+"""Batched, concurrent embedding stage for index builds."""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, List, Optional
+
+import httpx
+import zhipuai
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tqdm_iterable
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# 连接错误 / 超时没有状态码
+_RETRYABLE_ERRORS = (
+    zhipuai.APIConnectionError,
+    zhipuai.APITimeoutError,
+    httpx.TransportError,
+)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an SDK/httpx error, if it carries one."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, if the server sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    return isinstance(error, _RETRYABLE_ERRORS)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of up to `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingPipeline:
+    """Embed nodes in batches with bounded concurrency and bulk-write them.
+
+    Batches are embedded on a thread pool with at most `max_in_flight` batches
+    in flight. Results are consumed in submission order and written to the
+    vector store in bulk `add` calls of `write_batch_size` nodes.
+
+    Rate limiting (HTTP 429) and transient errors are retried with exponential
+    backoff and jitter; a 429 pauses every worker, not only the one that hit it.
+
+    Args:
+        embed_model: Embedding model used for document chunks
+        vector_store: Destination vector store
+        batch_size: Number of texts per embedding batch
+        max_in_flight: Maximum number of batches embedded concurrently
+        write_batch_size: Number of nodes per vector store `add` call
+        max_retries: Retries per batch before giving up
+        backoff_base: Initial backoff in seconds (doubled per retry)
+        backoff_max: Upper bound of a single backoff in seconds
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        vector_store: BasePydanticVectorStore,
+        batch_size: int = 32,
+        max_in_flight: int = 8,
+        write_batch_size: int = 1000,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.write_batch_size = write_batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._cooldown_until = 0.0
+        self.retries = 0
+
+    def _wait_for_cooldown(self) -> None:
+        """Block while a rate-limit cooldown is active."""
+        while True:
+            with self._lock:
+                delay = self._cooldown_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _embed_batch(self, nodes: List[BaseNode]) -> List[BaseNode]:
+        """Embed one batch, retrying rate limits and transient errors."""
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        attempt = 0
+        while True:
+            self._wait_for_cooldown()
+            try:
+                embeddings = self.embed_model.get_text_embedding_batch(texts)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_after(e) or min(
+                    self.backoff_max, self.backoff_base * 2**attempt
+                )
+                delay *= 1 + random.random() * 0.25  # 抖动，避免所有 worker 同时重试
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                    if _status_code(e) == 429:
+                        self._cooldown_until = max(
+                            self._cooldown_until, time.monotonic() + delay
+                        )
+                logger.warning(
+                    f"⚠️  Embedding 请求失败 ({e})，{delay:.1f} 秒后第 {attempt} 次重试"
+                )
+                time.sleep(delay)
+
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        return nodes
+
+    def run(
+        self,
+        nodes: Iterable[BaseNode],
+        total: Optional[int] = None,
+        show_progress: bool = False,
+    ) -> dict:
+        """Embed and store nodes; returns throughput statistics.
+
+        Args:
+            nodes: Nodes to embed (consumed lazily)
+            total: Number of nodes, used only for the progress bar
+            show_progress: Whether to show a progress bar
+        """
+        start = time.perf_counter()
+        written = 0
+        buffer: List[BaseNode] = []
+        pending: Deque[Future] = deque()
+
+        def collect(batch: List[BaseNode]) -> None:
+            nonlocal written
+            buffer.extend(batch)
+            if len(buffer) >= self.write_batch_size:
+                self.vector_store.add(buffer)
+                written += len(buffer)
+                buffer.clear()
+
+        batches = batched(nodes, self.batch_size)
+        if show_progress:
+            batches = get_tqdm_iterable(batches, True, "Generating embeddings")
+            if total is not None and hasattr(batches, "total"):
+                batches.total = -(-total // self.batch_size)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            try:
+                for batch in batches:
+                    pending.append(pool.submit(self._embed_batch, batch))
+                    # 有界队列：按提交顺序取回结果，控制内存占用
+                    while len(pending) >= self.max_in_flight * 2:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        if buffer:
+            self.vector_store.add(buffer)
+            written += len(buffer)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "chunks": written,
+            "retries": self.retries,
+            "elapsed_s": elapsed,
+            "chunks_per_s": written / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,201 @@
+"""Hybrid retrieval: dense vector search fused with BM25 via reciprocal-rank fusion."""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+)
+
+from bm25_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+LexicalTrim = Callable[[List[Tuple[str, float]]], List[Tuple[str, float]]]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank).
+
+    Only ranks are used, so dense and BM25 scores never need to be on the
+    same scale.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, 1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing dense and BM25 candidates with reciprocal-rank fusion.
+
+    BM25 candidates are looked up in a local SQLite index; the ones the dense
+    retriever did not return are loaded from the vector store by ID. With
+    `filters`, the load applies them too, so BM25 candidates outside the
+    filter are dropped like the dense ones.
+
+    Args:
+        vector_retriever: Dense retriever (e.g. `index.as_retriever(...)`)
+        lexical_index: BM25 index over the same chunks
+        vector_store: Vector store used to load BM25-only candidates
+        lexical_top_k: Number of BM25 candidates
+        top_k: Number of fused nodes returned to the postprocessors
+        rrf_k: RRF rank constant (larger values flatten the rank weights)
+        filters: Metadata filters of the dense retriever, if any
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        lexical_index: BM25Index,
+        vector_store: BasePydanticVectorStore,
+        lexical_top_k: int = 20,
+        top_k: int = 10,
+        rrf_k: int = 60,
+        filters: Optional[MetadataFilters] = None,
+    ):
+        super().__init__(callback_manager=vector_retriever.callback_manager)
+        self._vector_retriever = vector_retriever
+        self._lexical_index = lexical_index
+        self._vector_store = vector_store
+        self._lexical_top_k = lexical_top_k
+        self._top_k = top_k
+        self._rrf_k = rrf_k
+        self._filters = filters
+
+    def _missing_ids(
+        self, dense: List[NodeWithScore], lexical: List[Tuple[str, float]]
+    ) -> List[str]:
+        dense_ids = {n.node.node_id for n in dense}
+        return [node_id for node_id, _ in lexical if node_id not in dense_ids]
+
+    def _load(self, node_ids: List[str]) -> Dict[str, BaseNode]:
+        """Load BM25-only candidates (those matching the filters) by ID."""
+        if not node_ids:
+            return {}
+        nodes = self._vector_store.get_nodes(node_ids=node_ids, filters=self._filters)
+        return {node.node_id: node for node in nodes}
+
+    def _fuse(
+        self,
+        dense: List[NodeWithScore],
+        lexical: List[Tuple[str, float]],
+        loaded: Dict[str, BaseNode],
+    ) -> List[NodeWithScore]:
+        """Merge both candidate lists; the fused score replaces the original."""
+        nodes = dict(loaded)
+        nodes.update({n.node.node_id: n.node for n in dense})
+        fused = reciprocal_rank_fusion(
+            [[n.node.node_id for n in dense], [node_id for node_id, _ in lexical]],
+            k=self._rrf_k,
+        )
+        # BM25 索引可能比向量库新（例如索引更新中），找不到的块直接跳过
+        results = [
+            NodeWithScore(node=nodes[node_id], score=score)
+            for node_id, score in fused
+            if node_id in nodes
+        ][: self._top_k]
+
+        logger.debug(
+            f"🔀 混合检索: 向量 {len(dense)} + BM25 {len(lexical)} → {len(results)} 个候选"
+        )
+        return results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = self._vector_retriever.retrieve(query_bundle)
+        lexical = self._lexical_index.search(
+            query_bundle.query_str, self._lexical_top_k
+        )
+        return self._fuse(dense, lexical, self._load(self._missing_ids(dense, lexical)))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # BM25 查询在线程中与向量检索并行执行
+        dense, lexical = await asyncio.gather(
+            self._vector_retriever.aretrieve(query_bundle),
+            asyncio.to_thread(
+                self._lexical_index.search, query_bundle.query_str, self._lexical_top_k
+            ),
+        )
+        return (await self._afuse([dense], [lexical]))[0]
+
+    def _search_lexical(
+        self,
+        query_bundles: List[QueryBundle],
+        lexical_trim: Optional[LexicalTrim],
+    ) -> List[List[Tuple[str, float]]]:
+        results = [
+            self._lexical_index.search(qb.query_str, self._lexical_top_k)
+            for qb in query_bundles
+        ]
+        if lexical_trim is not None:
+            results = [lexical_trim(lexical) for lexical in results]
+        return results
+
+    def _missing_many(
+        self,
+        dense_results: List[List[NodeWithScore]],
+        lexical_results: List[List[Tuple[str, float]]],
+    ) -> List[str]:
+        return sorted(
+            {
+                node_id
+                for dense, lexical in zip(dense_results, lexical_results)
+                for node_id in self._missing_ids(dense, lexical)
+            }
+        )
+
+    def fuse_many(
+        self,
+        query_bundles: List[QueryBundle],
+        dense_results: List[List[NodeWithScore]],
+        lexical_trim: Optional[LexicalTrim] = None,
+    ) -> List[List[NodeWithScore]]:
+        """Fuse precomputed dense results with BM25 for several queries.
+
+        Used when the dense results come from one Chroma call (batch queries)
+        or were already inspected (adaptive retrieval depth).
+
+        Args:
+            query_bundles: The queries
+            dense_results: Dense candidates of each query
+            lexical_trim: Applied to each query's BM25 (node ID, score) list
+                before fusion
+        """
+        lexical_results = self._search_lexical(query_bundles, lexical_trim)
+        loaded = self._load(self._missing_many(dense_results, lexical_results))
+        return [
+            self._fuse(dense, lexical, loaded)
+            for dense, lexical in zip(dense_results, lexical_results)
+        ]
+
+    async def afuse_many(
+        self,
+        query_bundles: List[QueryBundle],
+        dense_results: List[List[NodeWithScore]],
+        lexical_trim: Optional[LexicalTrim] = None,
+    ) -> List[List[NodeWithScore]]:
+        """Async `fuse_many`."""
+        lexical_results = await asyncio.to_thread(
+            self._search_lexical, query_bundles, lexical_trim
+        )
+        return await self._afuse(dense_results, lexical_results)
+
+    async def _afuse(
+        self,
+        dense_results: List[List[NodeWithScore]],
+        lexical_results: List[List[Tuple[str, float]]],
+    ) -> List[List[NodeWithScore]]:
+        """Fuse per-query results; BM25-only candidates are loaded in one read."""
+        missing = self._missing_many(dense_results, lexical_results)
+        loaded = await asyncio.to_thread(self._load, missing) if missing else {}
+        return [
+            self._fuse(dense, lexical, loaded)
+            for dense, lexical in zip(dense_results, lexical_results)
+        ]
@@ -0,0 +1,171 @@
+"""Content-hash manifest used for incremental re-indexing.
+
+The manifest records, per source file, the hash of the file bytes and the IDs
+and hashes of the chunks that were embedded from it. It is stored as JSON next
+to the Chroma database so a re-index only embeds new or changed chunks.
+
+Checkpoints of a windowed index build are appended to a journal next to the
+manifest (one JSON line per window), so a checkpoint costs the size of the
+window, not of the corpus; `save` folds the journal into the manifest.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, List, Optional
+
+MANIFEST_VERSION = 1
+
+# 固定命名空间，保证相同内容在任何机器上得到相同的 chunk ID
+_CHUNK_NAMESPACE = uuid.UUID("6f1c1d0e-4b1e-4c55-9a39-5b0f1f7e2a61")
+
+
+def manifest_path(persist_dir: str, collection_name: str) -> str:
+    """Location of the manifest of a collection."""
+    return os.path.join(persist_dir, f"{collection_name}.manifest.json")
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(file_key: str, chunk_hashes: List[str]) -> List[str]:
+    """Deterministic chunk IDs derived from file key and chunk content.
+
+    Identical chunks inside one file are told apart by their occurrence count,
+    so an edit elsewhere in the file does not change the ID of a chunk.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for chunk_hash in chunk_hashes:
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        name = f"{file_key}\x00{chunk_hash}\x00{occurrence}"
+        ids.append(str(uuid.uuid5(_CHUNK_NAMESPACE, name)))
+    return ids
+
+
+def _read_journal(path: str) -> List[dict]:
+    """Records of a journal; a torn last line (interrupted write) is dropped."""
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return records
+
+
+class IndexManifest:
+    """Per-file and per-chunk content hashes of an indexed collection.
+
+    Args:
+        path: JSON file holding the manifest
+        settings: Index settings (embedding model, chunking); a manifest built
+            with different settings is discarded on load
+    """
+
+    def __init__(self, path: str, settings: dict):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.settings = settings
+        self.files: Dict[str, dict] = {}
+        # 正在写入、尚未提交的块 ID（中断恢复时需要清理）
+        self.pending: List[str] = []
+        self.stale = False
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if (
+                data.get("version") == MANIFEST_VERSION
+                and data.get("settings") == settings
+            ):
+                self.files = data.get("files", {})
+                self.pending = data.get("pending", [])
+            else:
+                # 模型或切分参数变化，旧的向量不能复用
+                self.stale = True
+        if not self.stale:
+            # 重放上次运行已记录的窗口检查点（首次构建时 manifest 可能还不存在）
+            for record in _read_journal(self.journal_path):
+                self.files.update(record.get("files", {}))
+                self.pending = record.get("pending", self.pending)
+
+    def get(self, file_key: str) -> Optional[dict]:
+        """Entry for a file: {"hash": ..., "chunks": {chunk_id: chunk_hash}}."""
+        return self.files.get(file_key)
+
+    def set(self, file_key: str, file_hash: str, chunks: Dict[str, str]) -> None:
+        """Record the file hash and its chunks."""
+        self.files[file_key] = {"hash": file_hash, "chunks": chunks}
+
+    def remove(self, file_key: str) -> None:
+        """Forget a file."""
+        self.files.pop(file_key, None)
+
+    def _append_journal(self, record: dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def begin_window(self, chunk_ids: List[str]) -> None:
+        """Checkpoint the chunk IDs about to be written (cleaned up if interrupted)."""
+        self.pending = list(chunk_ids)
+        self._append_journal({"pending": self.pending})
+
+    def commit_window(self, files: Dict[str, dict]) -> None:
+        """Checkpoint the entries of the files a window finished writing.
+
+        Args:
+            files: File key -> {"hash": ..., "chunks": {chunk_id: chunk_hash}}
+        """
+        self.files.update(files)
+        self.pending = []
+        self._append_journal({"files": files, "pending": []})
+
+    def all_chunk_ids(self) -> List[str]:
+        """IDs of every chunk recorded in the manifest."""
+        return [cid for entry in self.files.values() for cid in entry["chunks"]]
+
+    def save(self) -> None:
+        """Write the manifest atomically and clear the journal."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "settings": self.settings,
+                    "files": self.files,
+                    "pending": self.pending,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def delete(self) -> None:
+        """Remove the manifest file and all entries."""
+        self.files = {}
+        self.pending = []
+        for path in (self.path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,371 @@
+"""Versioned snapshots of an indexed collection for bootstrapping replicas.
+
+`export_snapshot` writes a consistent copy of a Chroma collection to a
+directory:
+
+    manifest.json   format, snapshot id, embedding model, dimension, distance
+                    space, row count, indexer settings and file manifest, and
+                    the SHA-256 of every other file
+    vectors.npy     float32 vectors, one row per chunk
+    ids.bin         chunk ids, UTF-8, concatenated
+    documents.bin   chunk texts, UTF-8, concatenated
+    metadatas.bin   chunk metadata as JSON, UTF-8, concatenated
+    offsets.npy     int64 (3, count + 1) byte offsets of every row in the
+                    three columns above
+
+A replica opens it with `IndexSnapshot` and loads it with `import_snapshot`,
+which writes the stored vectors straight into Chroma: no document is parsed
+and no embedding API call is made. A snapshot built with another embedding
+model is refused. `IndexSnapshot` reads like a Chroma collection
+(`count`, `metadata`, `get`), so `export_collection` can also turn it into a
+memory-mapped index without going through Chroma.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from index_manifest import IndexManifest, hash_file
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+_COLUMNS = ("ids", "documents", "metadatas")
+_FILES = ("vectors.npy", "offsets.npy") + tuple(f"{c}.bin" for c in _COLUMNS)
+_MAX_COLLECTION_NAME = 63  # chromadb 0.4/0.5 的集合名长度上限（1.x 放宽到 512）
+
+
+class SnapshotError(ValueError):
+    """The snapshot is missing, corrupt or does not match this service."""
+
+
+class InconsistentSnapshotError(RuntimeError):
+    """The collection changed while it was being exported."""
+
+
+def snapshot_path(snapshot_dir: str, collection_name: str) -> str:
+    """Location of the snapshot of a collection inside `snapshot_dir`."""
+    return os.path.join(snapshot_dir, f"{collection_name}.snapshot")
+
+
+def export_snapshot(
+    collection,
+    path: str,
+    embedding_model: str,
+    settings: dict,
+    files: Dict[str, dict],
+    index_version: str = "",
+    expected_ids: Optional[List[str]] = None,
+    page_size: int = 1000,
+) -> dict:
+    """Write a Chroma collection as a snapshot at `path`.
+
+    The snapshot is written next to `path` and swapped in when complete and
+    consistent, so readers never see a partial snapshot.
+
+    Args:
+        collection: Chroma collection to export
+        path: Target directory (replaced if it exists)
+        embedding_model: Model that produced the vectors
+        settings: Indexer settings the collection was built with
+        files: Indexer file manifest (file -> hash and chunks)
+        index_version: Version token of the collection
+        expected_ids: Chunk ids the collection must hold (the committed
+            chunks of the indexer manifest); checked after the export
+        page_size: Rows read from Chroma per request
+
+    Returns:
+        The snapshot manifest.
+
+    Raises:
+        InconsistentSnapshotError: If the collection changed during the
+            export; nothing is replaced and the export can be retried.
+    """
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    count = collection.count()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        rows = _write_rows(collection, tmp_path, count, page_size)
+        ids = rows.pop("ids")
+        # 分页读取期间集合被修改时，行数或块 ID 会对不上
+        if len(ids) != count or len(set(ids)) != count:
+            raise InconsistentSnapshotError(
+                f"集合在导出期间发生变化 ({count} -> {len(ids)} 个块)"
+            )
+        if expected_ids is not None and set(ids) != set(expected_ids):
+            raise InconsistentSnapshotError("导出的块与索引 manifest 不一致")
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "snapshot_id": uuid.uuid4().hex,
+            "created_at": time.time(),
+            "collection": getattr(collection, "name", ""),
+            "embedding_model": embedding_model,
+            "dimension": rows["dimension"],
+            "space": space,
+            "count": count,
+            "index_version": index_version,
+            "settings": settings,
+            "files": files,
+            "checksums": {
+                name: hash_file(os.path.join(tmp_path, name)) for name in _FILES
+            },
+        }
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    old_path = f"{path}.{os.getpid()}.old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return manifest
+
+
+def _write_rows(collection, path: str, count: int, page_size: int) -> dict:
+    """Page through the collection into the snapshot files at `path`."""
+    vectors = None
+    dimension = 0
+    ids: List[str] = []
+    offsets = np.zeros((len(_COLUMNS), count + 1), dtype=np.int64)
+    columns = {c: open(os.path.join(path, f"{c}.bin"), "wb") for c in _COLUMNS}
+    try:
+        while len(ids) < count:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=min(page_size, count - len(ids)),
+                offset=len(ids),
+            )
+            if not len(page["ids"]):
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                dimension = embeddings.shape[1]
+                vectors = np.lib.format.open_memmap(
+                    os.path.join(path, "vectors.npy"),
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(count, dimension),
+                )
+            start = len(ids)
+            vectors[start : start + len(embeddings)] = embeddings
+            values = {
+                "ids": page["ids"],
+                "documents": [d or "" for d in page["documents"]],
+                "metadatas": [
+                    json.dumps(m or {}, ensure_ascii=False) for m in page["metadatas"]
+                ],
+            }
+            for i, column in enumerate(_COLUMNS):
+                encoded = [value.encode("utf-8") for value in values[column]]
+                columns[column].write(b"".join(encoded))
+                lengths = np.cumsum([len(value) for value in encoded])
+                offsets[i, start + 1 : start + 1 + len(encoded)] = (
+                    offsets[i, start] + lengths
+                )
+            ids.extend(page["ids"])
+    finally:
+        for f in columns.values():
+            f.close()
+
+    if vectors is None:
+        vectors = np.lib.format.open_memmap(
+            os.path.join(path, "vectors.npy"),
+            mode="w+",
+            dtype=np.float32,
+            shape=(0, 0),
+        )
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(path, "offsets.npy"), offsets[:, : len(ids) + 1])
+    return {"ids": ids, "dimension": dimension}
+
+
+class IndexSnapshot:
+    """Read access to a snapshot written by `export_snapshot`.
+
+    Args:
+        path: Snapshot directory
+
+    Raises:
+        SnapshotError: If there is no snapshot at `path` or its format is not
+            supported.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, "manifest.json")) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise SnapshotError(f"❌ 未找到索引快照: {path}")
+        if self.manifest.get("format") != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError(f"❌ 不支持的快照格式: {path}")
+        self.snapshot_id = self.manifest["snapshot_id"]
+        self.embedding_model = self.manifest["embedding_model"]
+        # 与 Chroma 集合相同的接口，export_collection 可以直接读取快照
+        self.metadata = {"hnsw:space": self.manifest["space"]}
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def count(self) -> int:
+        return self.manifest["count"]
+
+    def check_embedding_model(self, embedding_model: str) -> None:
+        """Refuse a snapshot whose vectors come from another model.
+
+        Raises:
+            SnapshotError: If the models differ.
+        """
+        if self.embedding_model != embedding_model:
+            raise SnapshotError(
+                f"❌ 快照的嵌入模型 '{self.embedding_model}' 与当前配置 "
+                f"'{embedding_model}' 不一致，拒绝导入: {self.path}"
+            )
+
+    def verify(self) -> None:
+        """Check every file against the checksums in the manifest.
+
+        Raises:
+            SnapshotError: If a file is missing or was modified.
+        """
+        for name, checksum in self.manifest["checksums"].items():
+            file_path = os.path.join(self.path, name)
+            if not os.path.exists(file_path) or hash_file(file_path) != checksum:
+                raise SnapshotError(f"❌ 快照文件缺失或已损坏: {file_path}")
+
+    def _column(self, column: str, start: int, stop: int) -> List[str]:
+        offsets = self._offsets[_COLUMNS.index(column), start : stop + 1]
+        if stop <= start:
+            return []
+        # 连续的行在文件里也是连续的，一页只需要一次读取
+        with open(os.path.join(self.path, f"{column}.bin"), "rb") as f:
+            f.seek(int(offsets[0]))
+            data = f.read(int(offsets[-1] - offsets[0]))
+        bounds = (offsets - offsets[0]).tolist()
+        return [
+            data[bounds[i] : bounds[i + 1]].decode("utf-8")
+            for i in range(len(bounds) - 1)
+        ]
+
+    def get(
+        self,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> dict:
+        """Rows `offset` to `offset + limit`, shaped like Chroma's `get`."""
+        stop = self.count() if limit is None else min(self.count(), offset + limit)
+        start = min(offset, stop)
+        include = include or ["documents", "metadatas"]
+        page = {"ids": self._column("ids", start, stop)}
+        page["embeddings"] = (
+            np.asarray(self._vectors[start:stop]) if "embeddings" in include else None
+        )
+        page["documents"] = (
+            self._column("documents", start, stop) if "documents" in include else None
+        )
+        page["metadatas"] = (
+            [json.loads(m) or None for m in self._column("metadatas", start, stop)]
+            if "metadatas" in include
+            else None
+        )
+        return page
+
+    def pages(self, page_size: int, include: Optional[List[str]] = None) -> Iterator:
+        """`get` pages covering the whole snapshot."""
+        for offset in range(0, self.count(), page_size):
+            yield self.get(include=include, limit=page_size, offset=offset)
+
+    def restore_manifest(self, path: str) -> None:
+        """Write the indexer manifest, so later indexing runs stay incremental."""
+        manifest = IndexManifest(path, settings=self.manifest["settings"])
+        manifest.files = self.manifest["files"]
+        manifest.pending = []
+        manifest.save()
+
+
+def imported_snapshot_id(collection) -> Optional[str]:
+    """Id of the snapshot a Chroma collection was imported from, if any."""
+    return (collection.metadata or {}).get("snapshot_id")
+
+
+def _sibling_name(collection_name: str, suffix: str) -> str:
+    """Name of a helper collection next to `collection_name`, within Chroma's limit.
+
+    Long names keep a truncated prefix plus a short hash of the full name, so
+    two long names sharing a prefix still get different helper collections.
+    """
+    name = f"{collection_name}-{suffix}"
+    if len(name) <= _MAX_COLLECTION_NAME:
+        return name
+    digest = hashlib.sha256(collection_name.encode("utf-8")).hexdigest()[:8]
+    prefix = collection_name[: _MAX_COLLECTION_NAME - len(suffix) - len(digest) - 2]
+    return f"{prefix}-{digest}-{suffix}"
+
+
+def import_snapshot(
+    client, snapshot: IndexSnapshot, collection_name: str, batch_size: int = 1000
+) -> int:
+    """Replace a Chroma collection with the contents of a snapshot.
+
+    Rows are written to a staging collection, so the old collection keeps
+    serving during the import. When complete, the old collection is renamed
+    aside, the staging collection takes its name and only then is the old
+    one deleted. The snapshot id is kept in the collection metadata (see
+    `imported_snapshot_id`).
+
+    Args:
+        client: Chroma client
+        snapshot: Opened snapshot (checked with `check_embedding_model` and
+            `verify` by the caller)
+        collection_name: Collection to replace
+        batch_size: Rows per Chroma write
+
+    Returns:
+        Number of imported rows.
+    """
+    staging_name = _sibling_name(collection_name, "import")
+    replaced_name = _sibling_name(collection_name, "replaced")
+    for leftover in (staging_name, replaced_name):
+        # 上次导入中断留下的集合
+        try:
+            client.delete_collection(leftover)
+        except Exception:
+            pass
+    staging = client.create_collection(
+        staging_name,
+        metadata={
+            "hnsw:space": snapshot.metadata["hnsw:space"],
+            "snapshot_id": snapshot.snapshot_id,
+        },
+    )
+    batch_size = min(batch_size, client.get_max_batch_size())
+    include = ["embeddings", "documents", "metadatas"]
+    for page in snapshot.pages(batch_size, include=include):
+        staging.add(
+            ids=page["ids"],
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+        )
+    # 旧集合先改名让位，新集合就位后才删除（已打开的句柄在此之前仍可查询）
+    try:
+        client.get_collection(collection_name).modify(name=replaced_name)
+        replaced = True
+    except Exception:
+        replaced = False
+    staging.modify(name=collection_name)
+    if replaced:
+        client.delete_collection(replaced_name)
+    return snapshot.count()
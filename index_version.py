@@ -0,0 +1,33 @@
+"""Per-collection version marker shared by the indexer and the query service.
+
+`DocumentIndexer` bumps the marker whenever it changes a collection; readers
+compare it with the value they last saw to drop derived state (caches).
+"""
+
+import os
+import uuid
+
+
+def _version_path(persist_dir: str, collection_name: str) -> str:
+    return os.path.join(persist_dir, f"{collection_name}.version")
+
+
+def read_index_version(persist_dir: str, collection_name: str) -> str:
+    """Return the current version token ("" if the collection was never bumped)."""
+    try:
+        with open(_version_path(persist_dir, collection_name)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_index_version(persist_dir: str, collection_name: str) -> str:
+    """Write a fresh version token atomically and return it."""
+    os.makedirs(persist_dir, exist_ok=True)
+    version = uuid.uuid4().hex
+    path = _version_path(persist_dir, collection_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
@@ -1,35 +1,70 @@
 """Document indexing script with vector database persistence."""
 
 import os
-from pathlib import Path
+import time
 
-import chromadb
-from llama_index.core import Settings, StorageContext, VectorStoreIndex
-from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.readers import SimpleDirectoryReader
-from llama_index.embeddings.zhipuai import ZhipuAIEmbedding
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
 from llama_index.llms.zhipuai import ZhipuAI
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
 import config
+from async_adapters import AsyncZhipuAIEmbedding
+from bm25_index import BM25Index, lexical_index_path
+from chroma_backend import connect_chroma
+from chunking import FILTER_METADATA_KEYS, iter_split_files
+from collection_pool import validate_collection_name
+from embedding_cache import CachedEmbedding, EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline, batched
+from index_manifest import IndexManifest, hash_file, manifest_path
+from index_snapshot import InconsistentSnapshotError, export_snapshot, snapshot_path
+from index_version import bump_index_version, read_index_version
+from mmap_vector_store import export_collection, export_is_current, mmap_index_path
 
 
 class DocumentIndexer:
     """Handles document indexing and storage."""
 
-    def __init__(self):
-        """Initialize indexer with models and vector store."""
+    def __init__(self, collection_name=None, data_dir=None):
+        """Initialize indexer with models and vector store.
+
+        Args:
+            collection_name: Collection to build (defaults to
+                `config.COLLECTION_NAME`); one collection per tenant
+            data_dir: Directory scanned by `build_index` (defaults to
+                `config.DATA_DIR`)
+        """
+        self.collection_name = validate_collection_name(
+            collection_name or config.COLLECTION_NAME
+        )
+        self.data_dir = data_dir or config.DATA_DIR
+
         # 配置 LLM
         self.llm = ZhipuAI(
             model=config.LLM_MODEL,
             api_key=config.ZHIPUAI_API_KEY,
         )
 
-        # 配置嵌入模型
-        self.embed_model = ZhipuAIEmbedding(
+        # 配置嵌入模型（重复文本直接命中缓存，节省 embedding 费用）
+        self.embed_model = AsyncZhipuAIEmbedding(
             model=config.EMBEDDING_MODEL,
             api_key=config.ZHIPUAI_API_KEY,
+            base_url=config.ZHIPUAI_BASE_URL,
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            timeout=config.EMBEDDING_TIMEOUT,
         )
+        if config.USE_EMBEDDING_CACHE:
+            self.embed_model = CachedEmbedding(
+                self.embed_model,
+                cache=EmbeddingCache(
+                    path=config.EMBEDDING_CACHE_PATH,
+                    max_memory_entries=config.EMBEDDING_CACHE_MEMORY_SIZE,
+                    max_disk_entries=config.EMBEDDING_CACHE_DISK_SIZE,
+                    ttl=config.EMBEDDING_CACHE_TTL,
+                ),
+            )
 
         # 设置全局配置
         Settings.llm = self.llm
@@ -38,64 +73,446 @@ class DocumentIndexer:
         Settings.chunk_overlap = config.CHUNK_OVERLAP
 
         # 初始化 Chroma 客户端
-        self.chroma_client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+        self.chroma_client = connect_chroma()
 
         # 获取或创建集合
-        self.chroma_collection = self.chroma_client.get_or_create_collection(
-            name=config.COLLECTION_NAME,
+        self.chroma_collection = self._get_or_create_collection()
+
+        # BM25 倒排索引与向量库保存相同的块，供混合检索使用
+        self.lexical_index = None
+        if config.USE_HYBRID_SEARCH:
+            self.lexical_index = BM25Index(
+                lexical_index_path(config.CHROMA_PERSIST_DIR, self.collection_name),
+                k1=config.BM25_K1,
+                b=config.BM25_B,
+            )
+
+    def _get_or_create_collection(self):
+        """Get or create the Chroma collection."""
+        return self.chroma_client.get_or_create_collection(
+            name=self.collection_name,
             metadata={"hnsw:space": "cosine"},  # 指定使用余弦相似度
         )
 
-    def build_index(self, force_rebuild=False):
-        """Build or rebuild the document index."""
+    def _load_manifest(self) -> IndexManifest:
+        """Load the content-hash manifest stored next to the Chroma DB."""
+        return IndexManifest(
+            manifest_path(config.CHROMA_PERSIST_DIR, self.collection_name),
+            settings={
+                "embedding_model": config.EMBEDDING_MODEL,
+                "chunk_size": config.CHUNK_SIZE,
+                "chunk_overlap": config.CHUNK_OVERLAP,
+                # 新增过滤字段时重建，已有的块也写入这些元数据
+                "filter_metadata": list(FILTER_METADATA_KEYS),
+            },
+        )
+
+    def build_index(
+        self, force_rebuild=False, stream=False, workers=None, export_mmap=False
+    ):
+        """Build or incrementally update the document index.
+
+        Only new or changed chunks are embedded; chunks of removed files are
+        deleted and unchanged chunks are left alone.
+
+        Args:
+            force_rebuild: Drop the collection and index everything again
+            stream: Flush to Chroma in windows of `config.STREAM_WINDOW_SIZE`
+                chunks so memory does not grow with the corpus; an
+                interrupted run resumes from the last window
+            workers: Processes used to parse and split files (defaults to
+                `config.INDEX_WORKERS`)
+            export_mmap: Refresh the memory-mapped export of the collection
+                (always done when `config.VECTOR_DB_TYPE` is "mmap")
+        """
+        manifest = self._load_manifest()
+        if manifest.stale and not force_rebuild:
+            print("⚠️  嵌入模型、切分参数或元数据字段已变化，执行完整重建")
+            force_rebuild = True
+
         # 如果强制重建，清空现有数据
         if force_rebuild:
             print("🗑️  清空现有索引...")
             try:
-                self.chroma_client.delete_collection(config.COLLECTION_NAME)
+                self.chroma_client.delete_collection(self.collection_name)
             except Exception as e:
                 print(f"⚠️  删除集合时出现警告: {e}")
-            self.chroma_collection = self.chroma_client.create_collection(
-                config.COLLECTION_NAME
-            )
+            manifest.delete()
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
+            self.chroma_collection = self._get_or_create_collection()
 
-        print(f"📂 从 {config.DATA_DIR} 读取文档...")
-        documents = SimpleDirectoryReader(config.DATA_DIR).load_data()
-        print(f"✅ 读取了 {len(documents)} 个文档")
+        print(f"📂 扫描 {self.data_dir} ...")
+        file_paths = [str(p) for p in SimpleDirectoryReader(self.data_dir).input_files]
+        print(f"✅ 找到 {len(file_paths)} 个文件")
 
-        # 创建向量存储
-        vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-        # 构建索引
-        print("🔨 构建向量索引...")
-        index = VectorStoreIndex.from_documents(
-            documents,
-            storage_context=storage_context,
-            show_progress=True,
+        # 只清理数据目录下已删除的文件，add_documents 添加的外部文件保持不变
+        data_root = os.path.join(os.path.abspath(self.data_dir), "")
+        present = set(file_paths)
+        removed_files = [
+            key
+            for key in manifest.files
+            if key.startswith(data_root) and key not in present
+        ]
+
+        window_size = config.STREAM_WINDOW_SIZE if stream else None
+        index = self._sync_files(
+            file_paths,
+            manifest,
+            removed_files,
+            window_size,
+            workers or config.INDEX_WORKERS,
         )
 
-        print(f"✅ 索引构建完成！存储在 {config.CHROMA_PERSIST_DIR}")
+        print(
+            f"✅ 索引构建完成！存储在 {config.CHROMA_PERSIST_DIR} "
+            f"(集合: {self.collection_name})"
+        )
         print(f"📊 集合中文档数量: {self.chroma_collection.count()}")
+        self._refresh_mmap_export(force=export_mmap)
+        self._print_cache_stats()
         return index
 
-    def add_documents(self, file_paths):
-        """Add new documents to existing index."""
+    def add_documents(self, file_paths, stream=False, workers=None):
+        """Add new or updated documents to the existing index.
+
+        Files already indexed with the same content are skipped; changed files
+        only have their new or modified chunks embedded.
+
+        Args:
+            file_paths: Files to add
+            stream: Flush in bounded windows (see `build_index`)
+            workers: Processes used to parse and split files
+        """
         print(f"📄 添加 {len(file_paths)} 个新文档...")
-        # TODO: 实现增量添加逻辑
-        documents = SimpleDirectoryReader(input_files=file_paths).load_data()
+        manifest = self._load_manifest()
+        if manifest.stale:
+            raise RuntimeError(
+                "❌ 嵌入模型、切分参数或元数据字段已变化，请运行 'python indexer.py --rebuild'"
+            )
 
+        file_paths = [
+            str(p) for p in SimpleDirectoryReader(input_files=file_paths).input_files
+        ]
+        window_size = config.STREAM_WINDOW_SIZE if stream else None
+        self._sync_files(
+            file_paths, manifest, [], window_size, workers or config.INDEX_WORKERS
+        )
+
+        print(f"✅ 成功添加 {len(file_paths)} 个文档")
+        self._refresh_mmap_export()
+        self._print_cache_stats()
+
+    def _sync_files(
+        self, file_paths, manifest, removed_files, window_size=None, workers=1
+    ):
+        """Bring the collection in line with the given files.
+
+        Changed files are read and split one at a time (or on a process pool,
+        in order, when `workers > 1`). Their chunks are
+        embedded and written in windows of about `window_size` chunks, and the
+        manifest is saved after every window, so an interrupted run resumes
+        from the last completed window.
+
+        Args:
+            file_paths: Files that should be indexed
+            manifest: Manifest describing what is currently in the collection
+            removed_files: Manifest entries whose chunks must be deleted
+            window_size: Chunks per flush window, or None to flush once at the end
+            workers: Processes used to parse and split files
+
+        Returns:
+            VectorStoreIndex over the updated collection.
+        """
         vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        changes = 0
 
-        index = VectorStoreIndex.from_vector_store(
-            vector_store=vector_store, storage_context=storage_context
+        # 上次中断时未提交窗口的块：manifest 里没有记录，先清掉
+        if manifest.pending:
+            print(f"♻️  从检查点恢复，清理 {len(manifest.pending)} 个未提交的块")
+            self.chroma_collection.delete(ids=manifest.pending)
+            self._delete_lexical(manifest.pending)
+            manifest.pending = []
+            manifest.save()
+
+        removed_ids = []
+        for file_key in removed_files:
+            removed_ids.extend(manifest.get(file_key)["chunks"])
+            manifest.remove(file_key)
+        if removed_ids:
+            self.chroma_collection.delete(ids=removed_ids)
+            self._delete_lexical(removed_ids)
+            changes += len(removed_ids)
+        if removed_files:
+            manifest.save()
+
+        # 文件哈希未变化的直接跳过，不读取也不切分
+        changed = {}
+        kept_chunks = 0
+        for path in file_paths:
+            file_hash = hash_file(path)
+            entry = manifest.get(path)
+            if entry is None or entry["hash"] != file_hash:
+                changed[path] = file_hash
+            else:
+                kept_chunks += len(entry["chunks"])
+        unchanged_files = len(file_paths) - len(changed)
+
+        print(
+            f"🔍 变更检测: {len(changed)} 个文件有变化, {unchanged_files} 个文件未变化, "
+            f"{len(removed_files)} 个文件已删除"
         )
 
-        for doc in documents:
-            index.insert(doc)
+        pipeline = EmbeddingPipeline(
+            self.embed_model,
+            vector_store,
+            batch_size=config.EMBED_BATCH_SIZE,
+            max_in_flight=config.EMBED_MAX_IN_FLIGHT,
+            write_batch_size=config.CHROMA_WRITE_BATCH_SIZE,
+            max_retries=config.EMBED_MAX_RETRIES,
+        )
+        if changed:
+            print(
+                f"🔨 生成新块的向量 (批大小={config.EMBED_BATCH_SIZE}, "
+                f"并发={config.EMBED_MAX_IN_FLIGHT}"
+                + (f", 窗口={window_size} 块" if window_size else "")
+                + ")..."
+            )
 
-        print(f"✅ 成功添加 {len(documents)} 个文档")
+        window_nodes, window_stale, window_kept, window_files = [], [], [], {}
+        totals = {"new": 0, "stale": 0, "elapsed_s": 0.0, "files": 0}
+
+        def flush():
+            nonlocal changes
+            new_ids = [n.node_id for n in window_nodes]
+            if window_nodes:
+                # 先记录待提交的块，中断后下次运行可以清理（只追加本窗口的记录）
+                manifest.begin_window(new_ids)
+                # 清理可能残留的同 ID 向量（例如 manifest 丢失）
+                self.chroma_collection.delete(ids=new_ids)
+                stats = pipeline.run(
+                    window_nodes,
+                    total=len(window_nodes),
+                    show_progress=window_size is None,
+                )
+                totals["elapsed_s"] += stats["elapsed_s"]
+                if self.lexical_index is not None:
+                    self.lexical_index.add(
+                        (n.node_id, n.get_content(metadata_mode=MetadataMode.NONE))
+                        for n in window_nodes
+                    )
+            # 内容未变的块不重新 embedding，但 mtime 等元数据随文件更新
+            if window_kept:
+                self._update_metadata(window_kept)
+            # 新块写入后再删除旧块，更新过程中检索不会出现空档
+            if window_stale:
+                self.chroma_collection.delete(ids=window_stale)
+                self._delete_lexical(window_stale)
+
+            manifest.commit_window(
+                {
+                    path: {"hash": file_hash, "chunks": chunks}
+                    for path, (file_hash, chunks) in window_files.items()
+                }
+            )
+
+            totals["new"] += len(window_nodes)
+            totals["stale"] += len(window_stale)
+            totals["files"] += len(window_files)
+            changes += len(window_nodes) + len(window_stale) + len(window_kept)
+            if window_size is not None:
+                print(
+                    f"💾 检查点: {totals['files']}/{len(changed)} 个文件, "
+                    f"已写入 {totals['new']} 个块"
+                )
+            window_nodes.clear()
+            window_stale.clear()
+            window_kept.clear()
+            window_files.clear()
+
+        file_nodes = iter_split_files(
+            list(changed), config.CHUNK_SIZE, config.CHUNK_OVERLAP, workers=workers
+        )
+        for path, nodes, hashes in file_nodes:
+            ids = [n.node_id for n in nodes]
+            entry = manifest.get(path)
+            old_chunks = entry["chunks"] if entry else {}
+            new_ids = set(ids)
+            window_nodes.extend(n for n in nodes if n.node_id not in old_chunks)
+            window_stale.extend(cid for cid in old_chunks if cid not in new_ids)
+            window_kept.extend(n for n in nodes if n.node_id in old_chunks)
+            kept_chunks += len(new_ids & old_chunks.keys())
+            window_files[path] = (changed[path], dict(zip(ids, hashes)))
+
+            # 只在文件边界刷新，保证一个文件的块总是一起提交
+            if window_size is not None and len(window_nodes) >= window_size:
+                flush()
+        if window_files:
+            flush()
+        # 检查点只追加到日志，全部窗口完成后再整体写一次 manifest
+        manifest.save()
+
+        print(
+            f"🧩 新增 {totals['new']} 个块, 删除 {totals['stale'] + len(removed_ids)} "
+            f"个块, 保留 {kept_chunks} 个未变化的块"
+        )
+        if totals["new"] and totals["elapsed_s"]:
+            print(
+                f"⚡ Embedding 吞吐: {len(changed) / totals['elapsed_s']:.1f} docs/s, "
+                f"{totals['new'] / totals['elapsed_s']:.1f} chunks/s "
+                f"(重试 {pipeline.retries} 次)"
+            )
+
+        if self._sync_lexical_index():
+            changes += 1
+
+        if changes:
+            bump_index_version(config.CHROMA_PERSIST_DIR, self.collection_name)
+
+        return VectorStoreIndex.from_vector_store(
+            vector_store=vector_store, embed_model=self.embed_model
+        )
+
+    def _update_metadata(self, nodes):
+        """Rewrite the stored metadata of chunks that keep their vectors."""
+        for batch in batched(nodes, config.CHROMA_WRITE_BATCH_SIZE):
+            metadatas = []
+            for node in batch:
+                # 与 ChromaVectorStore.add 写入的格式相同
+                metadata = node_to_metadata_dict(
+                    node, remove_text=True, flat_metadata=True
+                )
+                metadatas.append(
+                    {k: "" if v is None else v for k, v in metadata.items()}
+                )
+            self.chroma_collection.update(
+                ids=[node.node_id for node in batch], metadatas=metadatas
+            )
+
+    def _delete_lexical(self, node_ids):
+        if self.lexical_index is not None:
+            self.lexical_index.delete(node_ids)
+
+    def _sync_lexical_index(self, page_size=1000):
+        """Rebuild the BM25 index from Chroma if the two have drifted apart.
+
+        Covers collections indexed before hybrid search existed.
+
+        Returns:
+            True if the BM25 index was rebuilt.
+        """
+        if self.lexical_index is None:
+            return False
+        if self.lexical_index.count() == self.chroma_collection.count():
+            return False
+
+        print("🔤 BM25 索引与向量库不一致，从 Chroma 重建 BM25 索引...")
+        self.lexical_index.clear()
+        offset = 0
+        while True:
+            page = self.chroma_collection.get(
+                include=["documents"], limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                break
+            self.lexical_index.add(zip(page["ids"], page["documents"]))
+            offset += len(page["ids"])
+        print(f"✅ BM25 索引重建完成: {offset} 个块")
+        return True
+
+    def export_mmap(self):
+        """Write the collection as a memory-mapped, quantized index.
+
+        Read-only serving replicas load it with `VECTOR_DB_TYPE = "mmap"`.
+
+        Returns:
+            Number of exported vectors.
+        """
+        path = mmap_index_path(config.CHROMA_PERSIST_DIR, self.collection_name)
+        count = export_collection(
+            self.chroma_collection,
+            path,
+            quantization=config.MMAP_QUANTIZATION,
+            index_version=read_index_version(
+                config.CHROMA_PERSIST_DIR, self.collection_name
+            ),
+        )
+        print(f"📦 mmap 索引已导出: {path} ({count} 个向量, {config.MMAP_QUANTIZATION})")
+        return count
+
+    def export_snapshot(self, snapshot_dir, attempts=5, retry_delay=2.0):
+        """Write a consistent snapshot of the collection for serving replicas.
+
+        The snapshot holds the stored vectors, texts and metadata together
+        with the embedding model and the indexer manifest; replicas import it
+        with `INDEX_SNAPSHOT_DIR` instead of indexing the corpus again. An
+        indexing run in another process may change the collection during the
+        export, in which case the export is retried.
+
+        Args:
+            snapshot_dir: Directory receiving `<collection>.snapshot`
+            attempts: Exports tried before giving up
+            retry_delay: Seconds to wait between attempts
+
+        Returns:
+            The snapshot manifest.
+        """
+        path = snapshot_path(snapshot_dir, self.collection_name)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        for attempt in range(1, attempts + 1):
+            manifest = self._load_manifest()
+            if manifest.stale:
+                raise RuntimeError(
+                    "❌ 嵌入模型、切分参数或元数据字段已变化，请先运行 'python indexer.py --rebuild'"
+                )
+            if manifest.pending:
+                reason = "有未提交的索引窗口"
+            else:
+                try:
+                    snapshot = export_snapshot(
+                        self.chroma_collection,
+                        path,
+                        embedding_model=config.EMBEDDING_MODEL,
+                        settings=manifest.settings,
+                        files=manifest.files,
+                        index_version=read_index_version(
+                            config.CHROMA_PERSIST_DIR, self.collection_name
+                        ),
+                        expected_ids=manifest.all_chunk_ids(),
+                    )
+                except InconsistentSnapshotError as e:
+                    reason = str(e)
+                else:
+                    print(
+                        f"📦 索引快照已导出: {path} ({snapshot['count']} 个块, "
+                        f"{snapshot['embedding_model']})"
+                    )
+                    return snapshot
+            if attempt < attempts:
+                print(f"⚠️  {reason}，{retry_delay}s 后重试 ({attempt}/{attempts})")
+                time.sleep(retry_delay)
+        raise RuntimeError(f"❌ 无法导出一致的索引快照: {reason}")
+
+    def _refresh_mmap_export(self, force=False):
+        """Re-export when the mmap backend is in use and the export is stale."""
+        if not force and config.VECTOR_DB_TYPE != "mmap":
+            return
+        current = export_is_current(
+            mmap_index_path(config.CHROMA_PERSIST_DIR, self.collection_name),
+            read_index_version(config.CHROMA_PERSIST_DIR, self.collection_name),
+            config.MMAP_QUANTIZATION,
+        )
+        if not current:
+            self.export_mmap()
+
+    def _print_cache_stats(self):
+        """Print embedding cache hit/miss counters."""
+        if isinstance(self.embed_model, CachedEmbedding):
+            stats = self.embed_model.cache.stats()
+            print(
+                f"💾 Embedding 缓存: 命中 {stats['memory_hits'] + stats['disk_hits']}, "
+                f"未命中 {stats['misses']} (命中率 {stats['hit_rate']:.1%})"
+            )
 
 
 def main():
@@ -106,10 +523,52 @@ def main():
     parser.add_argument(
         "--rebuild", action="store_true", help="Force rebuild index from scratch"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Flush to the vector store in bounded windows and checkpoint "
+        "progress (for corpora larger than RAM; rerun to resume)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.INDEX_WORKERS,
+        help="Processes used to parse and chunk documents",
+    )
+    parser.add_argument(
+        "--collection",
+        default=None,
+        help=f"Collection (tenant) to build (default: {config.COLLECTION_NAME})",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help=f"Directory of documents to index (default: {config.DATA_DIR})",
+    )
+    parser.add_argument(
+        "--export-mmap",
+        action="store_true",
+        help="Also write the memory-mapped, quantized export used by "
+        'VECTOR_DB_TYPE = "mmap" (automatic when that backend is configured)',
+    )
+    parser.add_argument(
+        "--export-snapshot",
+        metavar="DIR",
+        default=None,
+        help="After indexing, write a snapshot of the collection to DIR for "
+        "serving replicas (imported at start-up with INDEX_SNAPSHOT_DIR)",
+    )
     args = parser.parse_args()
 
-    indexer = DocumentIndexer()
-    indexer.build_index(force_rebuild=args.rebuild)
+    indexer = DocumentIndexer(collection_name=args.collection, data_dir=args.data_dir)
+    indexer.build_index(
+        force_rebuild=args.rebuild,
+        stream=args.stream,
+        workers=args.workers,
+        export_mmap=args.export_mmap,
+    )
+    if args.export_snapshot:
+        indexer.export_snapshot(args.export_snapshot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""Metadata filter expressions for restricting retrieval.
+
+Requests describe filters as a JSON object in the style of Chroma's `where`
+clauses::
+
+    {"doc_type": "pdf"}
+    {"mtime": {"$gte": 1700000000}, "file_name": {"$in": ["a.md", "b.md"]}}
+    {"$or": [{"doc_type": "md"}, {"doc_type": "txt"}]}
+
+`parse_filters` turns such an object into llama_index `MetadataFilters`,
+which the Chroma vector store translates back into a `where` clause, so the
+narrowing happens inside the vector search instead of after it.
+
+llama_index is only imported on the first parse, so the API can import this
+module before the query service has loaded.
+"""
+
+from typing import Any, Dict, List
+
+# 每个文档块都有的元数据（由 indexer 在导入时写入）
+FILTERABLE_KEYS = (
+    "file_path",
+    "file_name",
+    "doc_type",
+    "mtime",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+)
+
+# 表达式运算符 -> llama_index FilterOperator / FilterCondition 的取值
+_OPERATORS = {
+    "$eq": "==",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+    "$in": "in",
+    "$nin": "nin",
+}
+_CONDITIONS = {"$and": "and", "$or": "or"}
+_SCALAR = (str, int, float, bool)
+# Chroma 的比较运算只接受数字
+_RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+
+class InvalidFilterError(ValueError):
+    """The metadata filter expression cannot be parsed."""
+
+
+def _value(key: str, op: str, value: Any) -> Any:
+    if op in ("$in", "$nin"):
+        if (
+            not isinstance(value, list)
+            or not value
+            or not all(isinstance(v, _SCALAR) for v in value)
+        ):
+            raise InvalidFilterError(f"❌ {key}.{op} 需要非空的值列表: {value!r}")
+        return value
+    if op in _RANGE_OPERATORS:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidFilterError(f"❌ {key}.{op} 需要数字: {value!r}")
+        return value
+    if not isinstance(value, _SCALAR):
+        raise InvalidFilterError(f"❌ {key}.{op} 需要字符串或数字: {value!r}")
+    return value
+
+
+def _field(key: str, condition: Any) -> list:
+    """Filters for one metadata key: a value, or {"$op": value, ...}."""
+    from llama_index.core.vector_stores.types import MetadataFilter
+
+    if key not in FILTERABLE_KEYS:
+        raise InvalidFilterError(
+            f"❌ 不支持按 '{key}' 过滤，可用字段: {', '.join(FILTERABLE_KEYS)}"
+        )
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    if not condition:
+        raise InvalidFilterError(f"❌ '{key}' 的过滤条件为空")
+    filters = []
+    for op, value in condition.items():
+        if op not in _OPERATORS:
+            raise InvalidFilterError(
+                f"❌ 不支持的运算符 '{op}'，可用: {', '.join(_OPERATORS)}"
+            )
+        filters.append(
+            MetadataFilter(
+                key=key, value=_value(key, op, value), operator=_OPERATORS[op]
+            )
+        )
+    return filters
+
+
+def _parse(expression: Any):
+    from llama_index.core.vector_stores.types import MetadataFilters
+
+    if not isinstance(expression, dict) or not expression:
+        raise InvalidFilterError(f"❌ 过滤条件必须是非空对象: {expression!r}")
+    filters: List[Any] = []
+    for key, condition in expression.items():
+        if key in _CONDITIONS:
+            if not isinstance(condition, list) or not condition:
+                raise InvalidFilterError(f"❌ {key} 需要非空的条件列表")
+            filters.append(
+                MetadataFilters(
+                    filters=[_parse(item) for item in condition],
+                    condition=_CONDITIONS[key],
+                )
+            )
+        else:
+            filters.extend(_field(key, condition))
+    return MetadataFilters(filters=filters, condition="and")
+
+
+def parse_filters(expression: Dict[str, Any]):
+    """Parse a filter expression into llama_index `MetadataFilters`.
+
+    Keys of the object are combined with AND. A key maps to a value (equality)
+    or to an object of operators (``$eq``, ``$ne``, ``$gt``, ``$gte``,
+    ``$lt``, ``$lte``, ``$in``, ``$nin``); ``$and`` / ``$or`` take a list of
+    expressions. The range operators only take numbers, so date keys such as
+    ``creation_date`` (strings) can be matched but not compared; use ``mtime``.
+
+    Args:
+        expression: Filter expression (e.g. the ``filters`` of a request)
+
+    Raises:
+        InvalidFilterError: If the expression is malformed or uses a key or
+            operator that is not supported.
+    """
+    filters = _parse(expression)
+    # 只有一个嵌套条件时去掉外层，生成的 where 子句更简单
+    if len(filters.filters) == 1 and isinstance(filters.filters[0], type(filters)):
+        return filters.filters[0]
+    return filters
@@ -0,0 +1,505 @@
+"""Per-query stage timings and Prometheus metrics.
+
+Every query opens a `QueryTrace` that times its stages (embed, retrieve,
+rerank, compress, synthesize, serialize) and collects the LLM token usage,
+cache hits and retrieval decisions recorded while it is active. Finished
+traces feed the histograms and counters of `REGISTRY`, which `/metrics`
+renders in the Prometheus text format.
+
+With several worker processes each worker only sees its own requests, so the
+workers write snapshots of their metrics to a shared directory
+(`METRICS_DIR`) and `/metrics` renders the sum over all of them.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels.
+
+    Args:
+        name: Metric name (ends in ``_total`` by convention)
+        documentation: HELP text
+        labelnames: Label names, given as keyword arguments to `inc`
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def snapshot(self) -> list:
+        """JSON-serializable values, to be merged by another process."""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, snapshots: Iterable[list] = ()) -> str:
+        """Text exposition, adding the `snapshot()`s of other processes."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = dict(self._values)
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = values.get(key, 0) + value
+        for key, value in sorted(values.items()):
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels.
+
+    Args:
+        name: Metric name (ends in ``_seconds`` for latencies)
+        documentation: HELP text
+        labelnames: Label names, given as keyword arguments to `observe`
+        buckets: Upper bounds of the buckets (``+Inf`` is added)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = config.METRICS_LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数（非累计）, 总和, 总数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return series[2] if series else 0
+
+    def snapshot(self) -> list:
+        """JSON-serializable series, to be merged by another process."""
+        with self._lock:
+            return [
+                [list(key), list(counts), total, count]
+                for key, (counts, total, count) in self._series.items()
+            ]
+
+    def render(self, snapshots: Iterable[list] = ()) -> str:
+        """Text exposition, adding the `snapshot()`s of other processes."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {
+                key: [list(counts), total, count]
+                for key, (counts, total, count) in self._series.items()
+            }
+        for snapshot in snapshots:
+            for key, counts, total, count in snapshot:
+                merged = series.setdefault(
+                    tuple(key), [[0] * len(self.buckets), 0.0, 0]
+                )
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_value(bound)
+                labels = _format_labels(self.labelnames, key, le=le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, le="+Inf")
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by `/metrics`."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"❌ 指标已注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        """Metric name -> `snapshot()` of every registered metric."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def write_snapshot(self, directory: str) -> None:
+        """Write this process's metrics to `<directory>/<pid>.json`."""
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        # 先写临时文件再替换，读取方不会看到写了一半的文件
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _read_snapshots(directory: str) -> List[dict]:
+        """Snapshots written by the other processes (this one is in memory)."""
+        own = f"{os.getpid()}.json"
+        snapshots = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️  跳过无法读取的指标快照 {name}: {e}")
+        return snapshots
+
+    def render(self, directory: Optional[str] = None) -> str:
+        """All metrics in the Prometheus text exposition format.
+
+        Args:
+            directory: Snapshot directory shared by the worker processes; the
+                metrics of every worker that wrote a snapshot there are summed
+                into this process's.
+        """
+        snapshots = self._read_snapshots(directory) if directory else []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return (
+            "\n".join(
+                metric.render([s.get(metric.name, []) for s in snapshots])
+                for metric in metrics
+            )
+            + "\n"
+        )
+
+
+def start_snapshot_writer(directory: str, interval: float) -> None:
+    """Write `REGISTRY` snapshots to `directory` every `interval` seconds.
+
+    Runs in a daemon thread of a worker process; the last snapshot is also
+    written at exit, so counts of a stopped worker are not lost.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def write() -> None:
+        try:
+            REGISTRY.write_snapshot(directory)
+        except OSError as e:
+            logger.warning(f"⚠️  写入指标快照失败: {e}")
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            write()
+
+    write()
+    atexit.register(write)
+    threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "rag_query_stage_seconds",
+        "Time spent in each stage of a query.",
+        labelnames=("stage",),
+    )
+)
+QUERY_SECONDS = REGISTRY.register(
+    Histogram(
+        "rag_query_seconds",
+        "End-to-end query time by outcome (answered, cached, error, cancelled).",
+        labelnames=("outcome",),
+    )
+)
+TTFT_SECONDS = REGISTRY.register(
+    Histogram(
+        "rag_time_to_first_token_seconds",
+        "Time from the start of a streaming query to its first answer token.",
+    )
+)
+HTTP_SECONDS = REGISTRY.register(
+    Histogram(
+        "rag_http_request_seconds",
+        "HTTP request handling time (until the response starts).",
+        labelnames=("method", "path", "status"),
+    )
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "rag_llm_tokens_total",
+        "LLM tokens reported by the API, by kind (prompt, completion).",
+        labelnames=("kind",),
+    )
+)
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "rag_cache_lookups_total",
+        "Cache lookups by cache (embedding, rerank, semantic) and result.",
+        labelnames=("cache", "result"),
+    )
+)
+RETRIEVAL_DECISIONS = REGISTRY.register(
+    Counter(
+        "rag_retrieval_decisions_total",
+        "Adaptive retrieval depth decisions (initial, expand, skip_rerank).",
+        labelnames=("decision",),
+    )
+)
+RERANK_CANDIDATES = REGISTRY.register(
+    Histogram(
+        "rag_rerank_candidates",
+        "Candidates sent to the reranker per query (0 when rerank is skipped).",
+        buckets=(0, 1, 2, 3, 5, 8, 10, 15, 20, 30, 50),
+    )
+)
+CONTEXT_TOKENS = REGISTRY.register(
+    Counter(
+        "rag_context_tokens_total",
+        "Chunk text tokens before and after context compression (stage).",
+        labelnames=("stage",),
+    )
+)
+
+_current_trace: contextvars.ContextVar[Optional["QueryTrace"]] = (
+    contextvars.ContextVar("rag_query_trace", default=None)
+)
+
+
+def current_trace() -> Optional["QueryTrace"]:
+    """The trace of the query running in this context, if any."""
+    return _current_trace.get()
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    """Count cache hits and misses, also on the active trace."""
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result="miss")
+    trace = _current_trace.get()
+    if trace is not None:
+        counts = trace.cache.setdefault(cache, {"hits": 0, "misses": 0})
+        counts["hits"] += hits
+        counts["misses"] += misses
+
+
+def record_retrieval(rerank_candidates: int, decision: Optional[str] = None) -> None:
+    """Count the rerank payload and adaptive depth decision of one query."""
+    RERANK_CANDIDATES.observe(rerank_candidates)
+    if decision is not None:
+        RETRIEVAL_DECISIONS.inc(decision=decision)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.retrieval["rerank_candidates"] += rerank_candidates
+        if decision is not None:
+            decisions = trace.retrieval.setdefault("decisions", {})
+            decisions[decision] = decisions.get(decision, 0) + 1
+
+
+def record_tokens(prompt: int = 0, completion: int = 0) -> None:
+    """Count LLM tokens, also on the active trace."""
+    if prompt:
+        LLM_TOKENS.inc(prompt, kind="prompt")
+    if completion:
+        LLM_TOKENS.inc(completion, kind="completion")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens["prompt"] += prompt
+        trace.tokens["completion"] += completion
+
+
+class QueryTrace:
+    """Stage timings, token usage and cache hits of one query.
+
+    Use `record()` around the whole query and `span(stage)` around each
+    stage; spans of the same stage add up. While recording, token usage,
+    cache lookups and retrieval decisions in the same context are attributed
+    to this trace.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.cache: Dict[str, Dict[str, int]] = {}
+        self.retrieval: Dict[str, Any] = {"rerank_candidates": 0}
+        self.first_token: Optional[float] = None
+        self.outcome = "answered"
+        self.duration: Optional[float] = None
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+
+    def mark_first_token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+
+    @contextmanager
+    def record(self):
+        """Make this the active trace and observe it into the metrics at exit."""
+        # 流式查询会跨 yield 持有 trace，退出时用 set 恢复而不是 reset(token)
+        previous = _current_trace.get()
+        _current_trace.set(self)
+        outcome = None
+        try:
+            yield self
+        except Exception:
+            outcome = "error"
+            raise
+        except BaseException:
+            outcome = "cancelled"
+            raise
+        finally:
+            _current_trace.set(previous)
+            self.finish(outcome or self.outcome)
+
+    def finish(self, outcome: str) -> None:
+        """Observe the trace into the histograms (only the first call counts)."""
+        if self.duration is not None:
+            return
+        self.outcome = outcome
+        self.duration = time.perf_counter() - self.start
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        QUERY_SECONDS.observe(self.duration, outcome=outcome)
+        if self.first_token is not None:
+            TTFT_SECONDS.observe(self.first_token)
+        logger.debug(
+            f"⏱️  查询耗时 {self.duration * 1000:.0f}ms ({outcome}): "
+            + ", ".join(f"{s} {t * 1000:.0f}ms" for s, t in self.stages.items())
+        )
+
+    def to_dict(self) -> dict:
+        """Timings in milliseconds plus token and cache counts (debug output)."""
+        total = self.duration
+        if total is None:
+            total = time.perf_counter() - self.start
+        result = {
+            "timings_ms": {s: round(t * 1000, 2) for s, t in self.stages.items()},
+            "total_ms": round(total * 1000, 2),
+            "tokens": dict(self.tokens),
+            "cache": {name: dict(counts) for name, counts in self.cache.items()},
+            "retrieval": {
+                k: dict(v) if isinstance(v, dict) else v
+                for k, v in self.retrieval.items()
+            },
+        }
+        if self.first_token is not None:
+            result["first_token_ms"] = round(self.first_token * 1000, 2)
+        return result
+
+
+def _get(obj: Any, name: str) -> Any:
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+_handler_lock = threading.Lock()
+_handler_installed = False
+
+
+def install_token_usage_handler() -> None:
+    """Record the `usage` the ZhipuAI API reports with each chat response.
+
+    Registers a llama_index event handler (once). Works for the sync SDK
+    response objects and the raw JSON of the async adapter; for streams the
+    usage arrives with the last chunk.
+    """
+    global _handler_installed
+    # llama_index 导入较慢，用到时才导入（api.py 启动时只需要指标本身）
+    from llama_index.core.instrumentation import get_dispatcher
+    from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+    from llama_index.core.instrumentation.events.llm import LLMChatEndEvent
+
+    class TokenUsageHandler(BaseEventHandler):
+        @classmethod
+        def class_name(cls) -> str:
+            return "TokenUsageHandler"
+
+        def handle(self, event, **kwargs: Any) -> None:
+            if not isinstance(event, LLMChatEndEvent) or event.response is None:
+                return
+            usage = _get(event.response.raw, "usage")
+            if usage:
+                record_tokens(
+                    prompt=int(_get(usage, "prompt_tokens") or 0),
+                    completion=int(_get(usage, "completion_tokens") or 0),
+                )
+
+    with _handler_lock:
+        if not _handler_installed:
+            get_dispatcher().add_event_handler(TokenUsageHandler())
+            _handler_installed = True
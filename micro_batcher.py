@@ -0,0 +1,120 @@
+"""Micro-batching of concurrent async calls into batched upstream requests."""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesce items submitted by concurrent callers into batched calls.
+
+    Items wait at most `max_wait` seconds for company; a batch is sent as soon
+    as it holds `max_batch_size` items. `process` receives the list of items
+    and must return one result per item, in order. If it raises, every caller
+    in that batch gets the exception.
+
+    Args:
+        process: Async callable mapping a list of items to a list of results
+        max_batch_size: Maximum number of items per upstream call
+        max_wait: Seconds the first item of a batch waits for more items
+        name: Name used in log messages
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        name: str = "batch",
+    ):
+        self.process = process
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.name = name
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach to the running loop (state from a previous loop is dropped)."""
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue several items and wait for their results (in order).
+
+        Items of one call may be split across batches when a batch fills up.
+        """
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._pending.append((item, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+
+        # 第一个等待的请求启动计时器，窗口结束时不满一批也会发送
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        """Send the pending items as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = self._loop.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.process([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name}: 返回 {len(results)} 个结果，期望 {len(batch)} 个"
+                )
+        except Exception as e:
+            logger.debug(f"⚠️  {self.name} 批次失败 ({len(batch)} 项): {e}")
+            for _, future in batch:
+                # 调用方已取消时 future 已完成，不再设置结果
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Batch counters (average batch size shows how much was coalesced)."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,499 @@
+"""Read-only, memory-mapped vector store with quantized vectors.
+
+`export_collection` writes a Chroma collection to a directory:
+
+    meta.json     count, dimension, distance space, quantization, index version
+    codes.npy     int8 (or float16) vectors, scanned by every query
+    scales.npy    per-vector int8 scale (max |x| / 127; ones for float16)
+    vectors.npy   float32 vectors, read only for the shortlist
+    sq_norms.npy  squared norms for the l2 space
+    nodes.sqlite  row -> node id, text and metadata
+
+`MmapVectorStore` memory-maps the arrays instead of loading them: opening is
+instant, only the quantized codes (a quarter of the float32 size for int8)
+stay resident, and processes serving the same export share them through the
+page cache. A query is a NumPy brute-force scan over the codes in blocks,
+followed by exact float32 rescoring of `top_k * rescore_factor` candidates.
+Scores match Chroma's (``exp(-distance)``), so the two backends are
+interchangeable behind the query engines.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, NodeWithScore, TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+logger = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 1
+# 粗排每次转换为 float32 的行数（控制临时内存：4096 × 1024 维 ≈ 16 MiB）
+_BLOCK_ROWS = 4096
+_QUANTIZATIONS = ("int8", "float16")
+_SPACES = ("l2", "cosine", "ip")
+
+
+def mmap_index_path(persist_dir: str, collection_name: str) -> str:
+    """Location of the memory-mapped export of a collection."""
+    return os.path.join(persist_dir, f"{collection_name}.mmap")
+
+
+def _quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (codes, scales) with ``vectors ≈ codes * scales[:, None]``."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def export_collection(
+    collection,
+    path: str,
+    quantization: str = "int8",
+    index_version: str = "",
+    page_size: int = 1000,
+) -> int:
+    """Write a Chroma collection as a memory-mapped index at `path`.
+
+    The export is written next to `path` and swapped in when complete, so a
+    running `MmapVectorStore` never sees a partial index.
+
+    Args:
+        collection: Chroma collection to export
+        path: Target directory (replaced if it exists)
+        quantization: "int8" or "float16" codes for the first-pass scan
+        index_version: Version token of the collection, stored in meta.json
+        page_size: Rows read from Chroma per request
+
+    Returns:
+        Number of exported vectors.
+    """
+    if quantization not in _QUANTIZATIONS:
+        raise ValueError(f"❌ 不支持的量化方式: {quantization}")
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    if space not in _SPACES:
+        raise ValueError(f"❌ 不支持的距离度量: {space}")
+
+    count = collection.count()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    db = sqlite3.connect(os.path.join(tmp_path, "nodes.sqlite"))
+    db.execute(
+        "CREATE TABLE nodes (row INTEGER PRIMARY KEY, node_id TEXT NOT NULL UNIQUE, "
+        "document TEXT, metadata TEXT NOT NULL)"
+    )
+    arrays = None
+    offset = 0
+    while offset < count:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=min(page_size, count - offset),
+            offset=offset,
+        )
+        if not len(page["ids"]):
+            break
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        if arrays is None:
+            arrays = _open_arrays(tmp_path, count, vectors.shape[1], quantization)
+        if space == "cosine":
+            # 余弦距离 = 1 - 归一化向量的点积，导出时归一化，查询时只需点积
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        rows = slice(offset, offset + len(vectors))
+        arrays["vectors"][rows] = vectors
+        arrays["codes"][rows], arrays["scales"][rows] = _quantize(vectors, quantization)
+        arrays["sq_norms"][rows] = np.einsum("ij,ij->i", vectors, vectors)
+        db.executemany(
+            "INSERT INTO nodes VALUES (?, ?, ?, ?)",
+            (
+                (offset + i, node_id, document, json.dumps(metadata or {}))
+                for i, (node_id, document, metadata) in enumerate(
+                    zip(page["ids"], page["documents"], page["metadatas"])
+                )
+            ),
+        )
+        offset += len(vectors)
+    db.commit()
+    db.close()
+
+    if arrays is None:
+        arrays = _open_arrays(tmp_path, 0, 0, quantization)
+    for array in arrays.values():
+        array.flush()
+    # 导出期间集合可能变小（并发删除），以实际写入的行数为准
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "format": _FORMAT_VERSION,
+                "count": offset,
+                "dimension": arrays["vectors"].shape[1],
+                "space": space,
+                "quantization": quantization,
+                "index_version": index_version,
+            },
+            f,
+        )
+    del arrays
+
+    old_path = f"{path}.{os.getpid()}.old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    # 已打开旧索引的进程仍持有映射，删除目录不影响它们
+    shutil.rmtree(old_path, ignore_errors=True)
+    return offset
+
+
+def export_is_current(path: str, index_version: str, quantization: str) -> bool:
+    """Whether the export at `path` matches the collection version and format."""
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return False
+    return (
+        meta.get("format") == _FORMAT_VERSION
+        and meta.get("index_version") == index_version
+        and meta.get("quantization") == quantization
+    )
+
+
+def _open_arrays(path: str, count: int, dimension: int, quantization: str) -> dict:
+    def create(name, dtype, shape):
+        return np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape
+        )
+
+    return {
+        "vectors": create("vectors", np.float32, (count, dimension)),
+        "codes": create("codes", np.dtype(quantization), (count, dimension)),
+        "scales": create("scales", np.float32, (count,)),
+        "sq_norms": create("sq_norms", np.float32, (count,)),
+    }
+
+
+def _to_node(node_id: str, document: str, metadata: dict) -> BaseNode:
+    try:
+        return metadata_dict_to_node(metadata, text=document)
+    except ValueError:
+        # 不是 llama_index 写入的记录（没有 _node_content），与 ChromaVectorStore 一样兜底
+        return TextNode(id_=node_id, text=document or "", metadata=metadata)
+
+
+class _MmapIndex:
+    """One opened export: memory-mapped arrays plus the node table."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != _FORMAT_VERSION:
+            raise ValueError(f"❌ 不支持的 mmap 索引格式: {path}")
+        self.count = self.meta["count"]
+        self.space = self.meta["space"]
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.codes = load("codes")
+        self.scales = load("scales")
+        self.sq_norms = load("sq_norms")
+        # float32 向量只读取候选行：用 pread 而不是映射，避免预读把整片文件计入常驻内存
+        vectors = load("vectors")
+        self._vectors_offset = vectors.offset
+        self._row_bytes = vectors.shape[1] * vectors.itemsize
+        del vectors
+        self._vectors = open(os.path.join(path, "vectors.npy"), "rb", buffering=0)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            f"file:{os.path.join(path, 'nodes.sqlite')}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+        # 进行中的查询数；close() 等最后一个查询结束后才关闭文件
+        self._users = 0
+        self._closing = False
+        self._users_lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Register a query using this index; False once it is closing."""
+        with self._users_lock:
+            if self._closing:
+                return False
+            self._users += 1
+            return True
+
+    def release(self) -> None:
+        """End a query started with `acquire`."""
+        with self._users_lock:
+            self._users -= 1
+            close_now = self._closing and self._users == 0
+        if close_now:
+            self._close_files()
+
+    def close(self) -> None:
+        """Close the node table and vector file once no query is using them."""
+        with self._users_lock:
+            if self._closing:
+                return
+            self._closing = True
+            close_now = self._users == 0
+        if close_now:
+            self._close_files()
+
+    def _close_files(self) -> None:
+        self._db.close()
+        self._vectors.close()
+
+    def _distances(self, queries: np.ndarray, dots: np.ndarray, rows) -> np.ndarray:
+        """Chroma distances from dot products of `queries` with `rows`."""
+        if self.space == "l2":
+            sq_queries = np.einsum("ij,ij->i", queries, queries)[:, None]
+            return self.sq_norms[rows] - 2 * dots + sq_queries
+        return 1 - dots
+
+    def search(
+        self, queries: np.ndarray, top_k: int, rescore_factor: int
+    ) -> List[List[Tuple[int, float]]]:
+        """(row, distance) pairs of the `top_k` nearest rows per query."""
+        if self.space == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+        shortlist = min(self.count, max(top_k, top_k * rescore_factor))
+        if shortlist == 0:
+            return [[] for _ in queries]
+
+        # 粗排：分块把量化向量转换为 float32 计算点积，只保留每块的候选
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, _BLOCK_ROWS):
+            rows = slice(start, min(start + _BLOCK_ROWS, self.count))
+            dots = (queries @ self.codes[rows].astype(np.float32).T) * self.scales[rows]
+            distances = self._distances(queries, dots, rows)
+            keep = min(shortlist, distances.shape[1])
+            part = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+            best = np.concatenate(
+                [best, np.take_along_axis(distances, part, axis=1)], axis=1
+            )
+            best_rows = np.concatenate([best_rows, part + start], axis=1)
+            if best.shape[1] > shortlist:
+                part = np.argpartition(best, shortlist - 1, axis=1)[:, :shortlist]
+                best = np.take_along_axis(best, part, axis=1)
+                best_rows = np.take_along_axis(best_rows, part, axis=1)
+
+        # 精排：只读取候选行的 float32 向量
+        results = []
+        for query, candidates in zip(queries, best_rows):
+            candidates = np.sort(candidates)
+            dots = self._read_vectors(candidates) @ query
+            distances = self._distances(query[None, :], dots[None, :], candidates)[0]
+            order = np.argsort(distances, kind="stable")[:top_k]
+            results.append(
+                [(int(candidates[i]), float(distances[i])) for i in order]
+            )
+        return results
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        fd = self._vectors.fileno()
+        data = b"".join(
+            os.pread(fd, self._row_bytes, self._vectors_offset + row * self._row_bytes)
+            for row in rows.tolist()
+        )
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), -1)
+
+    def nodes(self, column: str, keys: Sequence) -> dict:
+        """Nodes by row or node id, keyed by the same."""
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            records = self._db.execute(
+                f"SELECT {column}, node_id, document, metadata FROM nodes "
+                f"WHERE {column} IN ({placeholders})",
+                list(keys),
+            ).fetchall()
+        return {
+            key: _to_node(node_id, document, json.loads(metadata))
+            for key, node_id, document, metadata in records
+        }
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Read-only vector store over an export written by `export_collection`.
+
+    A new export at the same path (from the indexer) is picked up by the
+    next query. Metadata filters are not supported.
+
+    Args:
+        path: Export directory
+        rescore_factor: Candidates rescored exactly, as a multiple of top_k
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+    path: str
+    rescore_factor: int = 4
+
+    _index: Optional[_MmapIndex] = PrivateAttr(default=None)
+    _stamp: Optional[Tuple[int, int]] = PrivateAttr(default=None)
+    _reload_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, path: str, rescore_factor: int = 4, **kwargs: Any):
+        super().__init__(path=path, rescore_factor=rescore_factor, **kwargs)
+        self._open()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def _meta_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(os.path.join(self.path, "meta.json"))
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self) -> None:
+        stamp = self._meta_stamp()
+        old, self._index = self._index, _MmapIndex(self.path)
+        self._stamp = stamp
+        if old is not None:
+            # 进行中的查询仍可使用旧索引，结束后再关闭
+            old.close()
+        logger.info(
+            f"📂 加载 mmap 索引: {self.path} ({self._index.count} 个向量, "
+            f"{self._index.meta['quantization']})"
+        )
+
+    def _current(self) -> _MmapIndex:
+        """The opened export, reopened if the indexer replaced it."""
+        try:
+            stamp = self._meta_stamp()
+        except FileNotFoundError:
+            # 导出正在替换目录，继续使用已打开的索引
+            return self._index
+        if stamp != self._stamp:
+            with self._reload_lock:
+                if stamp != self._stamp:
+                    self._open()
+        return self._index
+
+    @contextmanager
+    def _using(self) -> Iterator[_MmapIndex]:
+        """The current index, kept open until the block exits."""
+        index = self._current()
+        while not index.acquire():
+            # 刚被替换：新索引已经就位
+            index = self._current()
+        try:
+            yield index
+        finally:
+            index.release()
+
+    def close(self) -> None:
+        """Close the opened export (after queries still using it finish)."""
+        self._index.close()
+
+    def count(self) -> int:
+        return self._current().count
+
+    def warm_up(self) -> None:
+        """Read the quantized codes into the page cache."""
+        with self._using() as index:
+            for start in range(0, index.count, _BLOCK_ROWS):
+                np.asarray(index.codes[start : start + _BLOCK_ROWS]).sum()
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        raise NotImplementedError(
+            "MmapVectorStore 是只读的，请在 Chroma 中索引后重新导出"
+        )
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise NotImplementedError(
+            "MmapVectorStore 是只读的，请在 Chroma 中索引后重新导出"
+        )
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[BaseNode]:
+        if filters is not None:
+            raise NotImplementedError("MmapVectorStore 不支持元数据过滤")
+        with self._using() as index:
+            nodes = index.nodes("node_id", node_ids or [])
+        return [nodes[node_id] for node_id in node_ids or [] if node_id in nodes]
+
+    def _search(
+        self, query_embeddings: List[List[float]], top_k: int
+    ) -> List[Tuple[List[BaseNode], List[float], List[str]]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        with self._using() as index:
+            hits = index.search(queries, top_k, self.rescore_factor)
+            rows = sorted({row for pairs in hits for row, _ in pairs})
+            nodes = index.nodes("row", rows)
+        results = []
+        for pairs in hits:
+            matched = [nodes[row] for row, _ in pairs]
+            results.append(
+                (
+                    matched,
+                    # 与 ChromaVectorStore 相同的相似度换算
+                    [float(np.exp(-distance)) for _, distance in pairs],
+                    [node.node_id for node in matched],
+                )
+            )
+        return results
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("MmapVectorStore 不支持元数据过滤")
+        if not query.query_embedding:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        nodes, similarities, ids = self._search(
+            [query.query_embedding], query.similarity_top_k
+        )[0]
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def query_batch(
+        self, query_embeddings: List[List[float]], top_k: int
+    ) -> List[List[NodeWithScore]]:
+        """Top-k nodes for each query embedding, from a single scan."""
+        if not query_embeddings:
+            return []
+        return [
+            [
+                NodeWithScore(node=node, score=score)
+                for node, score in zip(nodes, similarities)
+            ]
+            for nodes, similarities, _ in self._search(query_embeddings, top_k)
+        ]
+
+    async def aquery_batch(
+        self, query_embeddings: List[List[float]], top_k: int
+    ) -> List[List[NodeWithScore]]:
+        return await asyncio.to_thread(self.query_batch, query_embeddings, top_k)
@@ -0,0 +1,119 @@
+"""Per-request settings of the query pipeline.
+
+`QueryService` keeps one set of shared components (index, retrievers,
+rerankers, compressor, response synthesizers); a `QueryOptions` only says
+how a single request uses them, so varying top_k, rerank, top_n, response
+mode or token budget per request does not build a new query engine.
+
+Like `metadata_filters`, this module does not import llama_index at import
+time, so the API can validate options before the query service has loaded.
+"""
+
+from typing import Any, Dict, Optional
+
+import config
+from metadata_filters import parse_filters
+
+# llama_index ResponseMode 中会用到检索上下文的模式
+RESPONSE_MODES = (
+    "compact",
+    "refine",
+    "tree_summarize",
+    "simple_summarize",
+    "accumulate",
+    "compact_accumulate",
+    "no_text",
+)
+# 不支持流式输出的模式（流式请求一次性返回完整答案）
+NON_STREAMING_RESPONSE_MODES = ("accumulate", "compact_accumulate")
+DEFAULT_RESPONSE_MODE = "compact"
+
+
+class InvalidQueryOptionError(ValueError):
+    """A per-request query option is out of range or unknown."""
+
+
+def _check_range(name: str, value: Optional[int], upper: Optional[int]) -> None:
+    if value is None:
+        return
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise InvalidQueryOptionError(f"❌ {name} 必须是正整数: {value!r}")
+    if upper is not None and value > upper:
+        raise InvalidQueryOptionError(f"❌ {name} 不能超过 {upper}: {value}")
+
+
+class QueryOptions:
+    """How one request runs the shared query pipeline.
+
+    Options left at None use the service configuration.
+
+    Args:
+        top_k: Candidates to retrieve (dense, and fused when hybrid)
+        filters: Metadata filter expression (see `parse_filters`), applied
+            inside the vector search
+        rerank: Whether the configured reranker runs
+        top_n: Nodes kept after retrieval and rerank (defaults to
+            `config.RERANK_TOP_N` with rerank, all retrieved nodes without)
+        response_mode: llama_index response mode, one of `RESPONSE_MODES`
+        token_budget: Context compression budget in tokens (compresses even
+            when `config.USE_CONTEXT_COMPRESSION` is off)
+
+    Raises:
+        InvalidQueryOptionError: If an option is out of range or unknown.
+        InvalidFilterError: If `filters` cannot be parsed.
+    """
+
+    __slots__ = (
+        "top_k",
+        "filters",
+        "metadata_filters",
+        "rerank",
+        "top_n",
+        "response_mode",
+        "token_budget",
+    )
+
+    def __init__(
+        self,
+        top_k: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        rerank: bool = True,
+        top_n: Optional[int] = None,
+        response_mode: Optional[str] = None,
+        token_budget: Optional[int] = None,
+    ):
+        _check_range("top_k", top_k, config.MAX_QUERY_TOP_K)
+        _check_range("top_n", top_n, config.MAX_QUERY_TOP_K)
+        _check_range("token_budget", token_budget, None)
+        if response_mode is not None and response_mode not in RESPONSE_MODES:
+            raise InvalidQueryOptionError(
+                f"❌ 不支持的 response_mode '{response_mode}'，"
+                f"可用: {', '.join(RESPONSE_MODES)}"
+            )
+        self.top_k = top_k
+        self.filters = filters
+        self.metadata_filters = None if filters is None else parse_filters(filters)
+        self.rerank = bool(rerank)
+        self.top_n = top_n
+        self.response_mode = response_mode
+        self.token_budget = token_budget
+
+    @property
+    def is_default(self) -> bool:
+        """Whether the request runs the pipeline exactly as configured."""
+        return (
+            self.top_k is None
+            and self.filters is None
+            and self.rerank
+            and self.top_n is None
+            and self.response_mode in (None, DEFAULT_RESPONSE_MODE)
+            and self.token_budget is None
+        )
+
+    def __repr__(self) -> str:
+        settings = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for name in self.__slots__
+            if name != "metadata_filters"
+        )
+        return f"QueryOptions({settings})"
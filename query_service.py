@@ -1,114 +1,1363 @@
 """Query service for RAG system."""
 
+import asyncio
+import json
 import logging
+import os
+import time
+from typing import List, Optional
 
-import chromadb
 from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.postprocessor import SimilarityPostprocessor
-from llama_index.embeddings.zhipuai import ZhipuAIEmbedding
-from llama_index.llms.zhipuai import ZhipuAI
-from llama_index.vector_stores.chroma import ChromaVectorStore
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import QueryBundle
 
 import config
-from reranker import TEIReranker
+from adaptive_retrieval import EXPAND, SKIP_RERANK, AdaptiveDepth
+from async_adapters import (
+    AsyncChromaVectorStore,
+    AsyncZhipuAI,
+    AsyncZhipuAIEmbedding,
+)
+from bm25_index import BM25Index, lexical_index_path
+from chroma_backend import connect_chroma
+from collection_pool import (
+    CollectionNotFoundError,
+    EnginePool,
+    validate_collection_name,
+)
+from context_compressor import ContextCompressor
+from embedding_cache import CachedEmbedding, EmbeddingCache
+from hybrid_retriever import HybridRetriever
+from index_manifest import manifest_path
+from index_snapshot import (
+    IndexSnapshot,
+    import_snapshot,
+    imported_snapshot_id,
+    snapshot_path,
+)
+from index_version import bump_index_version, read_index_version
+from metadata_filters import InvalidFilterError
+from metrics import (
+    QueryTrace,
+    install_token_usage_handler,
+    record_cache,
+    record_retrieval,
+)
+from mmap_vector_store import (
+    MmapVectorStore,
+    export_collection,
+    export_is_current,
+    mmap_index_path,
+)
+from query_options import (
+    DEFAULT_RESPONSE_MODE,
+    NON_STREAMING_RESPONSE_MODES,
+    QueryOptions,
+)
+from rerank_cache import RerankScoreCache
+from reranker import LocalReranker, TEIReranker
+from semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
 
+class CollectionEngine:
+    """Retriever and per-collection state for one Chroma collection.
+
+    Args:
+        name: Collection name
+        collection: The Chroma collection (None when serving an mmap export)
+        vector_store: Vector store over the collection
+        index: `VectorStoreIndex` over the vector store (for per-request
+            retrievers)
+        retriever: Retriever over the collection (dense or hybrid)
+        lexical_index: BM25 index of the collection, if hybrid search is on
+        semantic_cache: Answer cache of this collection, if enabled
+    """
+
+    def __init__(
+        self,
+        name: str,
+        collection,
+        vector_store,
+        index,
+        retriever,
+        lexical_index,
+        semantic_cache,
+    ):
+        self.name = name
+        self.collection = collection
+        self.vector_store = vector_store
+        self.index = index
+        self.retriever = retriever
+        self.lexical_index = lexical_index
+        self.semantic_cache = semantic_cache
+        self.index_version = read_index_version(config.CHROMA_PERSIST_DIR, name)
+
+
+class RequestPipeline:
+    """The query pipeline of one request, made of shared components.
+
+    Built by `QueryService.pipeline` from a collection's engine and the
+    request's `QueryOptions`. Nothing here is constructed per request except
+    (with top_k or filters) a retriever over the collection's index; the
+    rerankers, compressor and response synthesizers are the service's.
+
+    Args:
+        engine: The collection's engine
+        retriever: Retriever of this request
+        rerankers: Rerank postprocessors to run (empty to skip rerank)
+        top_n: Nodes kept after retrieval and rerank, or None to keep all
+        token_budget: Context compression budget, or None to not compress
+        adaptive: Adaptive depth policy, if this request uses it
+        synthesizer: Response synthesizer returning the whole answer
+        streaming_synthesizer: Response synthesizer returning a token stream
+        cacheable: Whether answers may be read from and stored in the
+            semantic cache (only for the configured pipeline)
+    """
+
+    __slots__ = (
+        "engine",
+        "retriever",
+        "rerankers",
+        "top_n",
+        "token_budget",
+        "adaptive",
+        "synthesizer",
+        "streaming_synthesizer",
+        "cacheable",
+    )
+
+    def __init__(
+        self,
+        engine: CollectionEngine,
+        retriever,
+        rerankers: list,
+        top_n: Optional[int],
+        token_budget: Optional[int],
+        adaptive: Optional[AdaptiveDepth],
+        synthesizer,
+        streaming_synthesizer,
+        cacheable: bool,
+    ):
+        self.engine = engine
+        self.retriever = retriever
+        self.rerankers = rerankers
+        self.top_n = top_n
+        self.token_budget = token_budget
+        self.adaptive = adaptive
+        self.synthesizer = synthesizer
+        self.streaming_synthesizer = streaming_synthesizer
+        self.cacheable = cacheable
+
+
 class QueryService:
-    """Handles querying the RAG system."""
+    """Handles querying the RAG system.
+
+    Each collection (tenant) gets its own retriever and semantic cache,
+    built on first use and kept in an LRU `EnginePool`; the Chroma client,
+    models, rerankers and response synthesizers are shared by all
+    collections. Each request combines them into a `RequestPipeline`
+    according to its `QueryOptions`.
+    """
 
-    def __init__(self):
-        """Initialize query service."""
+    def __init__(self, warm_up: bool = True):
+        """Initialize query service.
+
+        Args:
+            warm_up: Load the default collection now (see `warm_up`); the API
+                server passes False and warms up in the background instead.
+        """
         # 验证 API key
         if not config.ZHIPUAI_API_KEY:
             raise ValueError("❌ ZHIPUAI_API_KEY 未设置！请在 .env 文件中配置 API key")
 
-        # 配置模型
-        self.llm = ZhipuAI(
+        # 配置模型（异步调用走连接池，不阻塞事件循环）
+        self.llm = AsyncZhipuAI(
             model=config.LLM_MODEL,
             api_key=config.ZHIPUAI_API_KEY,
+            base_url=config.ZHIPUAI_BASE_URL,
+            max_connections=config.HTTP_MAX_CONNECTIONS,
         )
 
-        self.embed_model = ZhipuAIEmbedding(
+        self.embed_model = AsyncZhipuAIEmbedding(
             model=config.EMBEDDING_MODEL,
             api_key=config.ZHIPUAI_API_KEY,
+            base_url=config.ZHIPUAI_BASE_URL,
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            timeout=config.EMBEDDING_TIMEOUT,
         )
+        # 微批：并发请求的查询 embedding 在几毫秒窗口内合并成一次调用
+        self._embed_client = self.embed_model
+        if config.USE_MICRO_BATCHING:
+            self._embed_client.enable_micro_batching(
+                max_batch_size=config.MICRO_BATCH_MAX_SIZE,
+                max_wait=config.MICRO_BATCH_MAX_WAIT_MS / 1000,
+            )
+        if config.USE_EMBEDDING_CACHE:
+            self.embed_model = CachedEmbedding(
+                self.embed_model,
+                cache=EmbeddingCache(
+                    path=config.EMBEDDING_CACHE_PATH,
+                    max_memory_entries=config.EMBEDDING_CACHE_MEMORY_SIZE,
+                    max_disk_entries=config.EMBEDDING_CACHE_DISK_SIZE,
+                    ttl=config.EMBEDDING_CACHE_TTL,
+                ),
+            )
 
         Settings.llm = self.llm
         Settings.embed_model = self.embed_model
+        # 记录每次 LLM 调用返回的 token 用量（/metrics 与 debug 输出）
+        install_token_usage_handler()
 
-        # 连接到现有的 Chroma 数据库
-        self.chroma_client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+        # 连接到现有的 Chroma 数据库（所有集合共用一个客户端；多 worker 时连接共享的服务器）
+        # mmap 模式只读取 indexer 导出的文件，不需要 Chroma
+        if config.VECTOR_DB_TYPE not in ("chroma", "mmap"):
+            raise ValueError(f"❌ 不支持的向量库类型: {config.VECTOR_DB_TYPE}")
+        self.chroma_client = None
+        if config.VECTOR_DB_TYPE == "chroma":
+            self.chroma_client = connect_chroma()
+        # 已检查过快照的集合：引擎被池淘汰后重建时不再导入
+        self._snapshot_checked = set()
 
-        try:
-            self.chroma_collection = self.chroma_client.get_collection(
-                name=config.COLLECTION_NAME
+        # 配置 node postprocessors（包括 rerank，所有集合共用）
+        self.node_postprocessors = self._setup_postprocessors()
+        # 自适应检索深度：按向量分数分布决定检索多少、送多少候选给 rerank
+        self.adaptive_depth = None
+        if config.USE_ADAPTIVE_RETRIEVAL:
+            self.adaptive_depth = AdaptiveDepth(
+                initial_top_k=min(
+                    config.ADAPTIVE_INITIAL_TOP_K, config.SIMILARITY_TOP_K
+                ),
+                max_top_k=config.SIMILARITY_TOP_K,
+                confident_margin=config.ADAPTIVE_CONFIDENT_MARGIN,
+                flat_spread=config.ADAPTIVE_FLAT_SPREAD,
+                trim_gap=config.ADAPTIVE_TRIM_GAP,
+                min_candidates=config.RERANK_TOP_N,
             )
-        except Exception as e:
-            raise RuntimeError(
-                f"❌ 未找到索引！请先运行 'python indexer.py' 构建索引。\n错误: {e}"
+            logger.info(
+                f"✅ 自适应检索深度启用: 向量检索 {self.adaptive_depth.initial_top_k}"
+                f"~{config.SIMILARITY_TOP_K}"
             )
+        # 上下文压缩在 rerank 之后单独执行（句子 embedding 走同一个缓存）
+        # 关闭时也创建，请求指定 token_budget 时仍可压缩
+        self.context_compressor = ContextCompressor(
+            self.embed_model,
+            token_budget=config.CONTEXT_TOKEN_BUDGET,
+            dedup_threshold=config.CONTEXT_DEDUP_THRESHOLD,
+            neighbor_weight=config.CONTEXT_NEIGHBOR_WEIGHT,
+        )
+        if config.USE_CONTEXT_COMPRESSION:
+            logger.info(f"✅ 上下文压缩启用: 预算={config.CONTEXT_TOKEN_BUDGET} tokens")
+
+        # 答案合成器按 (response_mode, 是否流式) 创建一次，所有集合和请求共用
+        self._synthesizers: dict = {}
+        for streaming in (False, True):
+            self._synthesizer(DEFAULT_RESPONSE_MODE, streaming)
+        self._default_options = QueryOptions()
+
+        # 每个集合的查询引擎按需创建，LRU 淘汰不活跃的集合
+        self.engines = EnginePool(
+            self._build_engine,
+            max_size=config.COLLECTION_POOL_SIZE,
+            idle_ttl=config.COLLECTION_IDLE_TTL,
+        )
+        if warm_up:
+            self.warm_up()
+
+        logger.info("✅ 查询服务初始化完成")
+
+    def warm_up(self) -> dict:
+        """Load the default collection so the first query does not pay for it.
 
-        # 从现有存储加载索引
-        vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
-        self.index = VectorStoreIndex.from_vector_store(
+        Builds its engine (which checks that the index exists), pulls the
+        vector index into memory (Chroma's HNSW index, or the quantized codes
+        of an mmap export) and touches the BM25 index.
+
+        Returns:
+            Seconds spent on each step.
+        """
+        timings = {}
+        start = time.perf_counter()
+        engine = self.engines.get(config.COLLECTION_NAME)
+        timings["engine_s"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        engine.vector_store.warm_up()
+        if engine.lexical_index is not None:
+            engine.lexical_index.search("warm up", 1)
+        timings["indexes_s"] = round(time.perf_counter() - start, 3)
+
+        logger.info(f"🔥 预热完成 ({engine.name}): {timings}")
+        return timings
+
+    def readiness(self) -> dict:
+        """State of the components a query depends on (for `/readyz`)."""
+        engine = self.engines.get(config.COLLECTION_NAME)
+        lexical = "disabled"
+        if engine.lexical_index is not None:
+            lexical = "ok" if engine.lexical_index.count() else "empty"
+        rerank = "disabled"
+        for postprocessor in self.node_postprocessors:
+            rerank = getattr(postprocessor, "status", "ok")
+        return {
+            "collection": {
+                "name": engine.name,
+                "chunks": engine.vector_store.count(),
+            },
+            "lexical_index": lexical,
+            "rerank": rerank,
+            "pooled_collections": self.engines.stats()["size"],
+        }
+
+    def _build_engine(self, name: str) -> CollectionEngine:
+        """Load a collection and build its retriever."""
+        collection, vector_store = self._open_vector_store(name)
+        index = VectorStoreIndex.from_vector_store(
             vector_store=vector_store,
             embed_model=self.embed_model,
         )
+        retriever, lexical_index = self._build_retriever(name, index, vector_store)
 
-        # 配置 node postprocessors（包括 rerank）
-        node_postprocessors = self._setup_postprocessors()
+        # 语义缓存：相似问题直接返回缓存答案，跳过检索、rerank 和 LLM
+        semantic_cache = None
+        if config.USE_SEMANTIC_CACHE:
+            semantic_cache = SemanticCache(
+                threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                max_size=config.SEMANTIC_CACHE_MAX_SIZE,
+                ttl=config.SEMANTIC_CACHE_TTL,
+            )
 
-        # 创建查询引擎
-        self.query_engine = self.index.as_query_engine(
-            similarity_top_k=config.SIMILARITY_TOP_K,
-            response_mode="compact",
-            node_postprocessors=node_postprocessors,
+        return CollectionEngine(
+            name=name,
+            collection=collection,
+            vector_store=vector_store,
+            index=index,
+            retriever=retriever,
+            lexical_index=lexical_index,
+            semantic_cache=semantic_cache,
         )
 
-        logger.info("✅ 查询服务初始化完成")
+    def _open_vector_store(self, name: str):
+        """Open the vector store of a collection.
+
+        Returns:
+            (Chroma collection or None for an mmap export, vector store)
+
+        Raises:
+            CollectionNotFoundError: If the collection has not been indexed.
+        """
+        if config.INDEX_SNAPSHOT_DIR:
+            self._import_snapshot(name)
+
+        command = "python indexer.py"
+        if name != config.COLLECTION_NAME:
+            command += f" --collection {name}"
+
+        if config.VECTOR_DB_TYPE == "mmap":
+            path = mmap_index_path(config.CHROMA_PERSIST_DIR, name)
+            if not os.path.exists(path):
+                raise CollectionNotFoundError(
+                    f"❌ 未找到 mmap 索引 '{name}'！请先运行 "
+                    f"'{command} --export-mmap' 导出索引。"
+                )
+            return None, MmapVectorStore(
+                path, rescore_factor=config.MMAP_RESCORE_FACTOR
+            )
+
+        try:
+            collection = self.chroma_client.get_collection(name=name)
+        except Exception as e:
+            raise CollectionNotFoundError(
+                f"❌ 未找到索引 '{name}'！请先运行 '{command}' 构建索引。\n错误: {e}"
+            )
+        return collection, AsyncChromaVectorStore(chroma_collection=collection)
+
+    def _import_snapshot(self, name: str) -> None:
+        """Load the collection from `config.INDEX_SNAPSHOT_DIR` if it is newer.
+
+        Checked the first time a process opens the collection only, so a
+        snapshot published while serving is picked up at the next start-up,
+        not when an evicted engine is rebuilt. A snapshot is imported once:
+        the Chroma collection (or the mmap export) records the snapshot id,
+        and later start-ups with the same snapshot open it directly. Worker
+        processes sharing the persist directory import one at a time.
+
+        Raises:
+            SnapshotError: If the snapshot was built with another embedding
+                model or is corrupt.
+        """
+        if name in self._snapshot_checked:
+            return
+        self._snapshot_checked.add(name)
+        path = snapshot_path(config.INDEX_SNAPSHOT_DIR, name)
+        if not os.path.exists(path):
+            return
+        snapshot = IndexSnapshot(path)
+        snapshot.check_embedding_model(config.EMBEDDING_MODEL)
+
+        os.makedirs(config.CHROMA_PERSIST_DIR, exist_ok=True)
+        lock_path = os.path.join(config.CHROMA_PERSIST_DIR, f"{name}.snapshot.lock")
+        # 只在导入快照时需要（fcntl 仅 POSIX 可用）
+        import fcntl
+
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if config.VECTOR_DB_TYPE == "mmap":
+                target = mmap_index_path(config.CHROMA_PERSIST_DIR, name)
+                if export_is_current(
+                    target, snapshot.snapshot_id, config.MMAP_QUANTIZATION
+                ):
+                    return
+            else:
+                try:
+                    collection = self.chroma_client.get_collection(name=name)
+                    if imported_snapshot_id(collection) == snapshot.snapshot_id:
+                        return
+                except Exception:
+                    pass
+
+            start = time.perf_counter()
+            snapshot.verify()
+            if config.VECTOR_DB_TYPE == "mmap":
+                # 不经过 Chroma，直接把快照转换为 mmap 索引
+                export_collection(
+                    snapshot,
+                    target,
+                    quantization=config.MMAP_QUANTIZATION,
+                    index_version=snapshot.snapshot_id,
+                )
+            else:
+                import_snapshot(
+                    self.chroma_client,
+                    snapshot,
+                    name,
+                    batch_size=config.CHROMA_WRITE_BATCH_SIZE,
+                )
+            if config.USE_HYBRID_SEARCH:
+                lexical_index = BM25Index(
+                    lexical_index_path(config.CHROMA_PERSIST_DIR, name),
+                    k1=config.BM25_K1,
+                    b=config.BM25_B,
+                )
+                lexical_index.clear()
+                for page in snapshot.pages(config.CHROMA_WRITE_BATCH_SIZE):
+                    lexical_index.add(zip(page["ids"], page["documents"]))
+                lexical_index.close()
+            snapshot.restore_manifest(manifest_path(config.CHROMA_PERSIST_DIR, name))
+            bump_index_version(config.CHROMA_PERSIST_DIR, name)
+            logger.info(
+                f"📦 已导入索引快照 ({name}): {snapshot.count()} 个块, "
+                f"{time.perf_counter() - start:.1f}s ({path})"
+            )
+
+    def engine(self, collection: Optional[str] = None) -> CollectionEngine:
+        """Return the pooled engine of a collection (default collection if None).
+
+        Raises:
+            InvalidCollectionNameError: If the name is not valid.
+            CollectionNotFoundError: If the collection has not been indexed.
+        """
+        return self.engines.get(
+            validate_collection_name(collection or config.COLLECTION_NAME)
+        )
+
+    async def aengine(self, collection: Optional[str] = None) -> CollectionEngine:
+        """Async `engine`; loading a cold collection runs in a worker thread."""
+        return await self.engines.aget(
+            validate_collection_name(collection or config.COLLECTION_NAME)
+        )
 
     def _setup_postprocessors(self) -> list:
         """Setup node postprocessors including reranker.
 
+        The rerankers only reorder the candidates: they keep up to
+        `config.MAX_QUERY_TOP_K` nodes and the request's top_n is cut in
+        `_postprocess`, so one reranker serves every top_n.
+
         Returns:
             List of postprocessors to apply to retrieved nodes.
         """
         postprocessors = []
+        candidates = (
+            config.HYBRID_TOP_K if config.USE_HYBRID_SEARCH else config.SIMILARITY_TOP_K
+        )
 
         if config.USE_RERANK:
             try:
-                reranker = TEIReranker(
-                    api_url=config.RERANK_API_URL,
-                    top_n=config.RERANK_TOP_N,
-                    timeout=config.RERANK_TIMEOUT,
-                )
+                if config.RERANK_BACKEND == "local":
+                    reranker = self._build_local_reranker()
+                    logger.info(
+                        f"✅ 本地 Rerank 启用: {config.LOCAL_RERANK_MODEL}, "
+                        f"初始检索={candidates}, "
+                        f"rerank后={config.RERANK_TOP_N}"
+                    )
+                else:
+                    fallback = None
+                    if config.RERANK_LOCAL_FALLBACK:
+                        fallback = self._build_local_reranker()
+                    reranker = TEIReranker(
+                        api_url=config.RERANK_API_URL,
+                        top_n=config.MAX_QUERY_TOP_K,
+                        timeout=config.RERANK_TIMEOUT,
+                        max_connections=config.HTTP_MAX_CONNECTIONS,
+                        max_retries=config.RERANK_MAX_RETRIES,
+                        failure_threshold=config.RERANK_CIRCUIT_FAILURES,
+                        probe_interval=config.RERANK_PROBE_INTERVAL,
+                        score_cache=self._build_rerank_cache(),
+                        fallback=fallback,
+                        verify_in_background=True,
+                    )
+                    logger.info(
+                        f"✅ TEI Rerank 启用: {config.RERANK_API_URL}, "
+                        f"初始检索={candidates}, "
+                        f"rerank后={config.RERANK_TOP_N}"
+                    )
+                if config.USE_MICRO_BATCHING:
+                    reranker.enable_micro_batching(
+                        max_batch_size=config.RERANK_MICRO_BATCH_MAX_SIZE,
+                        max_wait=config.MICRO_BATCH_MAX_WAIT_MS / 1000,
+                    )
                 postprocessors.append(reranker)
-                logger.info(
-                    f"✅ TEI Rerank 启用: {config.RERANK_API_URL}, "
-                    f"初始检索={config.SIMILARITY_TOP_K}, "
-                    f"rerank后={config.RERANK_TOP_N}"
-                )
             except Exception as e:
                 logger.warning(f"⚠️  Rerank 初始化失败: {e}")
 
         return postprocessors
 
-    def query(self, question: str, return_sources: bool = True):
+    @staticmethod
+    def _build_rerank_cache():
+        """Score cache for one reranker (scores of different models never mix)."""
+        # 热门问题反复 rerank 相同的文档块，分数可以复用
+        if not config.USE_RERANK_CACHE:
+            return None
+        return RerankScoreCache(
+            max_entries=config.RERANK_CACHE_SIZE, ttl=config.RERANK_CACHE_TTL
+        )
+
+    def _build_local_reranker(self) -> LocalReranker:
+        """Create the in-process cross-encoder reranker."""
+        return LocalReranker(
+            model_name=config.LOCAL_RERANK_MODEL,
+            top_n=config.MAX_QUERY_TOP_K,
+            batch_size=config.LOCAL_RERANK_BATCH_SIZE,
+            max_length=config.LOCAL_RERANK_MAX_LENGTH,
+            max_workers=config.LOCAL_RERANK_WORKERS,
+            device=config.LOCAL_RERANK_DEVICE,
+            score_cache=self._build_rerank_cache(),
+        )
+
+    def _build_retriever(self, name: str, index, vector_store):
+        """Create the dense retriever, fused with BM25 if hybrid search is on.
+
+        Returns:
+            (retriever, BM25 index or None)
+        """
+        vector_retriever = index.as_retriever(similarity_top_k=config.SIMILARITY_TOP_K)
+        if not config.USE_HYBRID_SEARCH:
+            return vector_retriever, None
+
+        lexical_index = BM25Index(
+            lexical_index_path(config.CHROMA_PERSIST_DIR, name),
+            k1=config.BM25_K1,
+            b=config.BM25_B,
+            max_df_ratio=config.BM25_MAX_DF_RATIO,
+        )
+        if lexical_index.count() == 0:
+            logger.warning(
+                f"⚠️  集合 '{name}' 的 BM25 索引为空，请运行 'python indexer.py' 生成"
+                "（暂时只有向量检索结果）"
+            )
+        logger.info(
+            f"✅ 混合检索启用 ({name}): 向量={config.SIMILARITY_TOP_K}, "
+            f"BM25={config.LEXICAL_TOP_K}, 融合后={config.HYBRID_TOP_K}"
+        )
+        retriever = HybridRetriever(
+            vector_retriever,
+            lexical_index,
+            vector_store,
+            lexical_top_k=config.LEXICAL_TOP_K,
+            top_k=config.HYBRID_TOP_K,
+            rrf_k=config.RRF_K,
+        )
+        return retriever, lexical_index
+
+    def _request_retriever(self, engine: CollectionEngine, options: QueryOptions):
+        """Retriever for one request's top_k and metadata filters.
+
+        Without either, the collection's retriever is returned. Otherwise a
+        retriever is built over the collection's index (not a new
+        `VectorStoreIndex`); the filters become a Chroma `where` clause, so
+        the vector search itself is narrowed.
+
+        Raises:
+            InvalidFilterError: If the collection is served from an mmap
+                export, which cannot filter.
+        """
+        if options.top_k is None and options.metadata_filters is None:
+            return engine.retriever
+        if options.metadata_filters is not None and engine.collection is None:
+            raise InvalidFilterError("❌ mmap 索引不支持元数据过滤")
+
+        vector_retriever = engine.index.as_retriever(
+            similarity_top_k=options.top_k or config.SIMILARITY_TOP_K,
+            filters=options.metadata_filters,
+        )
+        if engine.lexical_index is None:
+            return vector_retriever
+        return HybridRetriever(
+            vector_retriever,
+            engine.lexical_index,
+            engine.vector_store,
+            lexical_top_k=config.LEXICAL_TOP_K,
+            top_k=options.top_k or config.HYBRID_TOP_K,
+            rrf_k=config.RRF_K,
+            filters=options.metadata_filters,
+        )
+
+    def _synthesizer(self, response_mode: str, streaming: bool):
+        """Response synthesizer of a mode, built on first use and then shared."""
+        if response_mode in NON_STREAMING_RESPONSE_MODES:
+            # 这些模式不能流式输出，流式请求在最后一次性返回答案
+            streaming = False
+        key = (response_mode, streaming)
+        synthesizer = self._synthesizers.get(key)
+        if synthesizer is None:
+            synthesizer = get_response_synthesizer(
+                llm=self.llm, response_mode=response_mode, streaming=streaming
+            )
+            self._synthesizers[key] = synthesizer
+        return synthesizer
+
+    def pipeline(
+        self, engine: CollectionEngine, options: Optional[QueryOptions] = None
+    ) -> RequestPipeline:
+        """Combine the shared components into one request's pipeline.
+
+        Costs a few microseconds (no query engine or index is built), or a
+        retriever construction when the request sets top_k or filters.
+
+        Args:
+            engine: Engine of the collection to query.
+            options: The request's options; None runs the configured pipeline.
+
+        Raises:
+            InvalidFilterError: If filters are given for an mmap export.
+        """
+        options = options or self._default_options
+        retriever = self._request_retriever(engine, options)
+        token_budget = options.token_budget
+        if token_budget is None and config.USE_CONTEXT_COMPRESSION:
+            token_budget = config.CONTEXT_TOKEN_BUDGET
+        response_mode = options.response_mode or DEFAULT_RESPONSE_MODE
+        rerankers = self.node_postprocessors if options.rerank else []
+        # 不 rerank 时只在请求指定 top_n 时截取，否则保留全部检索结果
+        top_n = options.top_n
+        if top_n is None and rerankers:
+            top_n = config.RERANK_TOP_N
+        # 自适应深度只用于默认的检索深度和 top_n
+        adaptive = None
+        if (
+            retriever is engine.retriever
+            and options.rerank
+            and options.top_n is None
+        ):
+            adaptive = self.adaptive_depth
+        return RequestPipeline(
+            engine=engine,
+            retriever=retriever,
+            rerankers=rerankers,
+            top_n=top_n,
+            token_budget=token_budget,
+            adaptive=adaptive,
+            synthesizer=self._synthesizer(response_mode, streaming=False),
+            streaming_synthesizer=self._synthesizer(response_mode, streaming=True),
+            cacheable=options.is_default,
+        )
+
+    def retrieve(
+        self, question: str, collection: Optional[str] = None, **options
+    ) -> list:
+        """Nodes an answer to the question would be synthesized from.
+
+        Runs embedding, retrieval, rerank and context compression but not the
+        LLM, e.g. to check that evaluation answers stay in the context.
+
+        Args:
+            question: The question to retrieve context for.
+            collection: Collection (tenant) to query; defaults to
+                `config.COLLECTION_NAME`.
+            **options: Per-request settings, see `QueryOptions`.
+        """
+        options = QueryOptions(**options)
+        pipeline = self.pipeline(self.engine(collection), options)
+        bundle = QueryBundle(
+            question, embedding=self.embed_model.get_query_embedding(question)
+        )
+        return self._retrieve(pipeline, bundle, QueryTrace())
+
+    def query(
+        self,
+        question: str,
+        return_sources: bool = True,
+        collection: Optional[str] = None,
+        debug: bool = False,
+        **options,
+    ):
         """Query the RAG system.
 
         Args:
             question: The question to query.
             return_sources: Whether to return source nodes.
+            collection: Collection (tenant) to query; defaults to
+                `config.COLLECTION_NAME`.
+            debug: Whether to add per-stage timings, token and cache counts
+                under ``"debug"``.
+            **options: Per-request pipeline settings (`top_k`, `filters`,
+                `rerank`, `top_n`, `response_mode`, `token_budget`), see
+                `QueryOptions`; e.g. ``filters={"doc_type": "pdf"}`` narrows
+                the vector search itself.
 
         Returns:
             Dictionary containing question, answer, and optional sources.
+
+        Raises:
+            InvalidQueryOptionError: If an option is out of range or unknown.
+            InvalidFilterError: If `filters` cannot be parsed.
         """
+        options = QueryOptions(**options)
         logger.info(f"🔍 查询: {question}")
 
-        response = self.query_engine.query(question)
+        trace = QueryTrace()
+        with trace.record():
+            engine = self.engine(collection)
+            pipeline = self.pipeline(engine, options)
+            with trace.span("embed"):
+                embedding = self.embed_model.get_query_embedding(question)
+            # 缓存的答案来自默认流水线；指定了选项的请求不读写语义缓存
+            cache_key = embedding if pipeline.cacheable else None
+            cached = self._lookup_semantic_cache(
+                engine, question, cache_key, return_sources
+            )
+            if cached is not None:
+                trace.outcome = "cached"
+                return self._with_debug(cached, trace, debug)
+
+            bundle = QueryBundle(question, embedding=embedding)
+            nodes = self._retrieve(pipeline, bundle, trace)
+            with trace.span("synthesize"):
+                response = pipeline.synthesizer.synthesize(bundle, nodes)
+            with trace.span("serialize"):
+                result = self._build_result(
+                    engine, question, response, cache_key, return_sources
+                )
+            return self._with_debug(result, trace, debug)
+
+    async def aquery(
+        self,
+        question: str,
+        return_sources: bool = True,
+        collection: Optional[str] = None,
+        debug: bool = False,
+        **options,
+    ):
+        """Query the RAG system without blocking the event loop.
 
+        Args:
+            question: The question to query.
+            return_sources: Whether to return source nodes.
+            collection: Collection (tenant) to query; defaults to
+                `config.COLLECTION_NAME`.
+            debug: Whether to add per-stage timings, token and cache counts
+                under ``"debug"``.
+            **options: Per-request pipeline settings (`top_k`, `filters`,
+                `rerank`, `top_n`, `response_mode`, `token_budget`), see
+                `QueryOptions`; e.g. ``filters={"doc_type": "pdf"}`` narrows
+                the vector search itself.
+
+        Returns:
+            Dictionary containing question, answer, and optional sources.
+
+        Raises:
+            InvalidQueryOptionError: If an option is out of range or unknown.
+            InvalidFilterError: If `filters` cannot be parsed.
+        """
+        options = QueryOptions(**options)
+        logger.info(f"🔍 查询: {question}")
+
+        trace = QueryTrace()
+        with trace.record():
+            engine = await self.aengine(collection)
+            pipeline = self.pipeline(engine, options)
+            with trace.span("embed"):
+                embedding = await self.embed_model.aget_query_embedding(question)
+            # 缓存的答案来自默认流水线；指定了选项的请求不读写语义缓存
+            cache_key = embedding if pipeline.cacheable else None
+            cached = self._lookup_semantic_cache(
+                engine, question, cache_key, return_sources
+            )
+            if cached is not None:
+                trace.outcome = "cached"
+                return self._with_debug(cached, trace, debug)
+
+            bundle = QueryBundle(question, embedding=embedding)
+            nodes = await self._aretrieve(pipeline, bundle, trace)
+            with trace.span("synthesize"):
+                response = await pipeline.synthesizer.asynthesize(bundle, nodes)
+            with trace.span("serialize"):
+                result = self._build_result(
+                    engine, question, response, cache_key, return_sources
+                )
+            return self._with_debug(result, trace, debug)
+
+    def stream_query(
+        self,
+        question: str,
+        return_sources: bool = True,
+        collection: Optional[str] = None,
+        debug: bool = False,
+        **options,
+    ):
+        """Query the RAG system and stream the answer as it is generated.
+
+        Args:
+            question: The question to query.
+            return_sources: Whether to return source nodes.
+            collection: Collection (tenant) to query; defaults to
+                `config.COLLECTION_NAME`.
+            debug: Whether to add per-stage timings, token and cache counts
+                to the ``done`` event.
+            **options: Per-request pipeline settings, see `QueryOptions`.
+
+        Yields:
+            Event dictionaries: one ``{"event": "sources", "sources": [...]}``,
+            then ``{"event": "token", "delta": ...}`` per answer token and a
+            final ``{"event": "done", "answer": ...}``.
+        """
+        options = QueryOptions(**options)
+        logger.info(f"🔍 流式查询: {question}")
+
+        trace = QueryTrace()
+        with trace.record():
+            engine = self.engine(collection)
+            pipeline = self.pipeline(engine, options)
+            with trace.span("embed"):
+                embedding = self.embed_model.get_query_embedding(question)
+            # 缓存的答案来自默认流水线；指定了选项的请求不读写语义缓存
+            cache_key = embedding if pipeline.cacheable else None
+            cached = self._lookup_semantic_cache(
+                engine, question, cache_key, return_sources
+            )
+            if cached is not None:
+                trace.outcome = "cached"
+                cached = self._with_debug(cached, trace, debug)
+                yield from self._cached_events(cached)
+                return
+
+            bundle = QueryBundle(question, embedding=embedding)
+            nodes = self._retrieve(pipeline, bundle, trace)
+            with trace.span("serialize"):
+                sources = self._format_sources(nodes)
+            yield {"event": "sources", "sources": sources if return_sources else []}
+
+            answer = ""
+            with trace.span("synthesize"):
+                response = pipeline.streaming_synthesizer.synthesize(bundle, nodes)
+                for delta in getattr(response, "response_gen", None) or [str(response)]:
+                    trace.mark_first_token()
+                    answer += delta
+                    yield {"event": "token", "delta": delta}
+
+            self._remember(engine, cache_key, question, answer, sources)
+            yield self._with_debug({"event": "done", "answer": answer}, trace, debug)
+
+    async def astream_query(
+        self,
+        question: str,
+        return_sources: bool = True,
+        collection: Optional[str] = None,
+        debug: bool = False,
+        **options,
+    ):
+        """Async version of `stream_query` that does not block the event loop.
+
+        Args:
+            question: The question to query.
+            return_sources: Whether to return source nodes.
+            collection: Collection (tenant) to query; defaults to
+                `config.COLLECTION_NAME`.
+            debug: Whether to add per-stage timings, token and cache counts
+                to the ``done`` event.
+            **options: Per-request pipeline settings, see `QueryOptions`.
+
+        Yields:
+            The same event dictionaries as `stream_query`.
+        """
+        options = QueryOptions(**options)
+        logger.info(f"🔍 流式查询: {question}")
+
+        trace = QueryTrace()
+        with trace.record():
+            engine = await self.aengine(collection)
+            pipeline = self.pipeline(engine, options)
+            with trace.span("embed"):
+                embedding = await self.embed_model.aget_query_embedding(question)
+            # 缓存的答案来自默认流水线；指定了选项的请求不读写语义缓存
+            cache_key = embedding if pipeline.cacheable else None
+            cached = self._lookup_semantic_cache(
+                engine, question, cache_key, return_sources
+            )
+            if cached is not None:
+                trace.outcome = "cached"
+                cached = self._with_debug(cached, trace, debug)
+                for event in self._cached_events(cached):
+                    yield event
+                return
+
+            bundle = QueryBundle(question, embedding=embedding)
+            nodes = await self._aretrieve(pipeline, bundle, trace)
+            with trace.span("serialize"):
+                sources = self._format_sources(nodes)
+            yield {"event": "sources", "sources": sources if return_sources else []}
+
+            answer = ""
+            # 合成耗时包含整个 token 流（首 token 时间单独记录）
+            with trace.span("synthesize"):
+                response = await pipeline.streaming_synthesizer.asynthesize(
+                    bundle, nodes
+                )
+                if hasattr(response, "async_response_gen"):
+                    async for delta in response.async_response_gen():
+                        trace.mark_first_token()
+                        answer += delta
+                        yield {"event": "token", "delta": delta}
+                else:
+                    # 没有检索到内容或模式不支持流式时直接返回完整的 Response
+                    answer = str(response)
+                    trace.mark_first_token()
+                    yield {"event": "token", "delta": answer}
+
+            self._remember(engine, cache_key, question, answer, sources)
+            yield self._with_debug({"event": "done", "answer": answer}, trace, debug)
+
+    async def query_many(
+        self,
+        questions: List[str],
+        concurrency: Optional[int] = None,
+        return_sources: bool = True,
+        collection: Optional[str] = None,
+        debug: bool = False,
+        **options,
+    ):
+        """Answer many questions, yielding each result as soon as it is ready.
+
+        Questions are prepared in waves of `config.QUERY_BATCH_WAVE_SIZE`:
+        a wave is embedded in batched calls (coalesced by the micro-batcher),
+        retrieved with a single Chroma query and reranked concurrently, so
+        rerank requests are packed. LLM synthesis runs with at most
+        `concurrency` calls in flight.
+
+        Args:
+            questions: The questions to answer.
+            concurrency: Maximum concurrent LLM calls (defaults to
+                `config.QUERY_BATCH_CONCURRENCY`).
+            return_sources: Whether to return source nodes.
+            collection: Collection (tenant) to query.
+            debug: Whether to add per-stage timings to each result; the
+                embed/retrieve/rerank stages are those of the question's wave.
+            **options: Pipeline settings for every question, see
+                `QueryOptions`.
+
+        Yields:
+            Result dictionaries as returned by `aquery` plus the question's
+            ``index`` in `questions`, in completion order. A failed question
+            yields ``{"index", "question", "error"}`` instead.
+        """
+        options = QueryOptions(**options)
+        engine = await self.aengine(collection)
+        pipeline = self.pipeline(engine, options)
+        concurrency = concurrency or config.QUERY_BATCH_CONCURRENCY
+        wave_size = config.QUERY_BATCH_WAVE_SIZE
+        semaphore = asyncio.Semaphore(concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        pending = set()
+
+        logger.info(f"📦 批量查询: {len(questions)} 个问题, LLM 并发={concurrency}")
+
+        async def answer(index: int, bundle: QueryBundle, nodes, trace) -> None:
+            try:
+                with trace.record():
+                    async with semaphore:
+                        with trace.span("synthesize"):
+                            response = await pipeline.synthesizer.asynthesize(
+                                bundle, nodes
+                            )
+                    with trace.span("serialize"):
+                        result = self._build_result(
+                            engine,
+                            bundle.query_str,
+                            response,
+                            bundle.embedding if pipeline.cacheable else None,
+                            return_sources,
+                        )
+                    result = self._with_debug(result, trace, debug)
+            except Exception as e:
+                result = {"question": bundle.query_str, "error": str(e)}
+            results.put_nowait({"index": index, **result})
+
+        async def produce() -> None:
+            for start in range(0, len(questions), wave_size):
+                # 合成任务积压时先等待，准备好的上下文不会无限堆积
+                while len(pending) >= concurrency * 2:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                wave = questions[start : start + wave_size]
+                wave_trace = QueryTrace()
+                try:
+                    prepared = await self._aprepare_wave(
+                        pipeline, wave, return_sources, wave_trace
+                    )
+                except Exception as e:
+                    logger.error(f"❌ 批量查询准备失败: {e}")
+                    for offset, question in enumerate(wave):
+                        results.put_nowait(
+                            {
+                                "index": start + offset,
+                                "question": question,
+                                "error": str(e),
+                            }
+                        )
+                    continue
+
+                for offset, (bundle, item) in enumerate(prepared):
+                    # 每个问题单独计时，准备阶段沿用整波的耗时
+                    trace = QueryTrace()
+                    trace.start = wave_trace.start
+                    trace.stages = dict(wave_trace.stages)
+                    if isinstance(item, dict):  # 语义缓存命中
+                        trace.finish("cached")
+                        item = self._with_debug(item, trace, debug)
+                        results.put_nowait({"index": start + offset, **item})
+                        continue
+                    task = asyncio.create_task(
+                        answer(start + offset, bundle, item, trace)
+                    )
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(len(questions)):
+                yield await results.get()
+        finally:
+            producer.cancel()
+            for task in list(pending):
+                task.cancel()
+
+    async def _aprepare_wave(
+        self,
+        pipeline: RequestPipeline,
+        questions: List[str],
+        return_sources: bool,
+        trace: QueryTrace,
+    ) -> list:
+        """Embed, retrieve and rerank a wave of questions together.
+
+        Returns:
+            One (query bundle, cached result dict or reranked nodes) per question.
+        """
+        engine = pipeline.engine
+        with trace.span("embed"):
+            embeddings = await asyncio.gather(
+                *(self.embed_model.aget_query_embedding(q) for q in questions)
+            )
+        bundles = [QueryBundle(q, embedding=e) for q, e in zip(questions, embeddings)]
+
+        items = [
+            self._lookup_semantic_cache(
+                engine,
+                b.query_str,
+                b.embedding if pipeline.cacheable else None,
+                return_sources,
+            )
+            for b in bundles
+        ]
+        todo = [i for i, item in enumerate(items) if item is None]
+        if not todo:
+            return list(zip(bundles, items))
+
+        if pipeline.adaptive is not None:
+            reranked = await self._aretrieve_adaptive(
+                pipeline, [bundles[i] for i in todo], trace
+            )
+        else:
+            with trace.span("retrieve"):
+                if pipeline.retriever is engine.retriever:
+                    # 一次 Chroma 查询检索整波问题
+                    dense = await engine.vector_store.aquery_batch(
+                        [bundles[i].embedding for i in todo], config.SIMILARITY_TOP_K
+                    )
+                    if isinstance(engine.retriever, HybridRetriever):
+                        dense = await engine.retriever.afuse_many(
+                            [bundles[i] for i in todo], dense
+                        )
+                else:
+                    # 请求自己的检索器（top_k / 过滤条件）逐个问题并发检索
+                    dense = await asyncio.gather(
+                        *(pipeline.retriever.aretrieve(bundles[i]) for i in todo)
+                    )
+
+            with trace.span("rerank"):
+                # 并发 rerank，由 rerank 微批打包成少量请求
+                reranked = await asyncio.gather(
+                    *(
+                        self._apostprocess(pipeline, nodes, bundles[i])
+                        for i, nodes in zip(todo, dense)
+                    )
+                )
+        if pipeline.token_budget is not None:
+            with trace.span("compress"):
+                reranked = await asyncio.gather(
+                    *(
+                        self.context_compressor.acompress(
+                            nodes, bundles[i], pipeline.token_budget
+                        )
+                        for i, nodes in zip(todo, reranked)
+                    )
+                )
+        for i, nodes in zip(todo, reranked):
+            items[i] = nodes
+        return list(zip(bundles, items))
+
+    def _retrieve(
+        self, pipeline: RequestPipeline, query_bundle: QueryBundle, trace: QueryTrace
+    ) -> list:
+        """Retrieve, rerank and compress the candidates, timing each stage."""
+        if pipeline.adaptive is not None:
+            nodes = self._retrieve_adaptive(pipeline, query_bundle, trace)
+        else:
+            with trace.span("retrieve"):
+                nodes = pipeline.retriever.retrieve(query_bundle)
+            with trace.span("rerank"):
+                nodes = self._postprocess(pipeline, nodes, query_bundle)
+        if pipeline.token_budget is not None:
+            with trace.span("compress"):
+                nodes = self.context_compressor.compress(
+                    nodes, query_bundle, pipeline.token_budget
+                )
+        return nodes
+
+    async def _aretrieve(
+        self, pipeline: RequestPipeline, query_bundle: QueryBundle, trace: QueryTrace
+    ) -> list:
+        """Async `_retrieve`."""
+        if pipeline.adaptive is not None:
+            nodes = await self._aretrieve_adaptive(pipeline, [query_bundle], trace)
+            nodes = nodes[0]
+        else:
+            with trace.span("retrieve"):
+                nodes = await pipeline.retriever.aretrieve(query_bundle)
+            with trace.span("rerank"):
+                nodes = await self._apostprocess(pipeline, nodes, query_bundle)
+        if pipeline.token_budget is not None:
+            with trace.span("compress"):
+                nodes = await self.context_compressor.acompress(
+                    nodes, query_bundle, pipeline.token_budget
+                )
+        return nodes
+
+    def _adaptive_candidates(self, engine: CollectionEngine, bundles, dense) -> list:
+        """Trimmed dense candidates, fused with trimmed BM25 ones if hybrid."""
+        depth = self.adaptive_depth
+        dense = [depth.trim(nodes) for nodes in dense]
+        if not isinstance(engine.retriever, HybridRetriever):
+            return dense
+        return engine.retriever.fuse_many(
+            bundles, dense, lexical_trim=self._trim_lexical
+        )
+
+    def _trim_lexical(self, lexical: list) -> list:
+        return self.adaptive_depth.trim(lexical, score=lambda hit: hit[1])
+
+    def _retrieve_adaptive(
+        self, pipeline: RequestPipeline, query_bundle: QueryBundle, trace: QueryTrace
+    ) -> list:
+        """Retrieve and rerank with the depth chosen from the dense scores."""
+        depth = pipeline.adaptive
+        engine = pipeline.engine
+        embedding = [query_bundle.embedding]
+        with trace.span("retrieve"):
+            dense = engine.vector_store.query_batch(embedding, depth.initial_top_k)[0]
+            decision = depth.decide(dense)
+            if decision == EXPAND:
+                dense = engine.vector_store.query_batch(embedding, depth.max_top_k)[0]
+            nodes = self._adaptive_candidates(engine, [query_bundle], [dense])[0]
+        if decision == SKIP_RERANK:
+            # 向量检索第一名遥遥领先：仍融合 BM25 候选（精确词命中），只跳过 rerank
+            record_retrieval(0, decision)
+            return nodes[: pipeline.top_n]
+        with trace.span("rerank"):
+            return self._postprocess(pipeline, nodes, query_bundle, decision)
+
+    async def _aretrieve_adaptive(
+        self, pipeline: RequestPipeline, bundles: List[QueryBundle], trace: QueryTrace
+    ) -> list:
+        """Async `_retrieve_adaptive` for several questions (one Chroma call each)."""
+        depth = pipeline.adaptive
+        engine = pipeline.engine
+        embeddings = [b.embedding for b in bundles]
+        with trace.span("retrieve"):
+            dense = await engine.vector_store.aquery_batch(
+                embeddings, depth.initial_top_k
+            )
+            decisions = [depth.decide(nodes) for nodes in dense]
+            expand = [i for i, d in enumerate(decisions) if d == EXPAND]
+            if expand:
+                more = await engine.vector_store.aquery_batch(
+                    [embeddings[i] for i in expand], depth.max_top_k
+                )
+                for i, nodes in zip(expand, more):
+                    dense[i] = nodes
+            candidates = await asyncio.to_thread(
+                self._adaptive_candidates, engine, bundles, dense
+            )
+
+        # 跳过 rerank 的问题直接取融合后的前 top_n 个
+        results = []
+        for nodes, decision in zip(candidates, decisions):
+            if decision == SKIP_RERANK:
+                record_retrieval(0, decision)
+            results.append(nodes[: pipeline.top_n])
+        todo = [i for i, d in enumerate(decisions) if d != SKIP_RERANK]
+        with trace.span("rerank"):
+            reranked = await asyncio.gather(
+                *(
+                    self._apostprocess(
+                        pipeline, candidates[i], bundles[i], decisions[i]
+                    )
+                    for i in todo
+                )
+            )
+        for i, nodes in zip(todo, reranked):
+            results[i] = nodes
+        return results
+
+    def _postprocess(
+        self,
+        pipeline: RequestPipeline,
+        nodes,
+        query_bundle: QueryBundle,
+        decision: Optional[str] = None,
+    ):
+        """Rerank retrieved nodes and keep the request's top_n."""
+        if not pipeline.rerankers:
+            record_retrieval(0, decision)
+            return nodes[: pipeline.top_n]
+        record_retrieval(len(nodes), decision)
+        for postprocessor in pipeline.rerankers:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        return nodes[: pipeline.top_n]
+
+    async def _apostprocess(
+        self,
+        pipeline: RequestPipeline,
+        nodes,
+        query_bundle: QueryBundle,
+        decision: Optional[str] = None,
+    ):
+        """Async `_postprocess`."""
+        if not pipeline.rerankers:
+            record_retrieval(0, decision)
+            return nodes[: pipeline.top_n]
+        record_retrieval(len(nodes), decision)
+        for postprocessor in pipeline.rerankers:
+            nodes = await postprocessor.apostprocess_nodes(
+                nodes, query_bundle=query_bundle
+            )
+        return nodes[: pipeline.top_n]
+
+    @staticmethod
+    def _with_debug(result: dict, trace: QueryTrace, debug: bool) -> dict:
+        """Attach the trace to a result (or done event) when debugging."""
+        if debug:
+            result["debug"] = trace.to_dict()
+        return result
+
+    @staticmethod
+    def _cached_events(result: dict):
+        """Replay a cached result as stream events."""
+        yield {"event": "sources", "sources": result["sources"]}
+        yield {"event": "token", "delta": result["answer"]}
+        done = {"event": "done", "answer": result["answer"]}
+        if "debug" in result:
+            done["debug"] = result["debug"]
+        yield done
+
+    def _lookup_semantic_cache(
+        self,
+        engine: CollectionEngine,
+        question: str,
+        embedding: list,
+        return_sources: bool,
+    ):
+        """Return a cached result for a near-duplicate question, if any."""
+        if engine.semantic_cache is None or embedding is None:
+            return None
+
+        # 索引被 indexer 修改后，缓存的答案可能已过时
+        version = read_index_version(config.CHROMA_PERSIST_DIR, engine.name)
+        if version != engine.index_version:
+            logger.info(f"🔄 索引 '{engine.name}' 已更新，清空语义缓存")
+            engine.semantic_cache.clear()
+            engine.index_version = version
+
+        result = engine.semantic_cache.lookup(embedding)
+        if result is None:
+            record_cache("semantic", misses=1)
+            return None
+
+        record_cache("semantic", hits=1)
+
+        logger.info("⚡ 语义缓存命中")
+        result["question"] = question
+        if not return_sources:
+            result["sources"] = []
+        return result
+
+    def _build_result(
+        self,
+        engine: CollectionEngine,
+        question: str,
+        response,
+        embedding,
+        return_sources: bool,
+    ):
+        """Format a response and remember it in the semantic cache."""
+        result = self._format_result(question, response, return_sources=True)
+        self._remember(
+            engine, embedding, question, result["answer"], result["sources"]
+        )
+
+        if not return_sources:
+            result["sources"] = []
+        return result
+
+    def _remember(
+        self,
+        engine: CollectionEngine,
+        embedding,
+        question: str,
+        answer: str,
+        sources: list,
+    ):
+        """Store a finished answer in the collection's semantic cache, if enabled."""
+        if engine.semantic_cache is not None and embedding is not None:
+            engine.semantic_cache.store(
+                embedding, {"question": question, "answer": answer, "sources": sources}
+            )
+
+    def _format_result(self, question: str, response, return_sources: bool):
+        """Convert a query engine response into the API result dictionary."""
         result = {
             "question": question,
             "answer": str(response),
@@ -116,22 +1365,84 @@ class QueryService:
         }
 
         if return_sources and hasattr(response, "source_nodes"):
-            for i, node in enumerate(response.source_nodes, 1):
-                source = {
-                    "chunk_id": i,
-                    "score": node.score,
-                    "text": node.text[:100] + "..."
-                    if len(node.text) > 100
-                    else node.text,
-                    "metadata": node.node.metadata,
-                }
-                result["sources"].append(source)
+            result["sources"] = self._format_sources(response.source_nodes)
 
         return result
 
+    @staticmethod
+    def _format_sources(source_nodes) -> list:
+        """Convert retrieved nodes into the API source dictionaries."""
+        sources = []
+        for i, node in enumerate(source_nodes, 1):
+            source = {
+                "chunk_id": i,
+                "score": node.score,
+                "text": node.text[:100] + "..." if len(node.text) > 100 else node.text,
+                "metadata": node.node.metadata,
+            }
+            sources.append(source)
+        return sources
+
+    def cache_stats(self) -> dict:
+        """Return hit/miss counters of the enabled caches."""
+        stats = {}
+        if isinstance(self.embed_model, CachedEmbedding):
+            stats["embedding"] = self.embed_model.cache.stats()
+        semantic = {
+            engine.name: engine.semantic_cache.stats()
+            for engine in self.engines.values()
+            if engine.semantic_cache is not None
+        }
+        if semantic:
+            stats["semantic"] = semantic
+        for postprocessor in self.node_postprocessors:
+            if getattr(postprocessor, "score_cache", None) is not None:
+                stats["rerank"] = postprocessor.score_cache.stats()
+        return stats
+
+    def pool_stats(self) -> dict:
+        """Return hit/miss/eviction counters of the collection engine pool."""
+        return self.engines.stats()
+
+    def batching_stats(self) -> dict:
+        """Return counters of the enabled micro-batchers."""
+        stats = {}
+        if self._embed_client.batcher is not None:
+            stats["embedding"] = self._embed_client.batcher.stats()
+        for postprocessor in self.node_postprocessors:
+            if getattr(postprocessor, "batcher", None) is not None:
+                stats["rerank"] = postprocessor.batcher.stats()
+        return stats
+
+    async def aclose(self) -> None:
+        """Release pooled async HTTP clients."""
+        await self.llm.aclose()
+        await self._embed_client.aclose()
+        for postprocessor in self.node_postprocessors:
+            if hasattr(postprocessor, "aclose"):
+                await postprocessor.aclose()
+
 
 def main():
     """Interactive query mode."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Interactive RAG query")
+    parser.add_argument(
+        "--stream", action="store_true", help="Print the answer as it is generated"
+    )
+    parser.add_argument(
+        "--collection",
+        default=None,
+        help=f"Collection (tenant) to query (default: {config.COLLECTION_NAME})",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Print per-stage timings, token and cache counts after each answer",
+    )
+    args = parser.parse_args()
+
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -151,12 +1462,30 @@ def main():
         if not question:
             continue
 
-        result = service.query(question)
+        if args.stream:
+            result = {"sources": []}
+            print("\n" + "=" * 70)
+            print("💡 回答:")
+            print("-" * 70)
+            for event in service.stream_query(
+                question, collection=args.collection, debug=args.debug
+            ):
+                if event["event"] == "sources":
+                    result["sources"] = event["sources"]
+                elif event["event"] == "token":
+                    print(event["delta"], end="", flush=True)
+                elif event["event"] == "done" and "debug" in event:
+                    result["debug"] = event["debug"]
+            print()
+        else:
+            result = service.query(
+                question, collection=args.collection, debug=args.debug
+            )
 
-        print("\n" + "=" * 70)
-        print("💡 回答:")
-        print("-" * 70)
-        print(result["answer"])
+            print("\n" + "=" * 70)
+            print("💡 回答:")
+            print("-" * 70)
+            print(result["answer"])
 
         if result["sources"]:
             print("\n" + "=" * 70)
@@ -165,6 +1494,10 @@ def main():
                 print(f"\n📄 来源 {src['chunk_id']} (相似度: {src['score']:.4f})")
                 print(f"   {src['text']}")
                 print(f"   📌 {src['metadata']}")
+        if "debug" in result:
+            print("\n" + "=" * 70)
+            print("⏱️  各阶段耗时:")
+            print(json.dumps(result["debug"], ensure_ascii=False, indent=2))
         print("=" * 70)
 
 
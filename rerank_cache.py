@@ -0,0 +1,81 @@
+"""In-memory LRU cache of cross-encoder rerank scores."""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from embedding_cache import normalize_text
+
+
+class RerankScoreCache:
+    """LRU cache of (query, chunk) relevance scores.
+
+    Keys combine the normalized query, the node ID and a hash of the chunk
+    text, so an edited chunk never reuses the score of its old content.
+
+    Args:
+        max_entries: Maximum number of cached scores
+        ttl: Entry lifetime in seconds, or None to never expire
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._scores: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, node_id: str, text: str) -> str:
+        """Build the cache key for a (query, chunk) pair."""
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        payload = f"{normalize_text(query)}\x00{node_id}\x00{content_hash}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        """Return cached scores for the keys that are present."""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._scores.get(key)
+                if entry is None or (
+                    self.ttl is not None and now - entry[0] > self.ttl
+                ):
+                    self._scores.pop(key, None)
+                    self.misses += 1
+                    continue
+                self._scores.move_to_end(key)
+                found[key] = entry[1]
+                self.hits += 1
+        return found
+
+    def put_many(self, scores: Dict[str, float]) -> None:
+        """Store scores, evicting the least recently used entries."""
+        now = time.time()
+        with self._lock:
+            for key, score in scores.items():
+                self._scores[key] = (now, score)
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._scores),
+            }
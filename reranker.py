@@ -1,49 +1,247 @@
-"""Custom reranker using text-embeddings-router API."""
+"""Rerankers: text-embeddings-router (TEI) API or an in-process cross-encoder."""
 
+import asyncio
 import logging
-from typing import List, Optional
+import random
+import threading
+import time
+from abc import abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
 
+import httpx
 import requests
+from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.schema import NodeWithScore, QueryBundle
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CircuitBreaker
+from metrics import record_cache
+from micro_batcher import MicroBatcher
+from rerank_cache import RerankScoreCache
 
 logger = logging.getLogger(__name__)
 
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class _RetryableStatus(Exception):
+    """TEI answered with a status worth retrying."""
+
+
+def length_buckets(lengths: List[int], batch_size: int) -> List[List[int]]:
+    """Group indices into batches of similar length, longest first.
+
+    Each batch is padded only to its own longest text instead of the longest
+    text of the whole request.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class _ScoreCachingReranker(BaseNodePostprocessor):
+    """Shared score-cache handling and top-n selection for the rerankers."""
+
+    top_n: int
+
+    _score_cache: Optional[RerankScoreCache] = PrivateAttr(default=None)
+    _batcher: Optional[MicroBatcher] = PrivateAttr(default=None)
+
+    @property
+    def score_cache(self) -> Optional[RerankScoreCache]:
+        return self._score_cache
+
+    @property
+    def batcher(self) -> Optional[MicroBatcher]:
+        return self._batcher
+
+    @abstractmethod
+    async def _ascore_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score a mixed batch of (query, passage) pairs."""
+
+    def enable_micro_batching(self, max_batch_size: int, max_wait: float) -> None:
+        """Pack (query, passage) pairs of concurrent async reranks together.
+
+        Args:
+            max_batch_size: Maximum pairs per scoring call
+            max_wait: Seconds a rerank waits for others to join its batch
+        """
+        self._batcher = MicroBatcher(
+            self._ascore_pairs,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            name=f"{self.class_name()} micro-batch",
+        )
+
+    def _lookup_scores(
+        self, query_str: str, nodes: List[NodeWithScore]
+    ) -> Tuple[List[str], List[Optional[float]]]:
+        """Cache keys and cached scores (None where missing) for the nodes."""
+        if self._score_cache is None:
+            return [], [None] * len(nodes)
+        keys = [
+            self._score_cache.make_key(query_str, n.node.node_id, n.node.get_content())
+            for n in nodes
+        ]
+        cached = self._score_cache.get_many(keys)
+        record_cache("rerank", hits=len(cached), misses=len(keys) - len(cached))
+        return keys, [cached.get(key) for key in keys]
+
+    def _store_scores(
+        self,
+        keys: List[str],
+        scores: List[Optional[float]],
+        missing: List[int],
+        fresh: List[float],
+    ) -> None:
+        """Fill in freshly computed scores and remember them."""
+        for i, score in zip(missing, fresh):
+            scores[i] = score
+        if keys:
+            self._score_cache.put_many({keys[i]: scores[i] for i in missing})
+
+    def _apply_scores(
+        self, nodes: List[NodeWithScore], scores: List[float]
+    ) -> List[NodeWithScore]:
+        """Reorder nodes by rerank score and keep the top_n."""
+        order = sorted(range(len(nodes)), key=lambda i: scores[i], reverse=True)
+        reranked_nodes = []
+        for i in order[: self.top_n]:
+            # 更新节点分数
+            node = nodes[i]
+            node.score = scores[i]
+            reranked_nodes.append(node)
+
+        logger.info(f"🎯 Rerank 完成: {len(nodes)} → {len(reranked_nodes)} 个文档")
+        return reranked_nodes
+
 
-class TEIReranker(BaseNodePostprocessor):
+class TEIReranker(_ScoreCachingReranker):
     """Reranker using Text Embeddings Inference (TEI) API.
 
     This reranker calls a local TEI service for reranking documents.
     TEI should be running with a rerank model like:
     cross-encoder/ms-marco-MiniLM-L-6-v2
 
+    Requests go through keep-alive connection pools and share one deadline
+    (`timeout`) across retries. After `failure_threshold` consecutive failed
+    requests a circuit breaker skips rerank immediately and probes `/health`
+    in the background until TEI is back.
+
+    With a `score_cache`, scores of (query, chunk) pairs seen before are
+    reused and only uncached texts are sent to TEI. With micro-batching
+    enabled, async reranks of concurrent queries are packed into shared
+    `/predict` calls over (query, passage) pairs.
+
     Args:
         api_url: URL of the TEI rerank endpoint (e.g., "http://localhost:8099")
         top_n: Number of documents to return after reranking
-        timeout: Request timeout in seconds
+        timeout: Deadline in seconds for one rerank, including retries
+        max_connections: Size of the HTTP connection pools
+        max_retries: Retries for connection errors, timeouts and 429/5xx
+        failure_threshold: Consecutive failures that open the circuit
+        probe_interval: Seconds between health probes while the circuit is open
+        score_cache: Optional cache of rerank scores
+        fallback: Reranker used while TEI is failing or the circuit is open
+            (defaults to keeping the top_n retrieval results)
+        verify_in_background: Run the startup health check in a thread
+            instead of blocking the constructor
     """
 
     api_url: str
-    top_n: int
-    timeout: int
+    timeout: float
+    max_connections: int
+    max_retries: int
+    failure_threshold: int
+    probe_interval: float
+
+    _session: requests.Session = PrivateAttr()
+    _breaker: CircuitBreaker = PrivateAttr()
+    _fallback: Optional[BaseNodePostprocessor] = PrivateAttr(default=None)
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
+    _verified: threading.Event = PrivateAttr()
 
     def __init__(
         self,
         api_url: str = "http://localhost:9999",
         top_n: int = 3,
-        timeout: int = 30,
+        timeout: float = 30,
+        max_connections: int = 100,
+        max_retries: int = 2,
+        failure_threshold: int = 5,
+        probe_interval: float = 10.0,
+        score_cache: Optional[RerankScoreCache] = None,
+        fallback: Optional[BaseNodePostprocessor] = None,
+        verify_in_background: bool = False,
     ):
         """Initialize TEI reranker."""
-        super().__init__(api_url=api_url, top_n=top_n, timeout=timeout)
+        super().__init__(
+            api_url=api_url,
+            top_n=top_n,
+            timeout=timeout,
+            max_connections=max_connections,
+            max_retries=max_retries,
+            failure_threshold=failure_threshold,
+            probe_interval=probe_interval,
+        )
+
+        # 复用连接（keep-alive），避免每次 rerank 都重新建立 TCP/TLS 连接
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._score_cache = score_cache
+        self._fallback = fallback
+        self._breaker = CircuitBreaker(
+            probe=self._is_healthy,
+            failure_threshold=failure_threshold,
+            probe_interval=probe_interval,
+            name="TEI Rerank",
+        )
+
+        # 验证 API 是否可用；服务启动时放到后台，不让不可达的 TEI 拖慢启动
+        self._verified = threading.Event()
+        if verify_in_background:
+            threading.Thread(
+                target=self._verify_api, name="TEI Rerank-verify", daemon=True
+            ).start()
+        else:
+            self._verify_api()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TEIReranker"
 
-        # 验证 API 是否可用
-        self._verify_api()
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    @property
+    def status(self) -> str:
+        """"checking" until the startup check ends, then "ok" or "unavailable"."""
+        if not self._verified.is_set():
+            return "checking"
+        return "unavailable" if self._breaker.is_open else "ok"
+
+    def enable_micro_batching(self, max_batch_size: int, max_wait: float) -> None:
+        super().enable_micro_batching(max_batch_size, max_wait)
+        if hasattr(self._fallback, "enable_micro_batching"):
+            self._fallback.enable_micro_batching(max_batch_size, max_wait)
+
+    def _is_healthy(self) -> bool:
+        """Probe the TEI /health endpoint."""
+        response = self._session.get(
+            f"{self.api_url}/health", timeout=min(5.0, self.timeout)
+        )
+        return response.status_code == 200
 
     def _verify_api(self) -> None:
         """Verify that the TEI API is accessible."""
         try:
             # 尝试访问健康检查端点
-            response = requests.get(f"{self.api_url}/health", timeout=5)
+            response = self._session.get(f"{self.api_url}/health", timeout=5)
             if response.status_code == 200:
                 logger.info(f"✅ TEI Rerank API 连接成功: {self.api_url}")
             else:
@@ -53,6 +251,60 @@ class TEIReranker(BaseNodePostprocessor):
                 f"⚠️  无法连接到 TEI API ({self.api_url}): {e}\n"
                 "请确保 text-embeddings-router 正在运行"
             )
+            # 启动时就不可用：直接熔断，恢复前不让请求等待超时
+            self._breaker.trip()
+        finally:
+            self._verified.set()
+
+    def _backoff(self, attempt: int, deadline: float) -> Optional[float]:
+        """Jittered backoff before the next retry, or None if out of budget."""
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, 0.05 * 2**attempt)  # full jitter
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _build_payload(self, query_str: str, nodes: List[NodeWithScore]) -> dict:
+        """Build the TEI /rerank request body."""
+        return {
+            "query": query_str,
+            "texts": [node.node.get_content() for node in nodes],
+            "truncate": True,  # 自动截断过长文本
+        }
+
+    def _merge_scores(
+        self,
+        keys: List[str],
+        scores: List[Optional[float]],
+        missing: List[int],
+        rerank_results: List[dict],
+    ) -> None:
+        """Fill in the scores TEI returned for the missing texts.
+
+        TEI 返回格式: [{"index": 0, "score": 0.95}, ...]，index 指向本次发送的文本
+        """
+        fresh = [0.0] * len(missing)
+        for result in rerank_results:
+            fresh[result["index"]] = result["score"]
+        self._store_scores(keys, scores, missing, fresh)
+
+    def _fallback_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: QueryBundle
+    ) -> List[NodeWithScore]:
+        """Rerank with the fallback reranker, or keep the retrieval order."""
+        if self._fallback is not None:
+            logger.info("🔁 TEI 不可用，改用本地 rerank")
+            return self._fallback.postprocess_nodes(nodes, query_bundle)
+        return nodes[: self.top_n]
+
+    async def _afallback_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: QueryBundle
+    ) -> List[NodeWithScore]:
+        if self._fallback is not None:
+            logger.info("🔁 TEI 不可用，改用本地 rerank")
+            return await self._fallback.apostprocess_nodes(nodes, query_bundle)
+        return nodes[: self.top_n]
 
     def _postprocess_nodes(
         self,
@@ -74,48 +326,365 @@ class TEIReranker(BaseNodePostprocessor):
         if len(nodes) == 0:
             return []
 
-        query_str = query_bundle.query_str
+        try:
+            keys, scores = self._lookup_scores(query_bundle.query_str, nodes)
+            # 只把缓存中没有的文本发送给 TEI
+            missing = [i for i, score in enumerate(scores) if score is None]
+            if missing:
+                if not self._breaker.allow():
+                    logger.debug("⏭️  TEI 熔断中，跳过 rerank")
+                    return self._fallback_nodes(nodes, query_bundle)
 
-        # 准备文档文本列表
-        texts = [node.node.get_content() for node in nodes]
+                # 调用 TEI rerank API
+                results = self._post_rerank(
+                    self._build_payload(
+                        query_bundle.query_str, [nodes[i] for i in missing]
+                    )
+                )
+                self._breaker.record_success()
+                self._merge_scores(keys, scores, missing, results)
 
-        try:
-            # 调用 TEI rerank API
-            response = requests.post(
-                f"{self.api_url}/rerank",
-                json={
-                    "query": query_str,
-                    "texts": texts,
-                    "truncate": True,  # 自动截断过长文本
-                },
+            return self._apply_scores(nodes, scores)
+
+        except (requests.exceptions.RequestException, _RetryableStatus) as e:
+            self._breaker.record_failure()
+            logger.error(f"❌ TEI Rerank API 调用失败: {e}")
+            if self._fallback is None:
+                logger.warning("⚠️  回退到原始检索结果")
+            # 如果 API 调用失败，回退到本地 rerank 或前 top_n 个原始结果
+            return self._fallback_nodes(nodes, query_bundle)
+        except Exception as e:
+            logger.error(f"❌ Rerank 处理错误: {e}")
+            return nodes[: self.top_n]
+
+    def _post_rerank(self, payload: dict) -> List[dict]:
+        """POST /rerank with retries, all within one deadline."""
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self._session.post(
+                    f"{self.api_url}/rerank",
+                    json=payload,
+                    timeout=max(deadline - time.monotonic(), 0.001),
+                )
+                if response.status_code in _RETRYABLE_STATUS:
+                    raise _RetryableStatus(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return response.json()
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                _RetryableStatus,
+            ):
+                delay = self._backoff(attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Lazily create the pooled async client on the running event loop."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
                 timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
             )
-            response.raise_for_status()
+        return self._async_client
 
-            # 解析返回结果
-            rerank_results = response.json()
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        """Rerank nodes using TEI API without blocking the event loop.
+
+        Args:
+            nodes: List of nodes with scores from retrieval
+            query_bundle: Query information
+
+        Returns:
+            Reranked list of nodes with updated scores
+        """
+        if not query_bundle:
+            return nodes
 
-            # TEI 返回格式: [{"index": 0, "score": 0.95}, ...]
-            # 已经按 score 降序排列
-            reranked_nodes = []
-            for result in rerank_results[: self.top_n]:
-                idx = result["index"]
-                score = result["score"]
+        if len(nodes) == 0:
+            return []
 
-                # 更新节点分数
-                node = nodes[idx]
-                node.score = score
-                reranked_nodes.append(node)
+        try:
+            keys, scores = self._lookup_scores(query_bundle.query_str, nodes)
+            missing = [i for i, score in enumerate(scores) if score is None]
+            if missing:
+                if not self._breaker.allow():
+                    logger.debug("⏭️  TEI 熔断中，跳过 rerank")
+                    return await self._afallback_nodes(nodes, query_bundle)
 
-            logger.info(f"🎯 Rerank 完成: {len(nodes)} → {len(reranked_nodes)} 个文档")
+                if self._batcher is not None:
+                    # 与其他并发查询的文本对打包成一次 /predict 调用
+                    fresh = await self._batcher.submit_many(
+                        [
+                            (query_bundle.query_str, nodes[i].node.get_content())
+                            for i in missing
+                        ]
+                    )
+                    self._store_scores(keys, scores, missing, fresh)
+                else:
+                    results = await self._apost_rerank(
+                        self._build_payload(
+                            query_bundle.query_str, [nodes[i] for i in missing]
+                        )
+                    )
+                    self._breaker.record_success()
+                    self._merge_scores(keys, scores, missing, results)
 
-            return reranked_nodes
+            return self._apply_scores(nodes, scores)
 
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, _RetryableStatus) as e:
+            # 微批调用的失败由 _ascore_pairs 记录，等待同一批的每个查询不重复计数
+            if self._batcher is None:
+                self._breaker.record_failure()
             logger.error(f"❌ TEI Rerank API 调用失败: {e}")
-            logger.warning("⚠️  回退到原始检索结果")
-            # 如果 API 调用失败，返回前 top_n 个原始结果
-            return nodes[: self.top_n]
+            if self._fallback is None:
+                logger.warning("⚠️  回退到原始检索结果")
+            return await self._afallback_nodes(nodes, query_bundle)
         except Exception as e:
             logger.error(f"❌ Rerank 处理错误: {e}")
             return nodes[: self.top_n]
+
+    async def _ascore_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score pairs of different queries in one TEI /predict call."""
+        try:
+            results = await self._apost_rerank(
+                {"inputs": [list(pair) for pair in pairs], "truncate": True},
+                path="/predict",
+            )
+        except (httpx.HTTPError, _RetryableStatus):
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        # TEI 对每个文本对返回 [{"score": ..., "label": ...}]
+        return [
+            (result[0] if isinstance(result, list) else result)["score"]
+            for result in results
+        ]
+
+    async def _apost_rerank(self, payload: dict, path: str = "/rerank") -> Any:
+        """Async POST to TEI with retries, all within one deadline."""
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = await self._get_async_client().post(
+                    f"{self.api_url}{path}",
+                    json=payload,
+                    timeout=max(deadline - time.monotonic(), 0.001),
+                )
+                if response.status_code in _RETRYABLE_STATUS:
+                    raise _RetryableStatus(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TransportError, _RetryableStatus):
+                delay = self._backoff(attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        """Close the pooled clients and stop the health probe."""
+        self._breaker.stop()
+        self._session.close()
+        if hasattr(self._fallback, "aclose"):
+            await self._fallback.aclose()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class LocalReranker(_ScoreCachingReranker):
+    """Reranker running a cross-encoder in-process (CPU by default).
+
+    Requires the optional `sentence-transformers` package. Query-passage pairs
+    are grouped into length buckets of `batch_size` and scored on a bounded
+    thread pool, so short passages are not padded to the longest one and
+    concurrent queries cannot oversubscribe the CPU. With micro-batching
+    enabled, pairs of concurrent async queries share the same buckets.
+
+    Args:
+        model_name: Cross-encoder model (e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        top_n: Number of documents to return after reranking
+        batch_size: Query-passage pairs per forward pass
+        max_length: Maximum tokens per pair (longer pairs are truncated)
+        max_workers: Size of the inference thread pool
+        device: Torch device, e.g. "cpu" or "cuda"
+        score_cache: Optional cache of rerank scores
+    """
+
+    model_name: str
+    batch_size: int
+    max_length: int
+    max_workers: int
+    device: str
+
+    _model: Any = PrivateAttr()
+    _pool: ThreadPoolExecutor = PrivateAttr()
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        top_n: int = 3,
+        batch_size: int = 16,
+        max_length: int = 512,
+        max_workers: int = 2,
+        device: str = "cpu",
+        score_cache: Optional[RerankScoreCache] = None,
+    ):
+        """Load the cross-encoder."""
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "❌ 本地 rerank 需要 sentence-transformers："
+                "pip install sentence-transformers"
+            ) from e
+
+        super().__init__(
+            model_name=model_name,
+            top_n=top_n,
+            batch_size=batch_size,
+            max_length=max_length,
+            max_workers=max_workers,
+            device=device,
+        )
+        self._score_cache = score_cache
+        self._model = CrossEncoder(model_name, max_length=max_length, device=device)
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="local-rerank"
+        )
+        logger.info(f"✅ 本地 Rerank 模型加载完成: {model_name} ({device})")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalReranker"
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score one batch of (query, passage) pairs."""
+        scores = self._model.predict(
+            pairs, batch_size=len(pairs), show_progress_bar=False
+        )
+        return [float(score) for score in scores]
+
+    def _submit(
+        self, pairs: List[Tuple[str, str]]
+    ) -> Tuple[List[List[int]], List[Future]]:
+        """Submit length-bucketed batches to the thread pool."""
+        batches = length_buckets([len(text) for _, text in pairs], self.batch_size)
+        futures = [
+            self._pool.submit(self._predict, [pairs[i] for i in batch])
+            for batch in batches
+        ]
+        return batches, futures
+
+    async def _ascore_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score pairs (possibly of different queries) on the thread pool."""
+        batches, futures = self._submit(pairs)
+        batch_scores = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        return self._collect(batches, batch_scores, len(pairs))
+
+    @staticmethod
+    def _collect(
+        batches: List[List[int]], batch_scores: List[List[float]], size: int
+    ) -> List[float]:
+        scores = [0.0] * size
+        for batch, values in zip(batches, batch_scores):
+            for i, score in zip(batch, values):
+                scores[i] = score
+        return scores
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        """Rerank nodes with the local cross-encoder.
+
+        Args:
+            nodes: List of nodes with scores from retrieval
+            query_bundle: Query information
+
+        Returns:
+            Reranked list of nodes with updated scores
+        """
+        if not query_bundle:
+            return nodes
+
+        if len(nodes) == 0:
+            return []
+
+        try:
+            keys, scores = self._lookup_scores(query_bundle.query_str, nodes)
+            missing = [i for i, score in enumerate(scores) if score is None]
+            if missing:
+                pairs = [
+                    (query_bundle.query_str, nodes[i].node.get_content())
+                    for i in missing
+                ]
+                batches, futures = self._submit(pairs)
+                fresh = self._collect(
+                    batches, [f.result() for f in futures], len(pairs)
+                )
+                self._store_scores(keys, scores, missing, fresh)
+
+            return self._apply_scores(nodes, scores)
+
+        except Exception as e:
+            logger.error(f"❌ 本地 Rerank 处理错误: {e}")
+            return nodes[: self.top_n]
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        """Rerank nodes on the thread pool without blocking the event loop.
+
+        Args:
+            nodes: List of nodes with scores from retrieval
+            query_bundle: Query information
+
+        Returns:
+            Reranked list of nodes with updated scores
+        """
+        if not query_bundle:
+            return nodes
+
+        if len(nodes) == 0:
+            return []
+
+        try:
+            keys, scores = self._lookup_scores(query_bundle.query_str, nodes)
+            missing = [i for i, score in enumerate(scores) if score is None]
+            if missing:
+                pairs = [
+                    (query_bundle.query_str, nodes[i].node.get_content())
+                    for i in missing
+                ]
+                if self._batcher is not None:
+                    fresh = await self._batcher.submit_many(pairs)
+                else:
+                    fresh = await self._ascore_pairs(pairs)
+                self._store_scores(keys, scores, missing, fresh)
+
+            return self._apply_scores(nodes, scores)
+
+        except Exception as e:
+            logger.error(f"❌ 本地 Rerank 处理错误: {e}")
+            return nodes[: self.top_n]
+
+    async def aclose(self) -> None:
+        """Shut down the inference thread pool."""
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,124 @@
+"""Semantic answer cache keyed on query-embedding similarity."""
+
+import copy
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """In-process vector table of (query embedding, answer) pairs.
+
+    A lookup returns the cached answer of the most similar stored query when
+    its cosine similarity reaches `threshold`. Storage is a matrix of unit
+    vectors, so a lookup is a single matrix-vector product; the matrix doubles
+    as entries are stored instead of reserving `max_size` rows up front.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        max_size: Maximum number of entries (least recently used evicted first)
+        ttl: Entry lifetime in seconds, or None to never expire
+    """
+
+    _INITIAL_CAPACITY = 64  # 第一次写入时分配的行数，之后按需翻倍
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_size: int = 10_000,
+        ttl: Optional[float] = 3600,
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(0, dtype=bool)
+        self._created_at = np.zeros(0)
+        self._last_used = np.zeros(0)
+        self._results: List[Optional[dict]] = []
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _grow(self, dim: int) -> None:
+        """Double the capacity (capped at `max_size`); caller holds the lock."""
+        # 每个集合一个缓存，按 max_size 预分配时引擎池里的缓存会占用大量内存
+        old = len(self._valid)
+        new = min(self.max_size, max(self._INITIAL_CAPACITY, old * 2))
+        matrix = np.zeros((new, dim), dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:old] = self._matrix
+        self._matrix = matrix
+        self._valid = np.concatenate([self._valid, np.zeros(new - old, dtype=bool)])
+        self._created_at = np.concatenate([self._created_at, np.zeros(new - old)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(new - old)])
+        self._results.extend([None] * (new - old))
+
+    def lookup(self, embedding: List[float]) -> Optional[dict]:
+        """Return a copy of the cached result for a similar query, if any."""
+        now = time.time()
+        with self._lock:
+            if self._matrix is None or not self._valid.any():
+                self.misses += 1
+                return None
+
+            if self.ttl is not None:
+                self._valid &= now - self._created_at <= self.ttl
+
+            scores = self._matrix @ self._normalize(embedding)
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[slot] = now
+            self.hits += 1
+            return copy.deepcopy(self._results[slot])
+
+    def store(self, embedding: List[float], result: dict) -> None:
+        """Cache a result under its query embedding."""
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            free = np.flatnonzero(~self._valid)
+            if not len(free) and len(self._valid) < self.max_size:
+                self._grow(len(vector))
+                free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+
+            self._matrix[slot] = vector
+            self._valid[slot] = True
+            self._created_at[slot] = now
+            self._last_used[slot] = now
+            self._results[slot] = copy.deepcopy(result)
+
+    def clear(self) -> None:
+        """Drop every entry (e.g. after the underlying collection changed)."""
+        with self._lock:
+            self._valid[:] = False
+            self._results = [None] * len(self._results)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": int(self._valid.sum()),
+            }
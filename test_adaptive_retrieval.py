@@ -0,0 +1,57 @@
+"""Tests for the adaptive retrieval depth policy."""
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from adaptive_retrieval import EXPAND, INITIAL, SKIP_RERANK, AdaptiveDepth
+
+
+def _hits(*scores):
+    return [
+        NodeWithScore(node=TextNode(id_=f"n{i}", text="块"), score=score)
+        for i, score in enumerate(scores)
+    ]
+
+
+def test_decides_from_the_dense_score_distribution():
+    depth = AdaptiveDepth(
+        initial_top_k=3, max_top_k=10, confident_margin=0.15, flat_spread=0.05
+    )
+    # 第一名遥遥领先：跳过 rerank
+    assert depth.decide(_hits(0.9, 0.6, 0.55)) == SKIP_RERANK
+    # 分数几乎一样：扩展检索
+    assert depth.decide(_hits(0.80, 0.79, 0.78)) == EXPAND
+    assert depth.decide(_hits(0.9, 0.85, 0.7)) == INITIAL
+    # 首次检索已经是全部深度时不再扩展
+    assert AdaptiveDepth(3, 3).decide(_hits(0.80, 0.79, 0.78)) == INITIAL
+
+
+def test_trim_keeps_minimum_and_drops_far_tail():
+    depth = AdaptiveDepth(trim_gap=0.3, min_candidates=2)
+    kept = depth.trim(_hits(1.0, 0.4, 0.9, 0.75, 0.6))
+    assert [n.node.node_id for n in kept] == ["n0", "n1", "n2", "n3"]
+
+    lexical = [("a", 12.0), ("b", 3.0), ("c", 2.9), ("d", 2.0)]
+    assert depth.trim(lexical, score=lambda hit: hit[1]) == lexical[:2]
+    assert depth.trim([]) == []
+
+
+def test_skipped_rerank_still_fuses_bm25_hits(tmp_path, make_stub_service):
+    """A confident dense hit skips the reranker, not the exact-term candidates."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(6):
+        (data_dir / f"deploy{i}.txt").write_text(
+            f"Deploy guide part {i}: rolling restarts drain connections first."
+        )
+    (data_dir / "errors.txt").write_text("ERR_CONN_42 means the upstream refused.")
+    service = make_stub_service(
+        data_dir,
+        USE_ADAPTIVE_RETRIEVAL=True,
+        ADAPTIVE_INITIAL_TOP_K=2,
+        # 任何分数分布都判定为“第一名领先”，跳过 rerank
+        ADAPTIVE_CONFIDENT_MARGIN=-1.0,
+    )
+
+    nodes = service.retrieve("deploy rolling restarts ERR_CONN_42")
+
+    assert any("ERR_CONN_42" in n.node.get_content() for n in nodes)
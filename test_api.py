@@ -0,0 +1,32 @@
+"""Tests for the API's liveness and readiness before the service is ready."""
+
+import asyncio
+
+import httpx
+
+import api
+
+
+def test_live_but_not_ready_while_starting(monkeypatch):
+    """The port serves probes at once; queries get 503 until warm-up ends."""
+    monkeypatch.setattr(api, "query_service", None)
+    monkeypatch.setitem(api.startup_state, "status", "starting")
+
+    async def main():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return (
+                await c.get("/livez"),
+                await c.get("/readyz"),
+                await c.get("/health"),
+                await c.post("/query", json={"question": "什么是 RAG？"}),
+            )
+
+    livez, readyz, health, query = asyncio.run(main())
+
+    assert livez.status_code == 200
+    assert readyz.status_code == 503
+    assert readyz.json()["status"] == "starting"
+    assert health.status_code == 503
+    assert query.status_code == 503
+    assert query.headers["retry-after"] == "1"
@@ -0,0 +1,71 @@
+"""Tests for the async ZhipuAI adapter and the batched Chroma store."""
+
+import asyncio
+import json
+
+import httpx
+import chromadb
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from async_adapters import AsyncChromaVectorStore, AsyncZhipuAI
+
+
+def _sse_handler(request: httpx.Request) -> httpx.Response:
+    assert json.loads(request.content)["stream"] is True
+    chunks = [
+        {"choices": [{"index": 0, "delta": {"role": "assistant", "content": "你好"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "，世界"}}]},
+        {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+    ]
+    body = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+    return httpx.Response(
+        200, text=body, headers={"content-type": "text/event-stream"}
+    )
+
+
+def test_astream_chat_yields_deltas():
+    """SSE chunks become incremental chat responses."""
+    llm = AsyncZhipuAI(model="glm-4", api_key="id.secret", base_url="http://stub")
+    llm._async_client = httpx.AsyncClient(
+        base_url="http://stub", transport=httpx.MockTransport(_sse_handler)
+    )
+
+    async def collect():
+        stream = await llm.astream_chat([ChatMessage(role="user", content="hi")])
+        return [r async for r in stream]
+
+    responses = asyncio.run(collect())
+
+    assert [r.delta for r in responses] == ["你好", "，世界"]
+    assert responses[-1].message.content == "你好，世界"
+
+
+def test_query_batch_matches_single_queries():
+    """One batched Chroma query returns what per-question queries return."""
+    client = chromadb.EphemeralClient()
+    store = AsyncChromaVectorStore(
+        chroma_collection=client.get_or_create_collection("batch_test")
+    )
+    vectors = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.7, 0.7, 0.0]]
+    store.add(
+        [
+            TextNode(id_=f"n{i}", text=f"块 {i}", embedding=vector)
+            for i, vector in enumerate(vectors)
+        ]
+    )
+
+    queries = [[1.0, 0.1, 0.0], [0.0, 0.2, 1.0]]
+    batch = asyncio.run(store.aquery_batch(queries, top_k=2))
+
+    assert len(batch) == len(queries)
+    for embedding, nodes in zip(queries, batch):
+        single = store.query(
+            VectorStoreQuery(query_embedding=embedding, similarity_top_k=2)
+        )
+        assert [n.node.node_id for n in nodes] == single.ids
+        assert [n.node.get_content() for n in nodes] == [
+            node.get_content() for node in single.nodes
+        ]
+        assert [n.score for n in nodes] == single.similarities
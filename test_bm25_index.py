@@ -0,0 +1,67 @@
+"""Tests for the BM25 index and reciprocal-rank fusion."""
+
+import sqlite3
+
+from bm25_index import BM25Index
+from hybrid_retriever import reciprocal_rank_fusion
+
+
+def test_exact_terms_found_and_updates_persist(tmp_path):
+    """Codes and CJK terms match; replaced and deleted chunks stop matching."""
+    path = str(tmp_path / "documents.bm25.sqlite")
+    index = BM25Index(path)
+    index.add(
+        [
+            ("a", "连接失败时返回错误码 ERR_CONN-42"),
+            ("b", "The service restarts after a timeout."),
+            ("c", "向量检索适合语义相近的问题"),
+        ]
+    )
+
+    assert index.search("ERR_CONN-42 是什么", top_k=2)[0][0] == "a"
+    assert index.search("向量检索", top_k=2)[0][0] == "c"
+
+    index.add([("a", "nothing relevant here")])
+    index.delete(["c"])
+    index.close()
+
+    reopened = BM25Index(path)
+    assert reopened.count() == 2
+    assert reopened.search("ERR_CONN-42", top_k=2) == []
+    assert reopened.search("向量检索", top_k=2) == []
+
+
+def test_terms_in_most_documents_are_skipped(tmp_path):
+    """High-df terms ("the", "的") do not pull their postings; df follows deletes."""
+    path = str(tmp_path / "documents.bm25.sqlite")
+    index = BM25Index(path, max_df_ratio=0.5)
+    index.add([(f"common-{i}", f"the service 的 {i}") for i in range(150)])
+    index.add([(f"other-{i}", f"other topic {i}") for i in range(60)])
+    index.add([("code", "the error code ERR_CONN-42")])
+
+    assert index.search("the", top_k=5) == index.search("的", top_k=5) == []
+    assert [node_id for node_id, _ in index.search("the ERR_CONN", top_k=5)] == [
+        "code"
+    ]
+
+    # 删除后文档频率随之下降，词不再被跳过
+    index.delete([f"common-{i}" for i in range(100)])
+    assert len(index.search("the", top_k=100)) == 51
+    index.close()
+
+    # 没有 terms 表的旧索引在打开时补建文档频率
+    db = sqlite3.connect(path)
+    db.execute("DROP TABLE terms")
+    db.commit()
+    db.close()
+    reopened = BM25Index(path, max_df_ratio=0.5)
+    assert len(reopened.search("the", top_k=100)) == 51
+    reopened.close()
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    """An ID ranked well by both retrievers beats one ranked first by one."""
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+
+    assert [node_id for node_id, _ in fused][:2] == ["y", "x"]
+    assert {node_id for node_id, _ in fused} == {"x", "y", "z", "w"}
@@ -0,0 +1,67 @@
+"""Tests for the shared Chroma server used by multi-worker serving."""
+
+import socket
+
+import chromadb
+import pytest
+
+import api
+import config
+from chroma_backend import ChromaServer, connect_chroma
+
+
+def test_workers_read_the_persisted_index_through_the_server(
+    tmp_path, monkeypatch, free_port
+):
+    """A collection written locally is served, unchanged, over HTTP."""
+    path = str(tmp_path / "chroma_db")
+    local = chromadb.PersistentClient(path=path)
+    local.create_collection("docs").add(
+        ids=["a", "b"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+        documents=["苹果", "香蕉"],
+    )
+    del local
+
+    with ChromaServer(path, port=free_port) as server:
+        monkeypatch.setattr(config, "CHROMA_SERVER_URL", server.url)
+        client = connect_chroma()
+        assert isinstance(client, chromadb.api.ClientAPI)
+        collection = client.get_collection("docs")
+        count = collection.count()
+        result = collection.query(query_embeddings=[[0.9, 0.1]], n_results=1)
+
+    assert count == 2
+    assert result["documents"] == [["苹果"]]
+
+
+def test_start_refuses_a_port_in_use(tmp_path, free_port):
+    """Another server's heartbeat must not pass for this server's."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", free_port))
+        sock.listen()
+        server = ChromaServer(str(tmp_path / "chroma_db"), port=free_port)
+        with pytest.raises(RuntimeError):
+            server.start()
+    assert server.pid is None
+
+
+@pytest.mark.parametrize("backend, starts_server", [("chroma", True), ("mmap", False)])
+def test_serve_starts_a_shared_server_only_for_chroma(
+    tmp_path, monkeypatch, backend, starts_server
+):
+    """Multi-worker serving over the mmap export needs no Chroma server."""
+    started = []
+    monkeypatch.setattr(ChromaServer, "start", lambda self: started.append(self))
+    monkeypatch.setattr(ChromaServer, "stop", lambda self: None)
+    monkeypatch.setattr("uvicorn.run", lambda *args, **kwargs: None)
+    monkeypatch.setattr(config, "VECTOR_DB_TYPE", backend)
+    monkeypatch.setattr(config, "CHROMA_SERVER_URL", None)
+    monkeypatch.setattr(config, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(config, "METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.delenv("CHROMA_SERVER_URL", raising=False)
+    monkeypatch.setenv("METRICS_DIR", config.METRICS_DIR)
+
+    api.serve(workers=2)
+
+    assert bool(started) == starts_server
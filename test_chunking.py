@@ -0,0 +1,24 @@
+"""Tests for the parallel parsing and chunking stage."""
+
+from chunking import iter_split_files
+
+
+def test_parallel_split_matches_serial(tmp_path):
+    """A process pool yields the same nodes, IDs and metadata, in order."""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(f"Document {i}. " + "Some sentence about RAG. " * 200)
+        paths.append(str(path))
+    (tmp_path / "empty.txt").write_text("")
+    paths.insert(2, str(tmp_path / "empty.txt"))
+
+    serial = list(iter_split_files(paths, 128, 16, workers=1))
+    parallel = list(iter_split_files(paths, 128, 16, workers=2))
+
+    assert [p for p, _, _ in parallel] == paths
+    for (_, s_nodes, s_hashes), (_, p_nodes, p_hashes) in zip(serial, parallel):
+        assert s_hashes == p_hashes
+        assert [n.node_id for n in s_nodes] == [n.node_id for n in p_nodes]
+        assert [n.metadata for n in s_nodes] == [n.metadata for n in p_nodes]
+        assert [n.relationships for n in s_nodes] == [n.relationships for n in p_nodes]
@@ -0,0 +1,76 @@
+"""Tests for the circuit breaker guarding the TEI reranker."""
+
+import asyncio
+import time
+
+import httpx
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from circuit_breaker import CircuitBreaker
+from reranker import TEIReranker
+
+
+def test_opens_after_failures_and_closes_on_healthy_probe():
+    """Consecutive failures open the circuit; a healthy probe closes it."""
+    healthy = False
+    breaker = CircuitBreaker(
+        probe=lambda: healthy, failure_threshold=2, probe_interval=0.01
+    )
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    healthy = True
+    deadline = time.monotonic() + 2
+    while breaker.is_open and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert breaker.allow()
+    assert breaker.stats()["trips"] == 1
+
+
+def test_unreachable_tei_falls_back_without_waiting():
+    """With TEI down at startup, rerank is skipped instead of timing out."""
+    reranker = TEIReranker(api_url="http://127.0.0.1:9", top_n=2, timeout=30)
+    nodes = [NodeWithScore(node=TextNode(text=f"doc {i}"), score=1.0) for i in range(3)]
+
+    start = time.monotonic()
+    result = reranker.postprocess_nodes(nodes, QueryBundle("query"))
+
+    assert time.monotonic() - start < 1
+    assert result == nodes[:2]
+    assert reranker.breaker.stats()["rejected"] == 1
+    reranker.breaker.stop()
+
+
+
+def test_failed_micro_batch_counts_as_one_failure(monkeypatch):
+    """A /predict call shared by several queries is one failure, not one each."""
+    calls = []
+
+    async def failing_post(self, payload, path="/rerank"):
+        calls.append(path)
+        raise httpx.ConnectError("TEI is down")
+
+    # TEI 健康检查通过，但打分请求失败
+    monkeypatch.setattr(TEIReranker, "_verify_api", lambda self: None)
+    monkeypatch.setattr(TEIReranker, "_apost_rerank", failing_post)
+    reranker = TEIReranker(top_n=2, failure_threshold=3)
+    reranker.enable_micro_batching(max_batch_size=64, max_wait=0.05)
+    nodes = [NodeWithScore(node=TextNode(text=f"doc {i}"), score=1.0) for i in range(3)]
+
+    async def burst():
+        return await asyncio.gather(
+            *(
+                reranker.apostprocess_nodes(nodes, QueryBundle(f"query {i}"))
+                for i in range(4)
+            )
+        )
+
+    results = asyncio.run(burst())
+
+    assert calls == ["/predict"]
+    assert all(result == nodes[:2] for result in results)
+    assert reranker.breaker.stats()["consecutive_failures"] == 1
+    assert reranker.breaker.stats()["state"] == "closed"
@@ -0,0 +1,67 @@
+"""Tests for the per-collection engine pool."""
+
+import threading
+import time
+
+import pytest
+
+from collection_pool import (
+    EnginePool,
+    InvalidCollectionNameError,
+    validate_collection_name,
+)
+
+
+def test_lru_and_idle_eviction():
+    """Hot collections are reused; the least recently used and idle are dropped."""
+    built = []
+
+    def factory(name):
+        built.append(name)
+        return object()
+
+    pool = EnginePool(factory, max_size=2, idle_ttl=0.05)
+    a = pool.get("tenant-a")
+    pool.get("tenant-b")
+    assert pool.get("tenant-a") is a
+    pool.get("tenant-c")  # 淘汰最久未用的 tenant-b
+
+    assert pool.stats()["collections"] == ["tenant-a", "tenant-c"]
+    time.sleep(0.1)
+    pool.get("tenant-c")  # tenant-a 空闲超时被释放
+
+    stats = pool.stats()
+    assert stats["collections"] == ["tenant-c"]
+    assert built == ["tenant-a", "tenant-b", "tenant-c", "tenant-c"]
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 3)
+
+
+def test_concurrent_first_requests_build_once():
+    """Requests racing for a cold collection share one construction."""
+    calls = []
+
+    def factory(name):
+        calls.append(name)
+        time.sleep(0.05)
+        return name.upper()
+
+    pool = EnginePool(factory)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(pool.get("tenant-a")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["tenant-a"]
+    assert results == ["TENANT-A"] * 4
+
+
+def test_invalid_collection_names_rejected():
+    assert validate_collection_name("acme_docs-2") == "acme_docs-2"
+    for name in ("a", "../etc", "bad name", "-x-"):
+        with pytest.raises(InvalidCollectionNameError):
+            validate_collection_name(name)
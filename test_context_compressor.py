@@ -0,0 +1,63 @@
+"""Tests for sentence-level context compression."""
+
+import asyncio
+
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from context_compressor import ContextCompressor, split_sentences
+
+
+def test_split_sentences_handles_chinese_and_english():
+    assert split_sentences("第一句。第二句！Third one. Fourth?\n\n第五句") == [
+        "第一句。",
+        "第二句！",
+        "Third one.",
+        "Fourth?",
+        "第五句",
+    ]
+
+
+def test_keeps_relevant_sentences_once_within_budget(bag_of_words_embedding):
+    """Off-topic sentences and chunks go; the overlap sentence is kept once."""
+    nodes = [
+        NodeWithScore(
+            node=TextNode(
+                id_="a",
+                text="The cat sat on the mat. Stock prices fell sharply today. "
+                "The cat chased a mouse.",
+            ),
+            score=0.9,
+        ),
+        # 与上一块重叠的句子
+        NodeWithScore(
+            node=TextNode(id_="b", text="The cat chased a mouse. The cat was black."),
+            score=0.8,
+        ),
+        NodeWithScore(
+            node=TextNode(id_="c", text="Interest rates rose again."), score=0.7
+        ),
+    ]
+    compressor = ContextCompressor(
+        bag_of_words_embedding, token_budget=20, dedup_threshold=0.95, neighbor_weight=0
+    )
+    query = QueryBundle(
+        "What did the cat do?",
+        embedding=bag_of_words_embedding.get_query_embedding("What did the cat do?"),
+    )
+
+    compressed = compressor.postprocess_nodes(nodes, query_bundle=query)
+    assert [n.node.node_id for n in compressed] == ["a", "b"]
+    assert compressed[0].node.get_content() == (
+        "The cat sat on the mat. The cat chased a mouse."
+    )
+    assert compressed[1].node.get_content() == "The cat was black."
+    assert compressed[0].score == 0.9
+    # 原节点不被修改
+    assert "Stock prices" in nodes[0].node.get_content()
+
+    async_compressed = asyncio.run(
+        compressor.apostprocess_nodes(nodes, query_bundle=query)
+    )
+    assert [n.node.get_content() for n in async_compressed] == [
+        n.node.get_content() for n in compressed
+    ]
@@ -0,0 +1,101 @@
+"""Tests for the persistent embedding cache."""
+
+import asyncio
+import threading
+from typing import List
+
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class CountingEmbedding(MockEmbedding):
+    """Mock embedding model that records which texts reach the "API"."""
+
+    calls: List[str] = []
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls.append(query)
+        return [float(len(query))] * self.embed_dim
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls.extend(texts)
+        return [[float(len(t))] * self.embed_dim for t in texts]
+
+
+def test_repeated_query_hits_memory_tier():
+    """Whitespace variants of a query are embedded only once."""
+    inner = CountingEmbedding(embed_dim=4, calls=[])
+    model = CachedEmbedding(inner, cache=EmbeddingCache())
+
+    first = model.get_query_embedding("什么是 RAG？")
+    second = model.get_query_embedding("  什么是   RAG？ ")
+
+    assert first == second
+    assert inner.calls == ["什么是 RAG？"]
+    stats = model.cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_batch_only_embeds_missing_texts(tmp_path):
+    """Disk tier survives a restart and batches skip cached texts."""
+    path = str(tmp_path / "cache.db")
+    inner = CountingEmbedding(embed_dim=4, calls=[])
+    CachedEmbedding(inner, cache=EmbeddingCache(path=path)).get_text_embedding_batch(
+        ["a", "bb"]
+    )
+
+    inner.calls.clear()
+    model = CachedEmbedding(inner, cache=EmbeddingCache(path=path))
+    vectors = model.get_text_embedding_batch(["a", "ccc", "bb"])
+
+    assert inner.calls == ["ccc"]
+    assert [v[0] for v in vectors] == [1.0, 3.0, 2.0]
+    assert model.cache.stats()["disk_hits"] == 2
+
+
+def test_ttl_and_lru_eviction():
+    """Expired and least recently used entries are treated as misses."""
+    cache = EmbeddingCache(max_memory_entries=2, ttl=-1)
+    cache.put_many({"k": [1.0]})
+    assert cache.get_many(["k"]) == {}
+
+    cache = EmbeddingCache(max_memory_entries=2)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    cache.get_many(["a"])
+    cache.put_many({"c": [3.0]})
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_async_lookups_keep_sqlite_off_the_event_loop(tmp_path, monkeypatch):
+    """Disk reads and writes run in a worker thread; memory hits stay inline."""
+    cache = EmbeddingCache(path=str(tmp_path / "cache.db"))
+    threads = []
+    for name in ("_get_disk", "_put_disk"):
+        original = getattr(cache, name)
+
+        def record(*args, _original=original, _name=name):
+            threads.append((_name, threading.get_ident()))
+            return _original(*args)
+
+        monkeypatch.setattr(cache, name, record)
+    model = CachedEmbedding(CountingEmbedding(embed_dim=4, calls=[]), cache=cache)
+
+    async def main():
+        first = await model.aget_text_embedding_batch(["a", "bb"])
+        second = await model.aget_query_embedding("q")
+        third = await model.aget_query_embedding("q")  # 内存层命中，不经过线程
+        return threading.get_ident(), first, second, third
+
+    loop_thread, first, second, third = asyncio.run(main())
+
+    assert len(first) == 2 and second == third
+    assert [name for name, _ in threads] == [
+        "_get_disk",
+        "_put_disk",
+        "_get_disk",
+        "_put_disk",
+    ]
+    assert all(ident != loop_thread for _, ident in threads)
+    assert cache.stats()["memory_hits"] == 1
@@ -0,0 +1,145 @@
+"""Tests for the batched embedding stage of index builds."""
+
+import threading
+from typing import List
+
+import httpx
+import pytest
+import zhipuai
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from embedding_pipeline import EmbeddingPipeline
+
+_REQUEST = httpx.Request("POST", "https://open.bigmodel.cn/api/paas/v4/embeddings")
+
+
+class FlakyEmbedding(MockEmbedding):
+    """Embeds a text as [number in the text]; raises queued errors first."""
+
+    def __init__(self, errors=(), **kwargs):
+        super().__init__(embed_dim=1, **kwargs)
+        self._errors = list(errors)
+        self._calls = []
+        self._lock = threading.Lock()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self._calls.append(list(texts))
+            error = self._errors.pop(0) if self._errors else None
+        if error is not None:
+            raise error
+        return [[float(text.split()[-1])] for text in texts]
+
+
+class RecordingStore:
+    """Vector store stand-in that records each bulk `add`."""
+
+    def __init__(self):
+        self.writes = []
+
+    def add(self, nodes):
+        self.writes.append(list(nodes))
+        return [node.node_id for node in nodes]
+
+
+def _nodes(count):
+    return [TextNode(id_=f"n{i}", text=f"chunk {i}") for i in range(count)]
+
+
+def _pipeline(embed_model, store, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return EmbeddingPipeline(embed_model, store, **kwargs)
+
+
+def test_order_and_bulk_writes():
+    """Embeddings match their nodes in order and are written in bulk."""
+    store = RecordingStore()
+    pipeline = _pipeline(
+        FlakyEmbedding(embed_batch_size=3),
+        store,
+        batch_size=3,
+        max_in_flight=4,
+        write_batch_size=10,
+    )
+
+    stats = pipeline.run(_nodes(25))
+
+    assert stats["chunks"] == 25 and stats["retries"] == 0
+    assert [len(write) for write in store.writes] == [12, 12, 1]
+    written = [node for write in store.writes for node in write]
+    assert [node.node_id for node in written] == [f"n{i}" for i in range(25)]
+    assert [node.embedding for node in written] == [[float(i)] for i in range(25)]
+
+
+def test_transient_errors_are_retried():
+    """Connection errors, timeouts and 5xx are retried; 4xx are not."""
+    errors = [
+        zhipuai.APIConnectionError(request=_REQUEST),
+        zhipuai.APITimeoutError(request=_REQUEST),
+        httpx.ReadTimeout("timed out", request=_REQUEST),
+        zhipuai.APIInternalError(
+            "busy", response=httpx.Response(503, request=_REQUEST)
+        ),
+    ]
+    store = RecordingStore()
+    pipeline = _pipeline(FlakyEmbedding(errors=errors), store, max_in_flight=1)
+    assert pipeline.run(_nodes(2))["retries"] == 4
+    assert [node.embedding for node in store.writes[0]] == [[0.0], [1.0]]
+
+    bad_request = zhipuai.APIRequestFailedError(
+        "bad", response=httpx.Response(400, request=_REQUEST)
+    )
+    model = FlakyEmbedding(errors=[bad_request])
+    with pytest.raises(zhipuai.APIRequestFailedError):
+        _pipeline(model, RecordingStore()).run(_nodes(2))
+    assert len(model._calls) == 1
+
+    # 名字里带 Connection 但不是网络错误的异常不重试
+    class ConnectionConfigError(Exception):
+        pass
+
+    model = FlakyEmbedding(errors=[ConnectionConfigError()])
+    with pytest.raises(ConnectionConfigError):
+        _pipeline(model, RecordingStore()).run(_nodes(2))
+
+    model = FlakyEmbedding(errors=[zhipuai.APIConnectionError(request=_REQUEST)] * 3)
+    with pytest.raises(zhipuai.APIConnectionError):
+        _pipeline(model, RecordingStore(), max_retries=2).run(_nodes(2))
+    assert len(model._calls) == 3
+
+
+def test_rate_limit_pauses_every_worker(monkeypatch):
+    """A 429 honours Retry-After and holds back the other batches too."""
+    sleeps = []
+    monkeypatch.setattr("embedding_pipeline.time.sleep", sleeps.append)
+    monkeypatch.setattr("embedding_pipeline.random.random", lambda: 0.0)
+    rate_limited = zhipuai.APIReachLimitError(
+        "slow down",
+        response=httpx.Response(429, headers={"retry-after": "7"}, request=_REQUEST),
+    )
+    store = RecordingStore()
+    pipeline = _pipeline(
+        FlakyEmbedding(errors=[rate_limited], embed_batch_size=2),
+        store,
+        batch_size=2,
+        max_in_flight=1,
+    )
+    clock = iter(range(1000))
+    monkeypatch.setattr("embedding_pipeline.time.monotonic", lambda: next(clock))
+
+    stats = pipeline.run(_nodes(4))
+
+    assert stats["retries"] == 1 and stats["chunks"] == 4
+    # 第一次等待来自 Retry-After；之后每次请求前都会等待全局冷却期结束
+    assert sleeps[0] == 7.0
+    assert pipeline._cooldown_until > 0 and len(sleeps) > 1
+
+    # 其他可重试错误只让出错的批次退避，不设置冷却期
+    busy = zhipuai.APIInternalError(
+        "busy", response=httpx.Response(503, request=_REQUEST)
+    )
+    sleeps.clear()
+    pipeline = _pipeline(FlakyEmbedding(errors=[busy]), RecordingStore())
+    pipeline.run(_nodes(4))
+    assert pipeline._cooldown_until == 0 and len(sleeps) == 1
@@ -0,0 +1,62 @@
+"""Tests for the incremental indexing manifest."""
+
+from index_manifest import IndexManifest, chunk_ids, hash_text
+
+
+def test_chunk_ids_are_stable_across_edits():
+    """Unchanged chunks keep their IDs when other chunks change."""
+    before = chunk_ids("a.txt", [hash_text("one"), hash_text("two"), hash_text("one")])
+    after = chunk_ids("a.txt", [hash_text("one"), hash_text("new"), hash_text("one")])
+
+    assert len(set(before)) == 3  # 重复内容也得到不同的 ID
+    assert before[0] == after[0] and before[2] == after[2]
+    assert before[1] != after[1]
+    assert chunk_ids("b.txt", [hash_text("one")])[0] != before[0]
+
+
+def test_manifest_discarded_when_settings_change(tmp_path):
+    """A manifest built with another embedding model is marked stale."""
+    path = str(tmp_path / "documents.manifest.json")
+    manifest = IndexManifest(path, settings={"embedding_model": "embedding-2"})
+    manifest.set("a.txt", "filehash", {"id-1": "chunkhash"})
+    manifest.save()
+
+    reloaded = IndexManifest(path, settings={"embedding_model": "embedding-2"})
+    assert reloaded.all_chunk_ids() == ["id-1"]
+    assert not reloaded.stale
+
+    changed = IndexManifest(path, settings={"embedding_model": "embedding-3"})
+    assert changed.stale
+    assert changed.files == {}
+
+
+def test_pending_chunks_survive_reload(tmp_path):
+    """Uncommitted chunk IDs are persisted so a resumed run can clean them up."""
+    path = str(tmp_path / "documents.manifest.json")
+    manifest = IndexManifest(path, settings={})
+    manifest.pending = ["id-1", "id-2"]
+    manifest.save()
+
+    assert IndexManifest(path, settings={}).pending == ["id-1", "id-2"]
+
+
+def test_window_checkpoints_are_journaled_until_save(tmp_path):
+    """Windows append to the journal; a reload replays it and `save` folds it in."""
+    path = str(tmp_path / "documents.manifest.json")
+    manifest = IndexManifest(path, settings={})
+    manifest.begin_window(["id-1"])
+    manifest.commit_window({"a.txt": {"hash": "h", "chunks": {"id-1": "c"}}})
+    manifest.begin_window(["id-2"])
+    with open(manifest.journal_path, "a") as f:
+        f.write('{"files": {"b.txt"')  # 写到一半被中断
+
+    # 首次构建被中断时还没有 manifest 文件，只有日志
+    resumed = IndexManifest(path, settings={})
+    assert resumed.all_chunk_ids() == ["id-1"]
+    assert resumed.pending == ["id-2"]
+
+    resumed.pending = []
+    resumed.save()
+    assert not (tmp_path / "documents.manifest.json.journal").exists()
+    reloaded = IndexManifest(path, settings={})
+    assert reloaded.files == resumed.files and reloaded.pending == []
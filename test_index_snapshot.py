@@ -0,0 +1,167 @@
+"""Tests for index snapshot export and import."""
+
+import os
+import uuid
+
+import chromadb
+import numpy as np
+import pytest
+
+from index_manifest import IndexManifest
+from index_snapshot import (
+    IndexSnapshot,
+    InconsistentSnapshotError,
+    SnapshotError,
+    export_snapshot,
+    import_snapshot,
+    imported_snapshot_id,
+)
+from mmap_vector_store import MmapVectorStore, export_collection
+
+
+def _collection(client, rows=5, dim=8):
+    collection = client.create_collection(
+        f"snap-{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"}
+    )
+    rng = np.random.default_rng(0)
+    collection.add(
+        ids=[f"chunk-{i}" for i in range(rows)],
+        embeddings=rng.normal(size=(rows, dim)).astype(np.float32),
+        documents=[f"文档 {i} 的内容" for i in range(rows)],
+        metadatas=[{"file_name": f"{i}.md", "mtime": i} for i in range(rows)],
+    )
+    return collection
+
+
+def test_snapshot_round_trip(tmp_path):
+    client = chromadb.EphemeralClient()
+    source = _collection(client)
+    files = {"/data/a.md": {"hash": "h", "chunks": {"chunk-0": "c0"}}}
+    path = str(tmp_path / "docs.snapshot")
+    manifest = export_snapshot(
+        source, path, "embedding-2", settings={"chunk_size": 512}, files=files
+    )
+    assert manifest["count"] == 5 and manifest["dimension"] == 8
+
+    snapshot = IndexSnapshot(path)
+    snapshot.verify()
+    snapshot.check_embedding_model("embedding-2")
+    target_name = f"replica-{uuid.uuid4().hex[:8]}"
+    assert import_snapshot(client, snapshot, target_name, batch_size=2) == 5
+
+    target = client.get_collection(target_name)
+    assert imported_snapshot_id(target) == snapshot.snapshot_id
+    assert target.metadata["hnsw:space"] == "cosine"
+    include = ["embeddings", "documents", "metadatas"]
+    expected = source.get(ids=["chunk-3"], include=include)
+    actual = target.get(ids=["chunk-3"], include=include)
+    assert actual["documents"] == expected["documents"]
+    assert actual["metadatas"] == expected["metadatas"]
+    np.testing.assert_array_equal(actual["embeddings"], expected["embeddings"])
+
+    # 快照与 Chroma 集合接口相同，可以直接转换为 mmap 索引
+    mmap_path = str(tmp_path / "docs.mmap")
+    assert export_collection(snapshot, mmap_path) == 5
+    assert MmapVectorStore(mmap_path).count() == 5
+
+    manifest_path = str(tmp_path / "docs.manifest.json")
+    snapshot.restore_manifest(manifest_path)
+    restored = IndexManifest(manifest_path, settings={"chunk_size": 512})
+    assert not restored.stale and restored.all_chunk_ids() == ["chunk-0"]
+
+
+def test_snapshot_is_refused_or_not_written(tmp_path):
+    client = chromadb.EphemeralClient()
+    source = _collection(client)
+    path = str(tmp_path / "docs.snapshot")
+
+    # 集合与 indexer manifest 不一致时不写入快照
+    with pytest.raises(InconsistentSnapshotError):
+        export_snapshot(
+            source, path, "embedding-2", {}, {}, expected_ids=["chunk-0"]
+        )
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(SnapshotError):
+        IndexSnapshot(path)
+
+    export_snapshot(source, path, "embedding-2", {}, {})
+    snapshot = IndexSnapshot(path)
+    with pytest.raises(SnapshotError):
+        snapshot.check_embedding_model("embedding-3")
+    with open(os.path.join(path, "documents.bin"), "r+b") as f:
+        f.write(b"x")
+    with pytest.raises(SnapshotError):
+        snapshot.verify()
+
+
+@pytest.mark.parametrize("name_length", [13, 63])
+def test_import_replaces_an_existing_collection(tmp_path, monkeypatch, name_length):
+    """The old collection is deleted only after the new one took its name."""
+    client = chromadb.EphemeralClient()
+    path = str(tmp_path / "docs.snapshot")
+    export_snapshot(_collection(client), path, "embedding-2", {}, {})
+    snapshot = IndexSnapshot(path)
+
+    target_name = f"live-{uuid.uuid4().hex[:8]}".ljust(name_length, "x")
+    client.create_collection(target_name).add(
+        ids=["old"], embeddings=[[0.0] * 8], documents=["旧内容"]
+    )
+    live_at_delete = []
+    delete_collection = client.delete_collection
+
+    def record_live_ids(name):
+        try:
+            ids = client.get_collection(target_name).get()["ids"]
+        except Exception:
+            ids = None
+        live_at_delete.append((name, ids))
+        delete_collection(name)
+
+    monkeypatch.setattr(client, "delete_collection", record_live_ids)
+    created = []
+    create_collection = client.create_collection
+
+    def record_name(name, **kwargs):
+        created.append(name)
+        return create_collection(name, **kwargs)
+
+    monkeypatch.setattr(client, "create_collection", record_name)
+    import_snapshot(client, snapshot, target_name, batch_size=2)
+
+    # 删除旧集合时，原名下已经是快照的内容
+    chunk_ids = [f"chunk-{i}" for i in range(5)]
+    assert sorted(live_at_delete[-1][1]) == chunk_ids
+    assert all(ids is not None for _, ids in live_at_delete)
+    # chromadb 0.4/0.5 的集合名最长 63 个字符，暂存和改名让位的集合也不能超出
+    helper_names = created + [name for name, _ in live_at_delete]
+    assert all(len(name) <= 63 for name in helper_names)
+    target = client.get_collection(target_name)
+    assert imported_snapshot_id(target) == snapshot.snapshot_id
+    assert sorted(target.get()["ids"]) == chunk_ids
+    names = {c.name for c in client.list_collections()}
+    assert not any(n.endswith(("-import", "-replaced")) for n in names)
+
+
+def test_service_checks_the_snapshot_once_per_process(
+    tmp_path, monkeypatch, make_stub_service
+):
+    """Rebuilding an evicted engine does not import a newer snapshot mid-serving."""
+    import config
+    import query_service
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Snapshot import test document.")
+    service = make_stub_service(data_dir)
+    checked = []
+    monkeypatch.setattr(
+        query_service,
+        "snapshot_path",
+        lambda directory, name: checked.append(name) or str(tmp_path / "missing"),
+    )
+    monkeypatch.setattr(config, "INDEX_SNAPSHOT_DIR", str(tmp_path))
+
+    service._build_engine(config.COLLECTION_NAME)
+    service._build_engine(config.COLLECTION_NAME)
+
+    assert checked == [config.COLLECTION_NAME]
@@ -0,0 +1,66 @@
+"""Tests for incremental indexing with `DocumentIndexer`."""
+
+import os
+
+import pytest
+
+
+def _chunks(indexer, where=None):
+    return indexer.chroma_collection.get(where=where, include=["metadatas"])
+
+
+def test_edited_file_updates_metadata_of_unchanged_chunks(tmp_path, make_indexer):
+    """Chunks kept from an edited file match filters on its new mtime."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = data_dir / "guide.txt"
+    paragraphs = [f"Section {i}. " + f"Topic {i} sentence. " * 60 for i in range(4)]
+    path.write_text("\n\n".join(paragraphs))
+    os.utime(path, (1_000_000, 1_000_000))
+
+    indexer = make_indexer(data_dir)
+    indexer.build_index()
+    before = set(_chunks(indexer)["ids"])
+    assert len(before) > 2
+
+    # 只改最后一段：前面的块 ID 不变，不会重新 embedding
+    paragraphs[-1] = "Section 3 was rewritten. " * 60
+    path.write_text("\n\n".join(paragraphs))
+    os.utime(path, (2_000_000, 2_000_000))
+    indexer.build_index()
+
+    after = _chunks(indexer)
+    assert before & set(after["ids"]) and before != set(after["ids"])
+    assert {m["mtime"] for m in after["metadatas"]} == {2_000_000}
+    recent = _chunks(indexer, where={"mtime": {"$gte": 2_000_000}})
+    assert set(recent["ids"]) == set(after["ids"])
+
+
+def test_interrupted_window_is_cleaned_up_on_the_next_run(tmp_path, make_indexer):
+    """Chunks written by a window that never committed leave Chroma and BM25."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    path = data_dir / "notes.txt"
+    path.write_text("Alpha release checklist. " * 20)
+
+    indexer = make_indexer(data_dir)
+    add = indexer.lexical_index.add
+
+    def add_then_interrupt(documents):
+        add(documents)
+        raise KeyboardInterrupt  # 向量和 BM25 已写入，manifest 还没提交
+
+    indexer.lexical_index.add = add_then_interrupt
+    with pytest.raises(KeyboardInterrupt):
+        indexer.build_index()
+    orphans = _chunks(indexer)["ids"]
+    assert orphans and indexer.lexical_index.search("alpha", 10)
+
+    path.write_text("Beta rollout plan. " * 20)
+    indexer = make_indexer(data_dir)
+    indexer.build_index()
+
+    ids = set(_chunks(indexer)["ids"])
+    assert ids and not ids & set(orphans)
+    assert indexer.lexical_index.search("alpha", 10) == []
+    assert {hit[0] for hit in indexer.lexical_index.search("beta", 10)} == ids
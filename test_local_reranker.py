@@ -0,0 +1,89 @@
+"""Tests for the in-process cross-encoder reranker (with a fake model)."""
+
+import asyncio
+import sys
+import types
+
+import pytest
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from rerank_cache import RerankScoreCache
+from reranker import LocalReranker, TEIReranker, length_buckets
+
+
+class FakeCrossEncoder:
+    """Scores a pair by the passage length; records every forward pass."""
+
+    batches = []
+
+    def __init__(self, model_name, max_length, device):
+        self.model_name = model_name
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        FakeCrossEncoder.batches.append([text for _, text in pairs])
+        return [float(len(text)) for _, text in pairs]
+
+
+@pytest.fixture
+def fake_cross_encoder(monkeypatch):
+    """Make `sentence_transformers.CrossEncoder` the fake (no model download)."""
+    module = types.ModuleType("sentence_transformers")
+    module.CrossEncoder = FakeCrossEncoder
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    FakeCrossEncoder.batches = []
+    return FakeCrossEncoder
+
+
+def _nodes(*texts):
+    return [
+        NodeWithScore(node=TextNode(id_=f"n{i}", text=text), score=0.5)
+        for i, text in enumerate(texts)
+    ]
+
+
+def test_length_buckets_group_similar_lengths():
+    """Local rerank batches hold passages of similar length."""
+    lengths = [5, 500, 20, 480, 10, 300]
+    batches = length_buckets(lengths, batch_size=2)
+
+    assert batches == [[1, 3], [5, 2], [4, 0]]
+    assert sorted(i for batch in batches for i in batch) == list(range(6))
+
+
+def test_orders_by_score_and_reuses_cached_scores(fake_cross_encoder):
+    """Nodes come back by cross-encoder score; cached pairs are not rescored."""
+    reranker = LocalReranker(
+        top_n=2, batch_size=2, max_workers=1, score_cache=RerankScoreCache()
+    )
+    query = QueryBundle("什么是 RAG？")
+
+    result = reranker.postprocess_nodes(_nodes("aa", "aaaaa", "a", "aaaa"), query)
+
+    assert [n.node.text for n in result] == ["aaaaa", "aaaa"]
+    assert [n.score for n in result] == [5.0, 4.0]
+    assert all(len(batch) <= 2 for batch in fake_cross_encoder.batches)
+    assert sum(len(b) for b in fake_cross_encoder.batches) == 4
+
+    fake_cross_encoder.batches.clear()
+    result = asyncio.run(
+        reranker.apostprocess_nodes(_nodes("aa", "aaaaa", "aaaaaaa"), query)
+    )
+    assert fake_cross_encoder.batches == [["aaaaaaa"]]
+    assert [n.node.text for n in result] == ["aaaaaaa", "aaaaa"]
+    assert reranker.score_cache.stats()["hits"] == 2
+
+
+def test_unreachable_tei_falls_back_to_local_rerank(fake_cross_encoder):
+    """While TEI is down, the local cross-encoder still reranks."""
+    local = LocalReranker(top_n=3, max_workers=1)
+    reranker = TEIReranker(api_url="http://127.0.0.1:9", top_n=1, fallback=local)
+    query = QueryBundle("query")
+
+    try:
+        result = reranker.postprocess_nodes(_nodes("b", "bbb", "bb"), query)
+        assert [n.node.text for n in result] == ["bbb", "bb", "b"]
+        result = asyncio.run(reranker.apostprocess_nodes(_nodes("bb", "b"), query))
+        assert [n.node.text for n in result] == ["bb", "b"]
+    finally:
+        reranker.breaker.stop()
+    assert len(fake_cross_encoder.batches) == 2
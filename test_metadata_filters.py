@@ -0,0 +1,84 @@
+"""Tests for metadata filter expressions and filtered hybrid retrieval."""
+
+import uuid
+
+import chromadb
+import pytest
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import TextNode
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from llama_index.vector_stores.chroma.base import _to_chroma_filter
+
+from bm25_index import BM25Index
+from hybrid_retriever import HybridRetriever
+from metadata_filters import InvalidFilterError, parse_filters
+
+
+def test_expressions_become_chroma_where_clauses():
+    assert _to_chroma_filter(parse_filters({"doc_type": "pdf"})) == {
+        "doc_type": {"$eq": "pdf"}
+    }
+    where = _to_chroma_filter(
+        parse_filters(
+            {
+                "$or": [{"doc_type": "md"}, {"mtime": {"$gte": 1700000000}}],
+                "file_name": {"$in": ["a.md", "b.pdf"]},
+            }
+        )
+    )
+    assert where == {
+        "$and": [
+            {"$or": [{"doc_type": {"$eq": "md"}}, {"mtime": {"$gte": 1700000000}}]},
+            {"file_name": {"$in": ["a.md", "b.pdf"]}},
+        ]
+    }
+
+    for bad in (
+        {},
+        {"owner": "x"},
+        {"mtime": {"$regex": 1}},
+        {"$or": []},
+        # Chroma 只能比较数字
+        {"creation_date": {"$gte": "2024-01-01"}},
+        {"mtime": {"$lt": True}},
+    ):
+        with pytest.raises(InvalidFilterError):
+            parse_filters(bad)
+
+
+def test_filters_apply_to_dense_and_bm25_candidates(
+    tmp_path, bag_of_words_embedding
+):
+    """BM25-only candidates outside the filter are dropped, not fused."""
+    texts = {
+        "md-1": ("md", "The deploy guide explains rolling restarts."),
+        "md-2": ("md", "Restarts drain connections before stopping."),
+        "pdf-1": ("pdf", "ERR_CONN-42 restarts the deploy worker."),
+    }
+    nodes = [
+        TextNode(id_=node_id, text=text, metadata={"doc_type": doc_type})
+        for node_id, (doc_type, text) in texts.items()
+    ]
+    collection = chromadb.EphemeralClient().create_collection(
+        f"filters-{uuid.uuid4().hex[:8]}", metadata={"hnsw:space": "cosine"}
+    )
+    vector_store = ChromaVectorStore(chroma_collection=collection)
+    index = VectorStoreIndex.from_vector_store(
+        vector_store, embed_model=bag_of_words_embedding
+    )
+    index.insert_nodes(nodes)
+    lexical_index = BM25Index(str(tmp_path / "filters.bm25.sqlite"))
+    lexical_index.add((node.node_id, node.text) for node in nodes)
+
+    filters = parse_filters({"doc_type": "md"})
+    retriever = HybridRetriever(
+        # 向量检索只取 1 个，其余候选来自 BM25
+        index.as_retriever(similarity_top_k=1, filters=filters),
+        lexical_index,
+        vector_store,
+        top_k=5,
+        filters=filters,
+    )
+
+    results = retriever.retrieve("ERR_CONN-42 deploy restarts")
+    assert {n.node.node_id for n in results} == {"md-1", "md-2"}
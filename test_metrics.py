@@ -0,0 +1,120 @@
+"""Tests for query traces and the Prometheus text rendering."""
+
+import json
+import os
+
+import pytest
+
+import api
+import config
+from metrics import (
+    CACHE_LOOKUPS,
+    QUERY_SECONDS,
+    STAGE_SECONDS,
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    QueryTrace,
+    record_cache,
+    record_tokens,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Bucket counts are cumulative and end with +Inf, _sum and _count."""
+    histogram = Histogram(
+        "test_seconds", "Test latency.", labelnames=("stage",), buckets=(0.1, 1)
+    )
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, stage="embed")
+
+    lines = histogram.render().splitlines()
+    assert lines[:2] == [
+        "# HELP test_seconds Test latency.",
+        "# TYPE test_seconds histogram",
+    ]
+    assert lines[2:] == [
+        'test_seconds_bucket{stage="embed",le="0.1"} 1',
+        'test_seconds_bucket{stage="embed",le="1"} 3',
+        'test_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'test_seconds_sum{stage="embed"} 4.25',
+        'test_seconds_count{stage="embed"} 4',
+    ]
+
+
+def test_trace_collects_usage_while_recording_and_observes_outcome():
+    """Tokens and cache hits land on the active trace; errors are counted."""
+    errors = QUERY_SECONDS.count(outcome="error")
+    rerank_stages = STAGE_SECONDS.count(stage="rerank")
+    rerank_hits = CACHE_LOOKUPS.value(cache="rerank", result="hit")
+
+    trace = QueryTrace()
+    with pytest.raises(RuntimeError):
+        with trace.record():
+            with trace.span("rerank"):
+                record_cache("rerank", hits=2, misses=1)
+            record_tokens(prompt=100, completion=20)
+            raise RuntimeError("TEI 不可用")
+    # 结束记录后不再计入该 trace
+    record_tokens(prompt=5)
+
+    debug = trace.to_dict()
+    assert set(debug["timings_ms"]) == {"rerank"}
+    assert debug["tokens"] == {"prompt": 100, "completion": 20}
+    assert debug["cache"] == {"rerank": {"hits": 2, "misses": 1}}
+    assert QUERY_SECONDS.count(outcome="error") == errors + 1
+    assert STAGE_SECONDS.count(stage="rerank") == rerank_stages + 1
+    assert CACHE_LOOKUPS.value(cache="rerank", result="hit") == rerank_hits + 2
+
+
+def test_render_sums_the_snapshots_of_other_workers(tmp_path):
+    """/metrics of one worker covers the requests every worker served."""
+
+    def registry():
+        registry = MetricsRegistry()
+        counter = registry.register(
+            Counter("test_total", "Test counter.", labelnames=("kind",))
+        )
+        histogram = registry.register(
+            Histogram("test_seconds", "Test latency.", buckets=(0.1, 1))
+        )
+        return registry, counter, histogram
+
+    other, counter, histogram = registry()
+    counter.inc(2, kind="a")
+    histogram.observe(0.05)
+    (tmp_path / "1.json").write_text(json.dumps(other.snapshot()))
+    (tmp_path / "2.json").write_text("{")  # 写了一半的文件被跳过
+
+    this, counter, histogram = registry()
+    counter.inc(1, kind="a")
+    counter.inc(1, kind="b")
+    histogram.observe(0.5)
+    this.write_snapshot(str(tmp_path))  # 自己的快照不会重复计数
+
+    lines = this.render(str(tmp_path)).splitlines()
+    assert 'test_total{kind="a"} 3' in lines
+    assert 'test_total{kind="b"} 1' in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert "test_seconds_count 2" in lines
+    assert this.render().splitlines().count('test_total{kind="a"} 1') == 1
+
+
+def test_serve_keeps_snapshots_of_earlier_runs_out(tmp_path, monkeypatch):
+    """Each run collects its workers' snapshots in a fresh directory."""
+    (tmp_path / "4242.json").write_text("{}")  # 上一次运行留下的快照
+    seen = []
+
+    def run(*args, **kwargs):
+        seen.append((config.METRICS_DIR, os.listdir(config.METRICS_DIR)))
+
+    monkeypatch.setattr("uvicorn.run", run)
+    monkeypatch.setattr(config, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+
+    api.serve(workers=1)
+
+    ((run_dir, snapshots),) = seen
+    assert os.path.dirname(run_dir) == str(tmp_path) and snapshots == []
+    assert os.listdir(tmp_path) == ["4242.json"]
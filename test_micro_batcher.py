@@ -0,0 +1,45 @@
+"""Tests for coalescing concurrent calls with MicroBatcher."""
+
+import asyncio
+
+from micro_batcher import MicroBatcher
+
+
+def test_concurrent_submits_share_batches_and_get_their_own_results():
+    """Concurrent items are sent together and routed back to their callers."""
+    calls = []
+
+    async def process(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait=0.01)
+        single = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        many = await batcher.submit_many([7, 8])
+        return single, many, batcher.stats()
+
+    single, many, stats = asyncio.run(main())
+
+    assert single == [0, 10, 20, 30, 40, 50]
+    assert many == [70, 80]
+    # 满 4 个立即发送，剩余的在等待窗口结束时发送
+    assert calls == [[0, 1, 2, 3], [4, 5], [7, 8]]
+    assert stats["batches"] == 3 and stats["items"] == 8
+
+
+def test_batch_failure_reaches_every_caller():
+    """An upstream error is raised in every caller of that batch."""
+
+    async def process(items):
+        raise RuntimeError("upstream down")
+
+    async def main():
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.001)
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,79 @@
+"""Tests for the memory-mapped, quantized vector store."""
+
+import sqlite3
+
+import chromadb
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from mmap_vector_store import MmapVectorStore, export_collection, export_is_current
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+@pytest.mark.parametrize("space", ["cosine", "l2"])
+def test_export_answers_like_chroma(tmp_path, space, quantization):
+    """Same neighbours and scores as the Chroma collection it was exported from."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    nodes = [TextNode(id_=f"node-{i}", text=f"块 {i}") for i in range(300)]
+    collection = chromadb.EphemeralClient().create_collection(
+        f"mmap-{space}-{quantization}", metadata={"hnsw:space": space}
+    )
+    collection.add(
+        ids=[node.node_id for node in nodes],
+        embeddings=vectors,
+        documents=[node.text for node in nodes],
+        # ChromaVectorStore 写入的元数据格式
+        metadatas=[
+            {"_node_content": node.to_json(), "_node_type": "TextNode"}
+            for node in nodes
+        ],
+    )
+    path = str(tmp_path / "documents.mmap")
+    assert export_collection(collection, path, quantization, index_version="v1") == 300
+    assert export_is_current(path, "v1", quantization)
+    assert not export_is_current(path, "v2", quantization)
+
+    store = MmapVectorStore(path, rescore_factor=4)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    expected = collection.query(query_embeddings=queries, n_results=5)
+    for query, ids, distances in zip(queries, expected["ids"], expected["distances"]):
+        result = store.query(
+            VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5)
+        )
+        assert result.ids == ids
+        assert -np.log(result.similarities) == pytest.approx(distances, rel=1e-4)
+        assert result.nodes[0].get_content() == f"块 {ids[0].split('-')[1]}"
+
+    batch = store.query_batch(queries.tolist(), top_k=5)
+    assert [[hit.node.node_id for hit in hits] for hits in batch] == expected["ids"]
+    assert [node.node_id for node in store.get_nodes(["node-7", "node-3"])] == [
+        "node-7",
+        "node-3",
+    ]
+    store.close()
+
+
+def test_replaced_export_is_closed_after_queries_in_flight(tmp_path):
+    """A reload closes the old export's files once its last query finishes."""
+    collection = chromadb.EphemeralClient().create_collection("mmap-reload")
+    collection.add(ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]])
+    path = str(tmp_path / "documents.mmap")
+    export_collection(collection, path, index_version="v1")
+    store = MmapVectorStore(path)
+
+    with store._using() as old:
+        collection.add(ids=["c"], embeddings=[[1.0, 1.0]])
+        export_collection(collection, path, index_version="v2")
+        assert store.count() == 3  # 重新打开新导出
+        # 进行中的查询仍可读取旧索引
+        assert sorted(old.nodes("row", [0, 1])) == [0, 1]
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        old.nodes("row", [0])
+    assert old._vectors.closed
+
+    store.close()
+    assert store._index._vectors.closed
@@ -0,0 +1,72 @@
+"""Tests for batch queries (`QueryService.query_many` and `/query/batch`)."""
+
+import asyncio
+import json
+
+import httpx
+
+import api
+from query_service import DEFAULT_RESPONSE_MODE
+
+
+def test_batch_results_stream_in_completion_order(
+    tmp_path, monkeypatch, make_stub_service
+):
+    """Lines carry their question's index; failures and cache hits are lines too."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for topic in ("deploy", "backup", "restore", "monitor", "scale"):
+        (data_dir / f"{topic}.txt").write_text(f"How to {topic} the service safely.")
+    service = make_stub_service(
+        data_dir, USE_SEMANTIC_CACHE=True, QUERY_BATCH_WAVE_SIZE=3
+    )
+    questions = [f"How do I {t} the service?" for t in ("deploy", "backup", "scale")]
+    questions += ["How do I restore the service? boom", "How do I monitor it?"]
+
+    # 第一个问题合成最慢，记录同时进行的 LLM 调用数
+    synthesizer = service._synthesizer(DEFAULT_RESPONSE_MODE, streaming=False)
+    asynthesize = synthesizer.asynthesize
+    in_flight = peak = 0
+
+    async def slow_asynthesize(query, nodes, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.3 if query.query_str == questions[0] else 0.05)
+            if "boom" in query.query_str:
+                raise RuntimeError("LLM failed")
+            return await asynthesize(query, nodes, **kwargs)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(synthesizer, "asynthesize", slow_asynthesize)
+    monkeypatch.setattr(api, "query_service", service)
+
+    async def main():
+        first = [r async for r in service.query_many(questions, concurrency=2)]
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            response = await c.post(
+                "/query/batch", json={"questions": questions[:2], "concurrency": 2}
+            )
+        await service.aclose()
+        return first, response
+
+    first, response = asyncio.run(main())
+
+    assert sorted(r["index"] for r in first) == list(range(len(questions)))
+    assert first[-1]["index"] == 0
+    assert all(r["question"] == questions[r["index"]] for r in first)
+    errors = [r for r in first if "error" in r]
+    assert [r["index"] for r in errors] == [3] and "LLM failed" in errors[0]["error"]
+    assert peak == 2
+
+    # 第二次请求的两个问题都命中语义缓存，按行返回
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1]
+    assert all(line["answer"] and line["sources"] for line in lines)
+    (semantic,) = service.cache_stats()["semantic"].values()
+    assert semantic["hits"] == 2
@@ -0,0 +1,54 @@
+"""Tests for per-request query options."""
+
+import pytest
+
+import config
+from metadata_filters import InvalidFilterError
+from query_options import InvalidQueryOptionError, QueryOptions
+
+
+def test_only_configured_settings_count_as_default():
+    assert QueryOptions().is_default
+    assert QueryOptions(response_mode="compact").is_default
+    for options in (
+        {"top_k": 3},
+        {"filters": {"doc_type": "md"}},
+        {"rerank": False},
+        {"top_n": 5},
+        {"response_mode": "tree_summarize"},
+        {"token_budget": 256},
+    ):
+        assert not QueryOptions(**options).is_default
+
+    options = QueryOptions(top_k=4, filters={"doc_type": "md"})
+    assert options.metadata_filters.filters[0].key == "doc_type"
+
+
+def test_rejects_out_of_range_and_unknown_options():
+    for options in (
+        {"top_k": 0},
+        {"top_k": config.MAX_QUERY_TOP_K + 1},
+        {"top_n": True},
+        {"token_budget": -1},
+        {"response_mode": "generation"},
+    ):
+        with pytest.raises(InvalidQueryOptionError):
+            QueryOptions(**options)
+    with pytest.raises(InvalidFilterError):
+        QueryOptions(filters={"owner": "me"})
+    with pytest.raises(TypeError):
+        QueryOptions(similarity_top_k=3)
+
+
+def test_top_n_applies_without_rerank(tmp_path, make_stub_service):
+    """rerank=false still honours top_n; without top_n every candidate is kept."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(6):
+        (data_dir / f"deploy{i}.txt").write_text(f"Deploy guide part {i}.")
+    service = make_stub_service(data_dir)
+    question = "deploy guide"
+
+    assert len(service.retrieve(question, rerank=False, top_n=2)) == 2
+    assert len(service.retrieve(question, rerank=False)) == 6
+    assert len(service.retrieve(question)) == config.RERANK_TOP_N
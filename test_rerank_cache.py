@@ -0,0 +1,38 @@
+"""Tests for the rerank score cache."""
+
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from rerank_cache import RerankScoreCache
+from reranker import TEIReranker
+
+
+def test_only_uncached_texts_are_sent(monkeypatch):
+    """Cached scores are merged with fresh ones; edited chunks are rescored."""
+    sent = []
+
+    def fake_post_rerank(self, payload):
+        sent.append(payload["texts"])
+        scores = [float(len(text)) for text in payload["texts"]]
+        return [{"index": i, "score": score} for i, score in enumerate(scores)]
+
+    monkeypatch.setattr(TEIReranker, "_verify_api", lambda self: None)
+    monkeypatch.setattr(TEIReranker, "_post_rerank", fake_post_rerank)
+    reranker = TEIReranker(top_n=2, score_cache=RerankScoreCache())
+
+    def nodes(*texts):
+        return [
+            NodeWithScore(node=TextNode(id_=f"n{i}", text=t), score=0.5)
+            for i, t in enumerate(texts)
+        ]
+
+    reranker.postprocess_nodes(nodes("a", "bb"), QueryBundle("什么是 RAG？"))
+    result = reranker.postprocess_nodes(
+        nodes("a", "bb", "cccc"), QueryBundle(" 什么是  RAG？")
+    )
+    assert sent == [["a", "bb"], ["cccc"]]
+    assert [n.node.text for n in result] == ["cccc", "bb"]
+
+    # 同一个 node id 的内容变化后不能复用旧分数
+    reranker.postprocess_nodes(nodes("A", "bb"), QueryBundle("什么是 RAG？"))
+    assert sent[-1] == ["A"]
+    assert reranker.score_cache.stats()["hits"] == 3
@@ -0,0 +1,59 @@
+"""Tests for the semantic answer cache."""
+
+from semantic_cache import SemanticCache
+
+
+def _result(answer):
+    return {"question": "q", "answer": answer, "sources": [{"text": "source"}]}
+
+
+def test_threshold_ttl_and_clear():
+    """Only similar enough, unexpired entries are returned."""
+    cache = SemanticCache(threshold=0.9)
+    cache.store([1.0, 0.0], _result("a"))
+    assert cache.lookup([10.0, 1.0])["answer"] == "a"  # cos ≈ 0.995
+    assert cache.lookup([1.0, 1.0]) is None  # cos ≈ 0.707
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    cache.clear()
+    assert cache.lookup([1.0, 0.0]) is None and cache.stats()["entries"] == 0
+
+    expired = SemanticCache(ttl=-1)
+    expired.store([1.0, 0.0], _result("a"))
+    assert expired.lookup([1.0, 0.0]) is None
+
+
+def test_grows_on_demand_and_evicts_least_recently_used():
+    """Storage grows with the entries; a full cache reuses the LRU slot."""
+    cache = SemanticCache(threshold=0.99, max_size=100)
+    vectors = [[1.0 if i == j else 0.0 for j in range(100)] for i in range(100)]
+    cache.store(vectors[0], _result("0"))
+    assert len(cache._matrix) == SemanticCache._INITIAL_CAPACITY
+
+    for i in range(1, 100):
+        cache.store(vectors[i], _result(str(i)))
+    assert len(cache._matrix) == 100 and cache.stats()["entries"] == 100
+
+    cache.lookup(vectors[0])  # 0 最近被使用，淘汰的是 1
+    cache.store([1.0] * 100, _result("new"))
+    assert cache.lookup(vectors[1]) is None
+    assert cache.lookup(vectors[0])["answer"] == "0"
+    assert cache.lookup([1.0] * 100)["answer"] == "new"
+    assert len(cache._matrix) == 100
+
+
+def test_cached_sources_survive_a_hit_without_sources(tmp_path, make_stub_service):
+    """Blanking the sources of one hit does not change the cached entry."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "deploy.txt").write_text("Rolling restarts drain connections first.")
+    service = make_stub_service(data_dir, USE_SEMANTIC_CACHE=True)
+    question = "How do rolling restarts work?"
+
+    service.query(question)
+    hit = service.query(question, return_sources=False)
+    assert hit["sources"] == []
+    again = service.query(question)
+    assert again["sources"] and again["answer"] == hit["answer"]
+    (semantic,) = service.cache_stats()["semantic"].values()
+    assert semantic["hits"] == 2